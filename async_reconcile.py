@@ -0,0 +1,180 @@
+import asyncio
+import random
+import time
+from email.utils import parsedate_to_datetime
+from typing import Dict, List, Optional
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from persistent_cache import MISSING, PersistentCache
+from wikidata_reconcile import (WIKIDATA_API, Section, WikidataMatch, clean_query,
+                                make_match, match_to_result)
+
+USER_AGENT = "telota-pe-reconcile/1.0 (https://github.com/chpollin/telota-pe)"
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+class TokenBucket:
+    """Async token bucket: ``rate`` tokens per second, at most ``capacity`` banked.
+
+    ``pause()`` empties the bucket until a given time, so a single 429 with
+    Retry-After holds back every request, not just the one that got it.
+    """
+
+    def __init__(self, rate: float, capacity: float = 1.0):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self.paused_until = 0.0
+        self._lock = asyncio.Lock()
+
+    async def acquire(self):
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                if now < self.paused_until:
+                    await asyncio.sleep(self.paused_until - now)
+                    continue
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+    def pause(self, seconds: float):
+        self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+        self.tokens = 0.0
+
+def retry_after(response: requests.Response) -> Optional[float]:
+    """Seconds to wait according to a Retry-After header (delta or HTTP date)"""
+    value = response.headers.get("Retry-After")
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+class AsyncWikidataReconciler:
+    """Concurrent counterpart of WikidataReconciliation.
+
+    At most ``concurrency`` requests are in flight and requests start at no
+    more than ``rate`` per second (bursts of ``burst``). 429 and 5xx answers
+    and connection errors are retried with exponential backoff and jitter;
+    a Retry-After header, when present, takes precedence and pauses the
+    whole bucket. Identical queries that are in flight at the same time
+    share one request. The HTTP calls themselves run on worker threads over
+    a pooled requests session, so no extra dependency is needed.
+    """
+
+    def __init__(self, language: str = "en", cache: Optional[PersistentCache] = None,
+                 concurrency: int = 4, rate: float = 5.0, burst: int = 1, max_retries: int = 5,
+                 backoff: float = 1.0, limit: int = 5, timeout: float = 30.0,
+                 endpoint: str = WIKIDATA_API):
+        self.endpoint = endpoint
+        self.language = language
+        self.cache = cache
+        self.concurrency = concurrency
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.limit = limit
+        self.timeout = timeout
+        self.bucket = TokenBucket(rate, burst)
+        self.session = requests.Session()
+        self.session.headers["User-Agent"] = USER_AGENT
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=concurrency)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        self._semaphore = None
+        self._in_flight: Dict[str, asyncio.Future] = {}
+
+    def cache_key(self, search: str) -> str:
+        return f"{search}\0{self.language}\0{self.limit}"
+
+    async def _get(self, params: Dict) -> Optional[Dict]:
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.concurrency)
+        for attempt in range(self.max_retries + 1):
+            await self.bucket.acquire()
+            delay = self.backoff * 2 ** attempt * (0.5 + random.random())
+            try:
+                async with self._semaphore:
+                    response = await asyncio.to_thread(
+                        self.session.get, self.endpoint, params=params, timeout=self.timeout)
+                if response.status_code in RETRY_STATUSES:
+                    server_delay = retry_after(response)
+                    if server_delay is not None:
+                        delay = server_delay
+                        self.bucket.pause(delay)
+                    error = f"HTTP {response.status_code}"
+                else:
+                    response.raise_for_status()
+                    return response.json()
+            except requests.exceptions.RequestException as e:
+                if e.response is not None and e.response.status_code not in RETRY_STATUSES:
+                    print(f"Error searching for '{params['search']}': {e}")
+                    return None
+                error = str(e)
+            if attempt < self.max_retries:
+                await asyncio.sleep(delay)
+        print(f"Error searching for '{params['search']}': giving up after {error}")
+        return None
+
+    async def _search(self, search: str):
+        params = {
+            "action": "wbsearchentities",
+            "format": "json",
+            "language": self.language,
+            "search": search,
+            "limit": self.limit
+        }
+        data = await self._get(params)
+        if data is None:
+            return MISSING
+        best_match = data["search"][0] if data.get("search") else None
+        if self.cache is not None:
+            self.cache.set(self.cache_key(search), best_match)
+        return best_match
+
+    async def search_entity(self, query: str, entity_type: str = None) -> Optional[WikidataMatch]:
+        """Search for an entity in Wikidata"""
+        search = clean_query(query)
+        best_match = self.cache.get(self.cache_key(search)) if self.cache is not None else MISSING
+        if best_match is MISSING:
+            future = self._in_flight.get(search)
+            if future is None:
+                future = asyncio.ensure_future(self._search(search))
+                self._in_flight[search] = future
+                future.add_done_callback(lambda _: self._in_flight.pop(search, None))
+            best_match = await asyncio.shield(future)
+            if best_match is MISSING:
+                return None
+        return make_match(query, best_match, entity_type)
+
+    async def _reconcile_items(self, items: List[str], entity_type: str) -> List[Dict]:
+        matches = await asyncio.gather(*(self.search_entity(item, entity_type) for item in items))
+        return [match_to_result(item, match) for item, match in zip(items, matches)]
+
+    async def reconcile_sections(self, sections: List[Section]) -> Dict:
+        """Async process_sections: same result structure, items reconciled concurrently"""
+        async def reconcile_section(section: Section) -> Dict:
+            main_items, *subsection_items = await asyncio.gather(
+                self._reconcile_items(section.items, section.name),
+                *(self._reconcile_items(sub.items, sub.name) for sub in section.subsections)
+            )
+            print(f"Processed section: {section.name}")
+            return {
+                "main_items": main_items,
+                "subsections": {
+                    sub.name: items for sub, items in zip(section.subsections, subsection_items)
+                }
+            }
+
+        section_results = await asyncio.gather(*(reconcile_section(s) for s in sections))
+        return {section.name: result for section, result in zip(sections, section_results)}
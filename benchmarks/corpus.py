@@ -0,0 +1,299 @@
+"""Seeded generators for synthetic benchmark inputs.
+
+``generate_tei`` streams a TEI document of roughly the requested size to
+disk, shaped like data/o1-generated-tei.xml: a standOff register of persons
+and places followed by a body of nested ``div``s whose paragraphs carry
+``placeName``, ``persName``, ``name``, ``date``, ``note``, ``app`` and
+``pb`` elements at tunable densities. ``generate_entity_markdown`` writes an
+entity list in the layout of prompting-blocks/extracted-entities.md.
+
+The same parameters and seed always produce byte-identical output.
+"""
+import argparse
+import random
+from dataclasses import asdict, dataclass
+from typing import Dict, IO, List
+
+WORDS = (
+    'the river banks forest mountain rain season plains savannah current water journey '
+    'expedition mission village canoe rapids source delta latitude longitude observed '
+    'distance miles north south east west along upon which where large small high '
+    'several many being found towards between natives travellers map survey camp'
+).split()
+PLACE_STEMS = ['Orin', 'Essequ', 'Bran', 'Vich', 'Atab', 'Esmer', 'Parim', 'Rupun',
+               'Demer', 'Cuyun', 'Mazar', 'Tacut', 'Pirar', 'Roraim', 'Cassiqu']
+PLACE_ENDINGS = ['oco', 'ebo', 'co', 'ada', 'apo', 'alda', 'e', 'uni', 'ary', 'i', 'uma']
+GIVEN_NAMES = ['Robert', 'Alexander', 'Aimé', 'Charles', 'Louis', 'Jean', 'Henry', 'John',
+               'José', 'Nicolas', 'Otto', 'Richard']
+FAMILY_NAMES = ['Schomburgk', 'Humboldt', 'Bonpland', 'Condamine', 'Hortsmann', 'Aublet',
+                'Bolingbroke', 'Tanner', 'Carg', 'Cruz', 'Barate', 'Anville']
+FLORA = ['Mauritia flexuosa', 'Victoria regia', 'Bertholletia excelsa', 'Theobroma cacao',
+         'Hevea brasiliensis', 'Cinchona officinalis']
+FAUNA = ['jaguar', 'tapir', 'capybara', 'manatee', 'cayman', 'anaconda', 'macaw', 'sloth']
+MONTHS = ['January', 'February', 'March', 'April', 'May', 'June', 'July', 'August',
+          'September', 'October', 'November', 'December']
+SECTION_NAMES = ['People', 'Rivers', 'Places', 'Mountains', 'Tribes', 'Flora', 'Fauna',
+                 'Institutions', 'Publications']
+
+# Bytes per kilobyte/megabyte in size arguments such as "10MB"
+UNITS = {'B': 1, 'KB': 1024, 'MB': 1024 ** 2, 'GB': 1024 ** 3}
+
+def parse_size(size: str) -> int:
+    """Byte count for "500MB", "1KB", "2048" ..."""
+    text = size.strip().upper()
+    for unit in sorted(UNITS, key=len, reverse=True):
+        if text.endswith(unit):
+            return int(float(text[:-len(unit)]) * UNITS[unit])
+    return int(text)
+
+@dataclass
+class TEIParams:
+    """Shape of a synthetic TEI document; densities are per paragraph."""
+    size: int = 1024 ** 2
+    seed: int = 1
+    depth: int = 3
+    words_per_paragraph: int = 80
+    place_density: float = 2.0
+    person_density: float = 1.0
+    name_density: float = 0.5
+    date_density: float = 1.0
+    note_density: float = 0.3
+    app_density: float = 0.2
+    highlight_density: float = 0.5
+    paragraphs_per_page: int = 6
+    register_size: int = 0
+
+@dataclass
+class CorpusStats:
+    """What a generator wrote, for entities-per-second figures."""
+    bytes: int = 0
+    paragraphs: int = 0
+    pages: int = 0
+    places: int = 0
+    persons: int = 0
+    names: int = 0
+    dates: int = 0
+    notes: int = 0
+    apps: int = 0
+    items: int = 0
+
+    @property
+    def entities(self) -> int:
+        return self.places + self.persons + self.names + self.dates + self.items
+
+    def as_dict(self) -> Dict[str, int]:
+        return dict(asdict(self), entities=self.entities)
+
+class _CountingWriter:
+    def __init__(self, f: IO[str]):
+        self.f = f
+        self.bytes = 0
+
+    def write(self, text: str):
+        self.f.write(text)
+        self.bytes += len(text.encode('utf-8')) if not text.isascii() else len(text)
+
+def _count(rng: random.Random, density: float) -> int:
+    """Poisson-like draw with the given mean, cheap enough for 500 MB documents."""
+    whole = int(density)
+    return whole + (rng.random() < density - whole)
+
+def _place_name(rng: random.Random) -> str:
+    return rng.choice(PLACE_STEMS) + rng.choice(PLACE_ENDINGS)
+
+def _date(rng: random.Random) -> str:
+    year = rng.randint(1750, 1870)
+    month = rng.randint(1, 12)
+    day = rng.randint(1, 28)
+    kind = rng.random()
+    if kind < 0.5:
+        return f'<date when="{year}-{month:02d}-{day:02d}">{day} {MONTHS[month - 1]} {year}</date>'
+    if kind < 0.7:
+        return f'<date notBefore="{year}" notAfter="{year + rng.randint(1, 5)}">about {year}</date>'
+    if kind < 0.9:
+        return f'<date when="{year}-{month:02d}">{MONTHS[month - 1]} {year}</date>'
+    return f'<date>the {day}th of {MONTHS[month - 1]}, {year}</date>'
+
+class TEIGenerator:
+    def __init__(self, params: TEIParams):
+        self.params = params
+        self.rng = random.Random(params.seed)
+        self.stats = CorpusStats()
+        # Scale the register with the document so refs stay realistic.
+        register_size = params.register_size or max(2, min(5000, params.size // 20000))
+        self.person_ids = [f'pers.{i}' for i in range(register_size)]
+        self.place_ids = [f'place.{i}' for i in range(register_size)]
+        self.place_names = [_place_name(self.rng) for _ in range(register_size)]
+
+    def header(self) -> str:
+        rng = self.rng
+        parts = ['<?xml version="1.0" encoding="UTF-8"?>\n<TEI xmlns="http://www.tei-c.org/ns/1.0">\n'
+                 '<teiHeader><fileDesc><titleStmt><title>Synthetic benchmark corpus '
+                 f'(seed {self.params.seed})</title></titleStmt></fileDesc></teiHeader>\n'
+                 '<standOff>\n<listPerson>\n']
+        for person_id in self.person_ids:
+            birth = rng.randint(1700, 1820)
+            parts.append(
+                f'<person xml:id="{person_id}"><persName>{rng.choice(GIVEN_NAMES)} '
+                f'{rng.choice(FAMILY_NAMES)}</persName><birth when="{birth}"/>'
+                f'<death when="{birth + rng.randint(30, 80)}"/><occupation>Explorer</occupation>'
+                '</person>\n')
+        parts.append('</listPerson>\n<listPlace>\n')
+        for place_id, name in zip(self.place_ids, self.place_names):
+            parts.append(
+                f'<place xml:id="{place_id}"><placeName>{name}</placeName><location><geo>'
+                f'{rng.uniform(-5, 10):.4f} {rng.uniform(-70, -55):.4f}</geo></location></place>\n')
+        parts.append('</listPlace>\n</standOff>\n<text><body>\n')
+        return ''.join(parts)
+
+    def paragraph(self) -> str:
+        params, rng, stats = self.params, self.rng, self.stats
+        inserts = []
+        for _ in range(_count(rng, params.place_density)):
+            i = rng.randrange(len(self.place_ids))
+            inserts.append(f'<placeName ref="#{self.place_ids[i]}">{self.place_names[i]}</placeName>')
+            stats.places += 1
+        for _ in range(_count(rng, params.person_density)):
+            inserts.append(f'<persName ref="#{rng.choice(self.person_ids)}">'
+                           f'{rng.choice(FAMILY_NAMES)}</persName>')
+            stats.persons += 1
+        for _ in range(_count(rng, params.name_density)):
+            if rng.random() < 0.5:
+                inserts.append(f'<name type="flora">{rng.choice(FLORA)}</name>')
+            else:
+                inserts.append(f'<name type="fauna">{rng.choice(FAUNA)}</name>')
+            stats.names += 1
+        for _ in range(_count(rng, params.date_density)):
+            inserts.append(_date(rng))
+            stats.dates += 1
+        for _ in range(_count(rng, params.note_density)):
+            kind = 'footnote' if rng.random() < 0.7 else 'editorial'
+            inserts.append(f'<note type="{kind}">{" ".join(rng.choices(WORDS, k=12))}</note>')
+            stats.notes += 1
+        for _ in range(_count(rng, params.app_density)):
+            word = rng.choice(WORDS)
+            inserts.append(f'<app><lem>{word}</lem><rdg type="orthographic" resp="#ed">'
+                           f'{word}e</rdg></app>')
+            stats.apps += 1
+        for _ in range(_count(rng, params.highlight_density)):
+            inserts.append(f'<hi rend="{rng.choice(("italic", "underline", "superscript"))}">'
+                           f'{rng.choice(WORDS)}</hi>')
+
+        words = rng.choices(WORDS, k=params.words_per_paragraph)
+        slots = sorted(rng.randrange(len(words) + 1) for _ in inserts)
+        rng.shuffle(inserts)
+        parts = ['<p>']
+        previous = 0
+        for slot, insert in zip(slots, inserts):
+            parts.append(' '.join(words[previous:slot]))
+            parts.append(f' {insert} ')
+            previous = slot
+        parts.append(' '.join(words[previous:]))
+        parts.append('</p>\n')
+        stats.paragraphs += 1
+        return ''.join(parts)
+
+    def write(self, f: IO[str]) -> CorpusStats:
+        params, rng = self.params, self.rng
+        out = _CountingWriter(f)
+        out.write(self.header())
+        footer = '</body></text>\n</TEI>\n'
+        open_divs = 0
+        section = 0
+        paragraphs_on_page = params.paragraphs_per_page
+        while out.bytes + len(footer) + 6 * open_divs < params.size or not self.stats.paragraphs:
+            # Walk up and down the div tree so every depth up to the limit occurs.
+            if open_divs < max(1, params.depth) and (open_divs == 0 or rng.random() < 0.3):
+                section += 1
+                out.write(f'<div type="section" n="{section}"><head>Section {section}</head>\n')
+                open_divs += 1
+            elif open_divs > 1 and rng.random() < 0.2:
+                out.write('</div>\n')
+                open_divs -= 1
+            if paragraphs_on_page >= params.paragraphs_per_page:
+                self.stats.pages += 1
+                out.write(f'<pb n="{self.stats.pages}" facs="page{self.stats.pages}.jpg"/>\n')
+                paragraphs_on_page = 0
+            out.write(self.paragraph())
+            paragraphs_on_page += 1
+        out.write('</div>\n' * open_divs)
+        out.write(footer)
+        self.stats.bytes = out.bytes
+        return self.stats
+
+def generate_tei(path: str, params: TEIParams = None) -> CorpusStats:
+    """Write a synthetic TEI document to ``path`` and return what it contains."""
+    with open(path, 'w', encoding='utf-8') as f:
+        return TEIGenerator(params or TEIParams()).write(f)
+
+def generate_entity_markdown(path: str, sections: int = 6, subsections: int = 2,
+                             items: int = 40, duplicate_ratio: float = 0.1,
+                             seed: int = 1) -> CorpusStats:
+    """Write an entity list for ``parse_markdown_file``.
+
+    ``items`` is the number of list items per section and per subsection;
+    ``duplicate_ratio`` of them repeat an earlier item, as real lists do
+    across sections, which exercises the reconcilers' de-duplication.
+    """
+    rng = random.Random(seed)
+    stats = CorpusStats()
+    seen: List[str] = []
+    lines = ['# Named Entities in a Synthetic Document', '']
+
+    def item_lines() -> List[str]:
+        result = []
+        for _ in range(items):
+            if seen and rng.random() < duplicate_ratio:
+                item = rng.choice(seen)
+            else:
+                item = f'{_place_name(rng)} {rng.choice(FAMILY_NAMES)} {len(seen)}'
+                if rng.random() < 0.5:
+                    item += f' ({rng.choice(WORDS).capitalize()})'
+                seen.append(item)
+            result.append(f'* {item}')
+        stats.items += len(result)
+        return result
+
+    for s in range(sections):
+        lines.append(f'## {SECTION_NAMES[s % len(SECTION_NAMES)]} {s + 1}')
+        lines.extend(item_lines())
+        lines.append('')
+        for sub in range(subsections):
+            lines.append(f'### Group {s + 1}.{sub + 1}')
+            lines.extend(item_lines())
+            lines.append('')
+    content = '\n'.join(lines)
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write(content)
+    stats.bytes = len(content.encode('utf-8'))
+    return stats
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate synthetic benchmark inputs")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    tei_parser = subparsers.add_parser('tei', help='Synthetic TEI document')
+    tei_parser.add_argument('output')
+    tei_parser.add_argument('--size', default='1MB', help='Target size, e.g. 1KB, 10MB, 500MB')
+    for name, default in vars(TEIParams()).items():
+        if name != 'size':
+            tei_parser.add_argument(f'--{name.replace("_", "-")}', type=type(default),
+                                    default=default)
+    md_parser = subparsers.add_parser('markdown', help='Entity list markdown')
+    md_parser.add_argument('output')
+    md_parser.add_argument('--sections', type=int, default=6)
+    md_parser.add_argument('--subsections', type=int, default=2)
+    md_parser.add_argument('--items', type=int, default=40)
+    md_parser.add_argument('--duplicate-ratio', type=float, default=0.1)
+    md_parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+
+    if args.command == 'tei':
+        options = {name: getattr(args, name) for name in vars(TEIParams()) if name != 'size'}
+        stats = generate_tei(args.output, TEIParams(size=parse_size(args.size), **options))
+    else:
+        stats = generate_entity_markdown(args.output, args.sections, args.subsections, args.items,
+                                         args.duplicate_ratio, args.seed)
+    print(f"Wrote {args.output}: {stats.as_dict()}")
+
+if __name__ == "__main__":
+    main()
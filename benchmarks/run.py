@@ -0,0 +1,283 @@
+"""Benchmarks for the converter, the vis pipeline and the reconcilers.
+
+Each case runs in a fresh interpreter so its peak RSS is its own. Inputs are
+generated once per size and seed (see corpus.py) and kept in
+``benchmarks/.corpus``; network-bound cases talk to the local stub server.
+
+    python benchmarks/run.py                          # default sizes
+    python benchmarks/run.py --sizes 1KB,10MB,500MB --cases tei.convert_stream
+    python benchmarks/run.py --save-baseline          # record benchmarks/baseline.json
+    python benchmarks/run.py --compare                # exit 1 on regressions
+
+A result is a regression when its wall time or peak RSS exceeds the
+baseline by more than ``--tolerance``.
+"""
+import argparse
+import asyncio
+import contextlib
+import importlib
+import importlib.util
+import json
+import os
+import subprocess
+import sys
+import time
+from functools import lru_cache
+from pathlib import Path
+from typing import Callable, Dict, List, NamedTuple, Optional
+
+BENCHMARK_DIR = Path(__file__).resolve().parent
+REPO_DIR = BENCHMARK_DIR.parent
+CORPUS_DIR = BENCHMARK_DIR / '.corpus'
+BASELINE_PATH = BENCHMARK_DIR / 'baseline.json'
+sys.path[:0] = [str(REPO_DIR), str(REPO_DIR / 'vis')]
+
+from corpus import (TEIParams, generate_entity_markdown, generate_tei,  # noqa: E402
+                    parse_size)
+from stub_server import StubServer  # noqa: E402
+
+DEFAULT_SIZES = ['1KB', '100KB', '10MB']
+# Entity lists for the reconciliation cases: generate_entity_markdown() options
+ENTITY_LISTS = {
+    'small': {'sections': 3, 'subsections': 1, 'items': 20},
+    'large': {'sections': 9, 'subsections': 3, 'items': 100},
+}
+# convert() holds the whole document and its HTML in memory; skip it beyond this.
+MAX_IN_MEMORY_SIZE = 100 * 1024 ** 2
+
+# --- Cases: each takes (input path, stub server URLs) and returns an entity
+# count when the generator's count does not apply, else None.
+
+def _convert(path: str, urls: Dict[str, str]) -> Optional[int]:
+    from tei_to_html import TEItoHTMLConverter
+    with open(path, 'rb') as f:
+        TEItoHTMLConverter().convert(f.read(), [])
+    return None
+
+def _convert_stream(path: str, urls: Dict[str, str]) -> Optional[int]:
+    from tei_to_html import TEItoHTMLConverter
+    with open(os.devnull, 'w', encoding='utf-8') as sink:
+        TEItoHTMLConverter().convert_stream(path, sink, [])
+    return None
+
+@lru_cache(maxsize=None)
+def _load_vis():
+    # o1-vis.py is a script, not an importable module name.
+    spec = importlib.util.spec_from_file_location('o1_vis', REPO_DIR / 'vis' / 'o1-vis.py')
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+def _vis_parse(path: str, urls: Dict[str, str]) -> Optional[int]:
+    vis = _load_vis()
+    df = vis.parse_dates(vis.parse_tei_xml(path))
+    return int(df['place_name'].notna().sum() + df['date_text'].notna().sum())
+
+def _sections(path: str):
+    from wikidata_reconcile import parse_markdown_file
+    return parse_markdown_file(path)
+
+def _reconcile_sequential(path: str, urls: Dict[str, str]) -> Optional[int]:
+    from wikidata_reconcile import WikidataReconciliation, process_sections
+    process_sections(_sections(path),
+                     WikidataReconciliation(endpoint=urls['wikidata'], request_delay=0))
+    return None
+
+def _reconcile_async(path: str, urls: Dict[str, str]) -> Optional[int]:
+    from async_reconcile import AsyncWikidataReconciler
+    reconciler = AsyncWikidataReconciler(endpoint=urls['wikidata'], concurrency=8, rate=1000.0)
+    asyncio.run(reconciler.reconcile_sections(_sections(path)))
+    return None
+
+def _geocode(path: str, urls: Dict[str, str]) -> Optional[int]:
+    from geocoding import Geocoder, NominatimBackend
+    names = []
+    for section in _sections(path):
+        names.extend(section.items)
+        for subsection in section.subsections:
+            names.extend(subsection.items)
+    Geocoder(NominatimBackend(endpoint=urls['nominatim'], min_interval=0)).geocode_many(names)
+    return None
+
+def _importer(*modules: str) -> Callable[[], None]:
+    return lambda: [importlib.import_module(module) for module in modules]
+
+class Case(NamedTuple):
+    run: Callable[[str, Dict[str, str]], Optional[int]]
+    input: str  # 'tei' or 'markdown'
+    # Untimed; imports the code under test so the first run is not penalised.
+    setup: Callable[[], None]
+    max_size: Optional[int] = None
+
+CASES: Dict[str, Case] = {
+    'tei.convert': Case(_convert, 'tei', _importer('tei_to_html'), MAX_IN_MEMORY_SIZE),
+    'tei.convert_stream': Case(_convert_stream, 'tei', _importer('tei_to_html')),
+    'vis.parse': Case(_vis_parse, 'tei', _load_vis, MAX_IN_MEMORY_SIZE),
+    'reconcile.sequential': Case(_reconcile_sequential, 'markdown',
+                                 _importer('wikidata_reconcile')),
+    'reconcile.async': Case(_reconcile_async, 'markdown', _importer('async_reconcile')),
+    'vis.geocode': Case(_geocode, 'markdown', _importer('geocoding', 'wikidata_reconcile')),
+}
+
+# --- Inputs
+
+def tei_input(size: str, seed: int) -> Dict:
+    """Path and stats of the synthetic TEI document for a size, generated on first use."""
+    path = CORPUS_DIR / f'tei-{size}-seed{seed}.xml'
+    stats_path = path.with_suffix('.json')
+    if not (path.exists() and stats_path.exists()):
+        CORPUS_DIR.mkdir(parents=True, exist_ok=True)
+        print(f"Generating {path.name} ...", file=sys.stderr)
+        stats = generate_tei(str(path), TEIParams(size=parse_size(size), seed=seed))
+        stats_path.write_text(json.dumps(stats.as_dict()), encoding='utf-8')
+    return {'path': str(path), 'stats': json.loads(stats_path.read_text(encoding='utf-8'))}
+
+def markdown_input(name: str, seed: int) -> Dict:
+    """Entity list for a named preset; cheap enough to regenerate every run."""
+    CORPUS_DIR.mkdir(parents=True, exist_ok=True)
+    path = CORPUS_DIR / f'entities-{name}-seed{seed}.md'
+    stats = generate_entity_markdown(str(path), seed=seed, **ENTITY_LISTS[name])
+    return {'path': str(path), 'stats': stats.as_dict()}
+
+# --- Measurement
+
+def peak_rss_mb() -> Optional[float]:
+    try:
+        import resource
+    except ImportError:  # Windows
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in bytes on macOS and in kilobytes elsewhere.
+    return peak / 1024 ** 2 if sys.platform == 'darwin' else peak / 1024
+
+def run_worker(spec: Dict) -> Dict:
+    """Body of the child process: time ``repeat`` runs of one case."""
+    case = CASES[spec['case']]
+    case.setup()
+    rss_before = peak_rss_mb()
+    timings = []
+    entities = None
+    with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+        for _ in range(spec['repeat']):
+            start = time.perf_counter()
+            entities = case.run(spec['path'], spec['urls'])
+            timings.append(time.perf_counter() - start)
+    return {'timings': timings, 'entities': entities,
+            'rss_before_mb': rss_before, 'peak_rss_mb': peak_rss_mb()}
+
+def measure(case_name: str, input_name: str, data: Dict, urls: Dict[str, str],
+            repeat: int) -> Dict:
+    spec = {'case': case_name, 'path': data['path'], 'urls': urls, 'repeat': repeat}
+    process = subprocess.run([sys.executable, __file__, '--worker', json.dumps(spec)],
+                             capture_output=True, text=True, cwd=REPO_DIR)
+    if process.returncode != 0:
+        error = process.stderr.strip().splitlines()
+        return {'error': error[-1] if error else f'exit status {process.returncode}'}
+    measured = json.loads(process.stdout.strip().splitlines()[-1])
+    seconds = min(measured['timings'])
+    entities = measured['entities'] if measured['entities'] is not None else data['stats']['entities']
+    size = data['stats']['bytes']
+    return {
+        'input': input_name,
+        'bytes': size,
+        'entities': entities,
+        'seconds': seconds,
+        'timings': measured['timings'],
+        'mb_per_s': size / 1024 ** 2 / seconds if seconds else None,
+        'entities_per_s': entities / seconds if seconds else None,
+        'rss_before_mb': measured['rss_before_mb'],
+        'peak_rss_mb': measured['peak_rss_mb'],
+    }
+
+def run_suite(case_names: List[str], sizes: List[str], lists: List[str], seed: int,
+              repeat: int, latency: float) -> Dict[str, Dict]:
+    results = {}
+    with StubServer(latency=latency) as server:
+        urls = {'wikidata': server.wikidata_url, 'nominatim': server.nominatim_url}
+        for case_name in case_names:
+            case = CASES[case_name]
+            inputs = sizes if case.input == 'tei' else lists
+            for input_name in inputs:
+                key = f'{case_name}@{input_name}'
+                if case.input == 'tei':
+                    if case.max_size and parse_size(input_name) > case.max_size:
+                        continue
+                    data = tei_input(input_name, seed)
+                else:
+                    data = markdown_input(input_name, seed)
+                results[key] = measure(case_name, input_name, data, urls, repeat)
+                print(format_result(key, results[key]), flush=True)
+    return results
+
+# --- Reporting
+
+def format_result(key: str, result: Dict) -> str:
+    if 'error' in result:
+        return f"{key:<36} skipped: {result['error']}"
+    rss = f"{result['peak_rss_mb']:8.1f} MB" if result['peak_rss_mb'] is not None else '       n/a'
+    return (f"{key:<36} {result['seconds']:9.3f} s {result['mb_per_s']:9.2f} MB/s "
+            f"{result['entities_per_s']:12.0f} entities/s {rss}")
+
+def compare(results: Dict[str, Dict], baseline: Dict[str, Dict], tolerance: float) -> List[str]:
+    """Human-readable regressions of ``results`` against ``baseline``."""
+    regressions = []
+    for key, result in results.items():
+        base = baseline.get(key)
+        if 'error' in result or not base or 'error' in base:
+            continue
+        for metric, unit in (('seconds', 's'), ('peak_rss_mb', 'MB')):
+            if result.get(metric) is None or not base.get(metric):
+                continue
+            change = result[metric] / base[metric] - 1
+            if change > tolerance:
+                regressions.append(f"{key}: {metric} {base[metric]:.3f} -> "
+                                   f"{result[metric]:.3f} {unit} ({change:+.0%})")
+    return regressions
+
+def main(argv: List[str] = None):
+    parser = argparse.ArgumentParser(description="Run the performance benchmarks")
+    parser.add_argument('--cases', default=','.join(CASES),
+                        help=f'Comma-separated cases (default: all of {", ".join(CASES)})')
+    parser.add_argument('--sizes', default=','.join(DEFAULT_SIZES),
+                        help='TEI input sizes, 1KB up to 500MB')
+    parser.add_argument('--lists', default=','.join(ENTITY_LISTS),
+                        help='Entity lists for the reconciliation cases')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--repeat', type=int, default=3, help='Runs per case; the fastest counts')
+    parser.add_argument('--latency', type=float, default=0.0,
+                        help='Seconds the stub server waits before answering')
+    parser.add_argument('-o', '--output', help='Write results as JSON')
+    parser.add_argument('--save-baseline', nargs='?', const=str(BASELINE_PATH), metavar='PATH')
+    parser.add_argument('--compare', nargs='?', const=str(BASELINE_PATH), metavar='PATH')
+    parser.add_argument('--tolerance', type=float, default=0.15,
+                        help='Allowed slowdown or memory growth before failing')
+    parser.add_argument('--worker', help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.worker:
+        print(json.dumps(run_worker(json.loads(args.worker))))
+        return
+
+    case_names = [name for name in args.cases.split(',') if name]
+    unknown = [name for name in case_names if name not in CASES]
+    if unknown:
+        parser.error(f"unknown case(s): {', '.join(unknown)}")
+    results = run_suite(case_names, args.sizes.split(','), args.lists.split(','), args.seed,
+                        args.repeat, args.latency)
+
+    if args.output:
+        Path(args.output).write_text(json.dumps(results, indent=2), encoding='utf-8')
+    if args.save_baseline:
+        Path(args.save_baseline).write_text(json.dumps(results, indent=2), encoding='utf-8')
+        print(f"Baseline saved to {args.save_baseline}")
+    if args.compare:
+        baseline = json.loads(Path(args.compare).read_text(encoding='utf-8'))
+        regressions = compare(results, baseline, args.tolerance)
+        for line in regressions:
+            print(f"REGRESSION {line}")
+        if regressions:
+            sys.exit(1)
+        print(f"No regressions beyond {args.tolerance:.0%} against {args.compare}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,166 @@
+"""Local stand-in for the Wikidata API and Nominatim, for benchmarks and tests.
+
+Answers are derived from a hash of the query, so they are deterministic and
+need no data files: ``wbsearchentities`` returns a hit for most searches,
+``wbgetentities`` returns labels and a few claims, and Nominatim's
+``/search`` returns coordinates inside Guiana. ``miss_ratio`` controls how
+many queries find nothing and ``latency`` adds a fixed delay per request,
+to model the network without hitting the real services.
+
+    with StubServer(latency=0.005) as server:
+        WikidataReconciliation(endpoint=server.wikidata_url, request_delay=0)
+        NominatimBackend(endpoint=server.nominatim_url, min_interval=0)
+"""
+import argparse
+import hashlib
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List
+from urllib.parse import parse_qs, urlsplit
+
+WIKIDATA_PATH = '/w/api.php'
+NOMINATIM_PATH = '/search'
+
+def _fraction(text: str) -> float:
+    """Stable number in [0, 1) for a query string."""
+    return int.from_bytes(hashlib.blake2b(text.encode('utf-8'), digest_size=8).digest(), 'big') / 2 ** 64
+
+def _qid(text: str) -> str:
+    return f'Q{int(_fraction(text) * 10 ** 8) + 1}'
+
+class StubHandler(BaseHTTPRequestHandler):
+    server: 'StubServer'
+    protocol_version = 'HTTP/1.1'
+    # Headers and body are separate writes; without this every keep-alive
+    # response waits out the client's delayed ACK.
+    disable_nagle_algorithm = True
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send_json(self, data, status: int = 200):
+        body = json.dumps(data).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        url = urlsplit(self.path)
+        params = {key: values[-1] for key, values in parse_qs(url.query).items()}
+        self.server.count(url.path)
+        if self.server.latency:
+            time.sleep(self.server.latency)
+        if url.path == WIKIDATA_PATH and params.get('action') == 'wbsearchentities':
+            self._send_json(self.server.search_entities(params.get('search', ''),
+                                                        int(params.get('limit', 5))))
+        elif url.path == WIKIDATA_PATH and params.get('action') == 'wbgetentities':
+            self._send_json(self.server.get_entities(params.get('ids', '').split('|')))
+        elif url.path == NOMINATIM_PATH:
+            self._send_json(self.server.geocode(params.get('q', '')))
+        else:
+            self._send_json({'error': f'unsupported request {self.path}'}, status=400)
+
+class StubServer(ThreadingHTTPServer):
+    """Threaded stub listening on localhost; ``port=0`` picks a free port."""
+
+    daemon_threads = True
+
+    def __init__(self, port: int = 0, latency: float = 0.0, miss_ratio: float = 0.1):
+        super().__init__(('127.0.0.1', port), StubHandler)
+        self.latency = latency
+        self.miss_ratio = miss_ratio
+        self.requests: Dict[str, int] = {}
+        self._lock = threading.Lock()
+        self._thread = None
+
+    @property
+    def base_url(self) -> str:
+        return f'http://127.0.0.1:{self.server_address[1]}'
+
+    @property
+    def wikidata_url(self) -> str:
+        return self.base_url + WIKIDATA_PATH
+
+    @property
+    def nominatim_url(self) -> str:
+        return self.base_url + NOMINATIM_PATH
+
+    def count(self, path: str):
+        with self._lock:
+            self.requests[path] = self.requests.get(path, 0) + 1
+
+    def search_entities(self, search: str, limit: int) -> Dict:
+        if not search or _fraction('miss\0' + search) < self.miss_ratio:
+            return {'search': [], 'success': 1}
+        hits = [{
+            'id': _qid(f'{search}\0{rank}'),
+            'label': search,
+            'description': f'synthetic entity {rank + 1} for {search}',
+            'score': round(1.0 - rank * 0.1, 2),
+        } for rank in range(min(limit, 3))]
+        return {'search': hits, 'success': 1}
+
+    def get_entities(self, ids: List[str]) -> Dict:
+        entities = {}
+        for qid in filter(None, ids):
+            entities[qid] = {
+                'id': qid,
+                'labels': {'en': {'language': 'en', 'value': f'Label of {qid}'}},
+                'descriptions': {'en': {'language': 'en', 'value': f'Description of {qid}'}},
+                'claims': {
+                    'P106': [{'mainsnak': {'datavalue': {
+                        'type': 'wikibase-entityid', 'value': {'id': _qid('occupation\0' + qid)}}}}],
+                    'P569': [{'mainsnak': {'datavalue': {
+                        'type': 'time', 'value': {'time': '+1804-06-05T00:00:00Z'}}}}],
+                },
+            }
+        return {'entities': entities, 'success': 1}
+
+    def geocode(self, query: str) -> List[Dict]:
+        if not query or _fraction('miss\0' + query) < self.miss_ratio:
+            return []
+        lat = -5 + 15 * _fraction('lat\0' + query)
+        lon = -70 + 15 * _fraction('lon\0' + query)
+        return [{
+            'lat': f'{lat:.6f}',
+            'lon': f'{lon:.6f}',
+            'display_name': query,
+        }]
+
+    def start(self) -> 'StubServer':
+        self._thread = threading.Thread(target=self.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+    def __enter__(self) -> 'StubServer':
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve stub Wikidata and Nominatim endpoints")
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--latency', type=float, default=0.0, help='Seconds added per request')
+    parser.add_argument('--miss-ratio', type=float, default=0.1)
+    args = parser.parse_args()
+
+    server = StubServer(args.port, args.latency, args.miss_ratio)
+    print(f"Wikidata API at {server.wikidata_url}, Nominatim at {server.nominatim_url}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,150 @@
+"""Opt-in per-element profiling for TEItoHTMLConverter.
+
+Attach a profiler with ``converter.enable_profiling()``. Both conversion
+paths then report every body element: ``process_element`` is wrapped on
+the converter instance, and the streaming targets hook into their start
+and end events. An unprofiled converter runs the plain methods, with no
+extra work per element.
+
+Per element label (the tag, refined by the attribute its rules are keyed
+by, e.g. ``note[@type=footnote]``) the profiler records:
+
+* visits;
+* cumulative time, counted once for elements nested in themselves;
+* self time;
+* output bytes and self output bytes;
+* the deepest nesting level it was seen at.
+
+``write_json`` exports a summary. ``write_folded`` writes self time per
+element stack in the "folded" format read by flamegraph.pl and speedscope.
+
+In the streaming paths an element's time also covers the parsing of its
+content, since the parser drives conversion.
+"""
+import json
+import time
+from dataclasses import asdict, dataclass
+from typing import Dict, List, Optional, Tuple
+
+PROFILE_VERSION = 1
+
+@dataclass
+class ElementStats:
+    count: int = 0
+    cumulative_seconds: float = 0.0
+    self_seconds: float = 0.0
+    output_bytes: int = 0
+    self_output_bytes: int = 0
+    max_depth: int = 0
+
+def output_size(html: str) -> int:
+    return len(html) if html.isascii() else len(html.encode('utf-8'))
+
+class ConversionProfiler:
+    """Collects element statistics over one or more conversions."""
+
+    def __init__(self):
+        self.elements: Dict[str, ElementStats] = {}
+        # Element label path -> self time, for flame graphs
+        self.stacks: Dict[Tuple[str, ...], float] = {}
+        self.max_depth = 0
+        self.documents = 0
+        self.total_seconds = 0.0
+        # Bytes written so far by a streaming conversion (see count_output)
+        self.bytes_written = 0
+        # Per open element: [label, path, start time, bytes written at start,
+        # children's time, children's bytes]
+        self._stack: List[list] = []
+        self._active: Dict[str, int] = {}
+
+    def enter(self, label: str, start: float = None, bytes_at_start: int = None):
+        """Open an element; ``start`` and ``bytes_at_start`` default to now."""
+        path = (self._stack[-1][1] if self._stack else ()) + (label,)
+        self._stack.append([label, path, time.perf_counter() if start is None else start,
+                            self.bytes_written if bytes_at_start is None else bytes_at_start,
+                            0.0, 0])
+        self._active[label] = self._active.get(label, 0) + 1
+        if len(path) > self.max_depth:
+            self.max_depth = len(path)
+
+    def exit(self, output_bytes: Optional[int] = None):
+        """Close the innermost element; ``output_bytes`` defaults to what was written since enter()."""
+        label, path, start, bytes_at_start, child_seconds, child_bytes = self._stack.pop()
+        elapsed = time.perf_counter() - start
+        if output_bytes is None:
+            output_bytes = self.bytes_written - bytes_at_start
+        stats = self.elements.get(label)
+        if stats is None:
+            stats = self.elements[label] = ElementStats()
+        stats.count += 1
+        self._active[label] -= 1
+        if not self._active[label]:
+            stats.cumulative_seconds += elapsed
+        self_seconds = elapsed - child_seconds
+        stats.self_seconds += self_seconds
+        stats.output_bytes += output_bytes
+        stats.self_output_bytes += output_bytes - child_bytes
+        if len(path) > stats.max_depth:
+            stats.max_depth = len(path)
+        self.stacks[path] = self.stacks.get(path, 0.0) + self_seconds
+        if self._stack:
+            parent = self._stack[-1]
+            parent[4] += elapsed
+            parent[5] += output_bytes
+
+    def count_output(self, html: str):
+        self.bytes_written += output_size(html)
+
+    def document_done(self, seconds: float):
+        self.documents += 1
+        self.total_seconds += seconds
+
+    def merge(self, other: 'ConversionProfiler'):
+        """Add another profiler's totals, e.g. from a worker process."""
+        for label, theirs in other.elements.items():
+            ours = self.elements.setdefault(label, ElementStats())
+            ours.count += theirs.count
+            ours.cumulative_seconds += theirs.cumulative_seconds
+            ours.self_seconds += theirs.self_seconds
+            ours.output_bytes += theirs.output_bytes
+            ours.self_output_bytes += theirs.self_output_bytes
+            ours.max_depth = max(ours.max_depth, theirs.max_depth)
+        for path, seconds in other.stacks.items():
+            self.stacks[path] = self.stacks.get(path, 0.0) + seconds
+        self.max_depth = max(self.max_depth, other.max_depth)
+        self.documents += other.documents
+        self.total_seconds += other.total_seconds
+
+    def to_dict(self) -> Dict:
+        elements = sorted(self.elements.items(), key=lambda item: item[1].self_seconds,
+                          reverse=True)
+        return {
+            'version': PROFILE_VERSION,
+            'documents': self.documents,
+            'total_seconds': self.total_seconds,
+            'max_depth': self.max_depth,
+            'elements': {label: asdict(stats) for label, stats in elements},
+        }
+
+    def write_json(self, path: str):
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(self.to_dict(), f, indent=2)
+
+    def folded(self) -> List[str]:
+        """``a;b;c <microseconds>`` lines, one per element stack"""
+        return [f'{";".join(path)} {round(seconds * 1e6)}'
+                for path, seconds in sorted(self.stacks.items()) if seconds > 0]
+
+    def write_folded(self, path: str):
+        with open(path, 'w', encoding='utf-8') as f:
+            f.writelines(line + '\n' for line in self.folded())
+
+    def summary(self, top: int = 10) -> str:
+        """The ``top`` elements by self time, as a text table"""
+        lines = [f"{'element':<32} {'count':>9} {'self s':>9} {'cum s':>9} {'self bytes':>12}"]
+        for label, stats in list(self.to_dict()['elements'].items())[:top]:
+            lines.append(f"{label:<32} {stats['count']:>9} {stats['self_seconds']:>9.3f} "
+                         f"{stats['cumulative_seconds']:>9.3f} {stats['self_output_bytes']:>12}")
+        lines.append(f"max depth {self.max_depth}, {self.documents} document(s), "
+                     f"{self.total_seconds:.3f} s")
+        return '\n'.join(lines)
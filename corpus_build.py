@@ -0,0 +1,367 @@
+import glob
+import hashlib
+import json
+import os
+import shutil
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple, Union
+
+import entity_bundles
+import entity_index
+import facsimile_tiles
+import search_index
+import static_assets
+import tei_to_html
+from conversion_profiler import ConversionProfiler
+from entity_bundles import (document_manifest, entity_manifest_path, load_registers,
+                            write_bundles, write_document_manifest)
+from entity_index import ENTITY_INDEX_NAME, DocumentOccurrences, EntityIndex, OccurrenceCollector
+from facsimile_tiles import Facsimile, tile_images
+from search_index import remove_index, search_index_path
+from static_assets import ASSET_DIR, build_bundles, relocate
+
+MANIFEST_NAME = '.build-manifest.json'
+BUNDLE_DIR = 'entities'
+FACSIMILE_DIR = 'facsimiles'
+# Documents listed individually in a corpus profile, slowest first
+PROFILE_DOCUMENTS = 100
+IMAGE_EXTENSIONS = ('.png', '.jpg', '.jpeg', '.gif', '.tif', '.tiff', '.webp')
+
+@dataclass
+class BuildReport:
+    rendered: List[str] = field(default_factory=list)
+    skipped: List[str] = field(default_factory=list)
+    copied: List[str] = field(default_factory=list)
+    removed: List[str] = field(default_factory=list)
+    tiled: List[str] = field(default_factory=list)
+
+    def summary(self) -> str:
+        return (f"{len(self.rendered)} rendered, {len(self.skipped)} unchanged, "
+                f"{len(self.copied)} assets copied, {len(self.removed)} removed"
+                + (f", {len(self.tiled)} facsimiles tiled" if self.tiled else ""))
+
+def converter_fingerprint() -> str:
+    """Hash of the converter version and sources, so rule edits force a rebuild."""
+    digest = hashlib.sha256(tei_to_html.CONVERTER_VERSION.encode())
+    for module in (tei_to_html, search_index, entity_bundles, entity_index, static_assets,
+                   facsimile_tiles):
+        with open(module.__file__, 'rb') as f:
+            digest.update(f.read())
+    for script in viewer_scripts():
+        with open(script, 'rb') as f:
+            digest.update(f.read())
+    return digest.hexdigest()
+
+def viewer_scripts() -> List[str]:
+    """Paths of the scripts every page loads"""
+    module_dir = os.path.dirname(os.path.abspath(tei_to_html.__file__))
+    return [os.path.join(module_dir, name) for name in tei_to_html.VIEWER_SCRIPTS]
+
+def collect_sources(inputs: Iterable[str]) -> List[Path]:
+    """Expand directories (recursively) and glob patterns into TEI files."""
+    sources = set()
+    for pattern in inputs:
+        if os.path.isdir(pattern):
+            sources.update(Path(pattern).rglob('*.xml'))
+        else:
+            sources.update(Path(p) for p in glob.glob(pattern, recursive=True))
+    return sorted(p.resolve() for p in sources if p.is_file())
+
+# What may follow the TEI file's stem in a facsimile's name
+IMAGE_STEM_SEPARATORS = ('.', '-', '_')
+
+def find_images(source: Path) -> List[Path]:
+    """Facsimiles live next to the TEI file and share its stem, e.g. X.xml -> X-img.png.
+
+    The stem must be followed by a separator, so X.xml doesn't pick up the
+    facsimiles of X0.xml.
+    """
+    prefixes = tuple(source.stem + separator for separator in IMAGE_STEM_SEPARATORS)
+    return sorted(
+        p for p in source.parent.glob(f'{glob.escape(source.stem)}*')
+        if p.suffix.lower() in IMAGE_EXTENSIONS and p.name.startswith(prefixes)
+    )
+
+class FileHasher:
+    """SHA-256 of files, reusing the manifest entry while size and mtime match."""
+
+    def __init__(self, known: Dict[str, dict]):
+        self.known = known
+        self.seen: Dict[str, dict] = {}
+
+    def __call__(self, path: Path) -> str:
+        key = str(path)
+        if key in self.seen:
+            return self.seen[key]['sha256']
+        stat = path.stat()
+        entry = self.known.get(key)
+        if not (entry and entry['size'] == stat.st_size and entry['mtime_ns'] == stat.st_mtime_ns):
+            digest = hashlib.sha256()
+            with open(path, 'rb') as f:
+                for chunk in iter(lambda: f.read(1 << 20), b''):
+                    digest.update(chunk)
+            entry = {'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns, 'sha256': digest.hexdigest()}
+        self.seen[key] = entry
+        return entry['sha256']
+
+def load_manifest(output_dir: Path) -> dict:
+    try:
+        with open(output_dir / MANIFEST_NAME, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return {}
+
+def save_manifest(output_dir: Path, manifest: dict):
+    tmp_path = output_dir / (MANIFEST_NAME + '.tmp')
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, indent=1, sort_keys=True)
+    os.replace(tmp_path, output_dir / MANIFEST_NAME)
+
+def remove_pages(dest: Path):
+    """Delete the page fragments and page manifest of a paginated document."""
+    pages_dir = dest.with_name(dest.stem + '.pages')
+    if pages_dir.is_dir():
+        shutil.rmtree(pages_dir)
+    pages_manifest = dest.with_name(dest.stem + '.pages.json')
+    if pages_manifest.exists():
+        pages_manifest.unlink()
+
+def render_document(source: str, dest: str, image_names: List[Union[str, Facsimile]],
+                    paginate: bool = False,
+                    profile: bool = False, assets: tei_to_html.PageAssets = None
+                    ) -> Tuple[Dict, DocumentOccurrences, Optional[ConversionProfiler]]:
+    """Process-pool worker: convert one TEI file into its HTML and search index.
+
+    ``assets`` are the shared bundles the page links to. With ``paginate``
+    the document is written as page fragments behind a lazy-loading shell
+    instead (see TEItoHTMLConverter.convert_pages).
+    Returns the converter's entity references, for the document's entity
+    manifest, its entity occurrences, for the corpus entity index, and with
+    ``profile`` the document's conversion profile.
+    """
+    converter = tei_to_html.TEItoHTMLConverter()
+    if profile:
+        converter.enable_profiling()
+    context = tei_to_html.ConversionContext()
+    context.occurrences = OccurrenceCollector()
+    index_path = search_index_path(dest)
+    manifest_url = entity_manifest_path(dest).name
+    if paginate:
+        dest_path = Path(dest)
+        converter.convert_pages(source, str(dest_path.parent), dest_path.stem, image_names,
+                                entity_manifest_url=manifest_url, context=context,
+                                assets=assets, search_index_url=index_path.name)
+        context.search_index.write(index_path)
+        return context.entity_refs, context.occurrences.result(), converter.profiler
+
+    remove_pages(Path(dest))
+    tmp_path = dest + '.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        converter.convert_stream(source, f, image_names, search_index_url=index_path.name,
+                                 entity_manifest_url=manifest_url, context=context,
+                                 assets=assets)
+    context.search_index.write(index_path)
+    os.replace(tmp_path, dest)
+    return context.entity_refs, context.occurrences.result(), converter.profiler
+
+def write_corpus_profile(profiles: Dict[str, ConversionProfiler], profile_dir: Path):
+    """Merge per-document profiles into ``profile.json`` and ``profile.folded``.
+
+    The JSON also ranks documents by conversion time, with each one's
+    deepest nesting and most expensive element, to point at outliers.
+    """
+    profile_dir.mkdir(parents=True, exist_ok=True)
+    corpus = ConversionProfiler()
+    documents = []
+    for rel_dest, profiler in profiles.items():
+        corpus.merge(profiler)
+        summary = profiler.to_dict()
+        documents.append({
+            'document': rel_dest,
+            'seconds': summary['total_seconds'],
+            'max_depth': summary['max_depth'],
+            'elements': sum(e['count'] for e in summary['elements'].values()),
+            'slowest_element': next(iter(summary['elements']), None),
+        })
+    documents.sort(key=lambda d: d['seconds'], reverse=True)
+    data = corpus.to_dict()
+    data['slowest_documents'] = documents[:PROFILE_DOCUMENTS]
+    with open(profile_dir / 'profile.json', 'w', encoding='utf-8') as f:
+        json.dump(data, f, indent=2)
+    corpus.write_folded(str(profile_dir / 'profile.folded'))
+    print(corpus.summary())
+
+def build(inputs: Iterable[str], output_dir: str = 'output',
+          css: Union[str, Sequence[str], None] = 'styles.css',
+          jobs: Optional[int] = None, force: bool = False,
+          registers: Optional[str] = None, paginate: bool = False,
+          profile_dir: Optional[str] = None, vendor: bool = False,
+          tiles: bool = False, tiles_base_url: Optional[str] = None) -> BuildReport:
+    """Convert a TEI corpus, re-rendering only documents whose inputs changed.
+
+    The manifest in the output directory records a content hash for every
+    TEI file and image, plus the converter fingerprint. A document is
+    re-rendered when its TEI hash, its image list, the converter or the
+    asset bundles change; images are re-copied only when their hash changes.
+
+    The stylesheets in ``css`` (paths or URLs) and the viewer scripts are
+    written once, as minified content-hashed bundles in ``assets/`` that
+    every page links to (see static_assets.py). CDN URLs stay external
+    unless ``vendor`` is set, which bundles them for offline deploys.
+
+    With ``tiles`` facsimiles are published as IIIF tile pyramids with
+    thumbnails in ``facsimiles/`` (see facsimile_tiles.py, needs Pillow)
+    instead of being copied at full resolution. ``tiles_base_url``, the
+    absolute URL ``facsimiles/`` is deployed at, is then required for the
+    IIIF ids.
+
+    Every build updates ``entity-index.json``, the corpus-wide index of
+    where each entity is mentioned (see entity_index.py), for the
+    re-rendered and removed documents only.
+
+    With ``registers`` (a directory of persons.json, places.json, ...) the
+    registers are written as hashed shards to ``entities/`` and every
+    document gets an entity manifest pointing at the shards it needs.
+    With ``paginate`` documents are split into lazily loaded page fragments.
+    With ``profile_dir`` the documents rendered in this run are profiled (see
+    write_corpus_profile); use ``force`` to profile the whole corpus.
+    """
+    if tiles and not tiles_base_url:
+        raise ValueError("Tiled facsimiles need tiles_base_url for their IIIF ids")
+    output_dir = Path(output_dir)
+    output_dir.mkdir(parents=True, exist_ok=True)
+    sources = collect_sources(inputs)
+    root = Path(os.path.commonpath([p.parent for p in sources])) if sources else Path('.')
+
+    old = {} if force else load_manifest(output_dir)
+    hasher = FileHasher(old.get('files', {}))
+    fingerprint = converter_fingerprint()
+    old_documents = old.get('documents', {}) if old.get('converter') == fingerprint else {}
+    index_path = output_dir / ENTITY_INDEX_NAME
+    entities = EntityIndex()
+    if not force:
+        try:
+            entities = EntityIndex.load(index_path)
+        except (OSError, ValueError, KeyError):
+            # Without the index, skipped documents would be missing from it.
+            old_documents = {}
+    old_assets = old.get('assets', {})
+    stylesheets = [css] if isinstance(css, str) else list(css or [])
+    bundles, bundle_files = build_bundles(output_dir / ASSET_DIR, stylesheets, viewer_scripts(),
+                                          vendor=vendor)
+
+    report = BuildReport()
+    documents: Dict[str, dict] = {}
+    assets: Dict[str, dict] = {}
+    jobs_to_run = []
+
+    source_images = {source: find_images(source) for source in sources}
+    def image_id(image: Path) -> str:
+        # The whole file name: X0.png and X0.jpg are different facsimiles
+        return image.relative_to(root).as_posix()
+    facsimiles: Dict[str, Facsimile] = {}
+    if tiles:
+        facsimiles, changes = tile_images(
+            {image_id(image): image for images in source_images.values() for image in images},
+            output_dir / FACSIMILE_DIR, tiles_base_url, jobs=jobs, force=force, hasher=hasher)
+        report.tiled.extend(changes['tiled'])
+        report.removed.extend(f'{FACSIMILE_DIR}/{removed}' for removed in changes['removed'])
+    elif old.get('tiles') and (output_dir / FACSIMILE_DIR).is_dir():
+        shutil.rmtree(output_dir / FACSIMILE_DIR)
+        report.removed.append(FACSIMILE_DIR)
+
+    for source in sources:
+        rel_dir = source.parent.relative_to(root)
+        images = source_images[source]
+        dest = (output_dir / rel_dir / source.stem).with_suffix('.html')
+        rel_dest = dest.relative_to(output_dir).as_posix()
+        assets_url = os.path.relpath(output_dir / ASSET_DIR, dest.parent).replace(os.sep, '/')
+        page_assets = relocate(bundles, assets_url)
+        if tiles:
+            facsimile_url = os.path.relpath(output_dir / FACSIMILE_DIR,
+                                            dest.parent).replace(os.sep, '/')
+            page_images = [facsimiles[image_id(p)].moved(facsimile_url) for p in images]
+        else:
+            page_images = [p.name for p in images]
+        key = hashlib.sha256(
+            '\0'.join([hasher(source), 'paged' if paginate else 'single']
+                      + list(map(str, page_images))
+                      + list(page_assets.stylesheets + page_assets.scripts)).encode()
+        ).hexdigest()
+        documents[rel_dest] = {'source': str(source), 'key': key}
+        if old_documents.get(rel_dest, {}).get('key') == key and dest.exists():
+            documents[rel_dest]['entities'] = old_documents[rel_dest].get('entities', {})
+            report.skipped.append(rel_dest)
+        else:
+            dest.parent.mkdir(parents=True, exist_ok=True)
+            jobs_to_run.append((str(source), str(dest), page_images, paginate,
+                                bool(profile_dir), page_assets))
+
+        for asset in ([] if tiles else images):
+            asset_dest = (output_dir / rel_dir / asset.name).relative_to(output_dir).as_posix()
+            assets[asset_dest] = {'source': str(asset), 'sha256': hasher(asset)}
+
+    if jobs_to_run:
+        if jobs == 1 or len(jobs_to_run) == 1:
+            results = [render_document(*job) for job in jobs_to_run]
+        else:
+            with ProcessPoolExecutor(max_workers=jobs) as pool:
+                results = list(pool.map(render_document, *zip(*jobs_to_run), chunksize=8))
+        profiles = {}
+        for (_, dest, *_), (entity_refs, occurrences, profiler) in zip(jobs_to_run, results):
+            rel_dest = Path(dest).relative_to(output_dir).as_posix()
+            documents[rel_dest]['entities'] = entity_refs
+            entities.update_document(rel_dest, occurrences)
+            report.rendered.append(rel_dest)
+            if profiler is not None:
+                profiles[rel_dest] = profiler
+        if profile_dir:
+            write_corpus_profile(profiles, Path(profile_dir))
+
+    # Pages always reference their entity manifest; without registers it
+    # only lists the mentions.
+    locations = write_bundles(load_registers(registers), output_dir / BUNDLE_DIR) if registers else {}
+    for rel_dest, document in documents.items():
+        dest = output_dir / rel_dest
+        bundle_url = os.path.relpath(output_dir / BUNDLE_DIR, dest.parent).replace(os.sep, '/')
+        write_document_manifest(entity_manifest_path(dest),
+                                document_manifest(document['entities'], locations, bundle_url))
+
+    for rel_dest, asset in assets.items():
+        dest = output_dir / rel_dest
+        if old_assets.get(rel_dest, {}).get('sha256') != asset['sha256'] or not dest.exists():
+            shutil.copy2(asset['source'], dest)
+            report.copied.append(rel_dest)
+
+    for stale in (set(old.get('documents', {})) - set(documents)) | (set(old_assets) - set(assets)):
+        stale_path = output_dir / stale
+        if stale_path.exists():
+            stale_path.unlink()
+        if stale in old.get('documents', {}):
+            remove_index(search_index_path(stale_path))
+            manifest_path = entity_manifest_path(stale_path)
+            if manifest_path.exists():
+                manifest_path.unlink()
+            remove_pages(stale_path)
+        report.removed.append(stale)
+    for stale in set(entities.paths()) - set(documents):
+        entities.remove_document(stale)
+    if entities.modified or not index_path.exists():
+        entities.save(index_path)
+    for stale in set(old.get('bundles', [])) - set(bundle_files):
+        stale_path = output_dir / ASSET_DIR / stale
+        if stale_path.exists():
+            stale_path.unlink()
+        report.removed.append(f'{ASSET_DIR}/{stale}')
+
+    save_manifest(output_dir, {
+        'converter': fingerprint,
+        'files': hasher.seen,
+        'documents': documents,
+        'assets': assets,
+        'bundles': bundle_files,
+        'tiles': tiles,
+    })
+    return report
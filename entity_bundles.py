@@ -0,0 +1,129 @@
+"""Sharded, content-addressed entity registers for lazy loading in the viewer.
+
+Each register (persons, places, flora, fauna, zoological) is split into
+shards by a hash of the entity ID and every shard is written as
+``<register>-<shard>.<content hash>.json``, so a changed shard gets a new
+name and all shard files can be served with a far-future cache lifetime.
+
+Every document gets a small ``<doc>.entities.json`` manifest listing only
+the entities it mentions, the shard file holding each of them and, per page,
+which entities occur there. The viewer (``js/viewer.js``, bundled into every
+page tei_to_html.py writes) reads the manifest and fetches a shard the first
+time one of its entities is clicked.
+"""
+import hashlib
+import json
+import os
+from pathlib import Path
+from typing import Dict, List
+
+from extract_entities import REGISTERS
+
+MANIFEST_VERSION = 1
+# Target number of entries per shard; shard counts are powers of two.
+SHARD_SIZE = 512
+
+def shard_number(entity_id: str, shard_count: int) -> int:
+    """FNV-1a over the ID's code points: stable across runs, unlike hash()."""
+    h = 0x811C9DC5
+    for c in entity_id:
+        h = ((h ^ ord(c)) * 0x01000193) & 0xFFFFFFFF
+    return h % shard_count
+
+def shard_count_for(entries: int, shard_size: int = SHARD_SIZE) -> int:
+    count = 1
+    while count * shard_size < entries:
+        count *= 2
+    return count
+
+def entity_manifest_path(html_path) -> Path:
+    """Manifest written next to an HTML file: ``doc.html`` -> ``doc.entities.json``."""
+    html_path = Path(html_path)
+    return html_path.with_name(html_path.stem + '.entities.json')
+
+def load_registers(directory: str) -> Dict[str, Dict[str, Dict]]:
+    """Read ``<register>.json`` files as written by extract_entities.py."""
+    registers = {}
+    for name in REGISTERS:
+        path = os.path.join(directory, f'{name}.json')
+        if os.path.exists(path):
+            with open(path, 'r', encoding='utf-8') as f:
+                registers[name] = json.load(f).get(name, {})
+    return registers
+
+def _write_if_changed(path: Path, content: str) -> bool:
+    if path.exists() and path.read_text(encoding='utf-8') == content:
+        return False
+    tmp_path = path.with_name(path.name + '.tmp')
+    tmp_path.write_text(content, encoding='utf-8')
+    os.replace(tmp_path, path)
+    return True
+
+def write_bundles(registers: Dict[str, Dict[str, Dict]], bundle_dir,
+                  shard_size: int = SHARD_SIZE) -> Dict[str, Dict[str, str]]:
+    """Write the sharded registers and remove shard files no longer in use.
+
+    Returns register name -> entity ID -> shard file name (relative to
+    ``bundle_dir``). Unchanged shards keep their file and are not rewritten.
+    """
+    bundle_dir = Path(bundle_dir)
+    bundle_dir.mkdir(parents=True, exist_ok=True)
+    locations: Dict[str, Dict[str, str]] = {}
+    in_use = set()
+    for name, entries in registers.items():
+        shard_count = shard_count_for(len(entries), shard_size)
+        shards: List[Dict[str, Dict]] = [{} for _ in range(shard_count)]
+        for entity_id, record in entries.items():
+            shards[shard_number(entity_id, shard_count)][entity_id] = record
+        locations[name] = {}
+        for number, shard in enumerate(shards):
+            if not shard:
+                continue
+            content = json.dumps({name: shard}, ensure_ascii=False, sort_keys=True,
+                                 separators=(',', ':'))
+            digest = hashlib.sha256(content.encode('utf-8')).hexdigest()[:12]
+            file_name = f'{name}-{number:x}.{digest}.json'
+            # The name changes with the content, so an existing file is current.
+            if not (bundle_dir / file_name).exists():
+                _write_if_changed(bundle_dir / file_name, content)
+            in_use.add(file_name)
+            for entity_id in shard:
+                locations[name][entity_id] = file_name
+    for path in bundle_dir.glob('*.json'):
+        if path.name not in in_use:
+            path.unlink()
+    return locations
+
+def document_manifest(entity_refs: Dict[str, Dict[str, List[str]]],
+                      locations: Dict[str, Dict[str, str]], bundle_url: str) -> Dict:
+    """Manifest for one document from the converter's ``entity_refs``.
+
+    ``bundle_url`` is the bundle directory relative to the document. IDs
+    without a register entry are left out of ``entities`` but still listed
+    per page, so the viewer can tell "unknown" from "not on this page".
+    """
+    shard_files: List[str] = []
+    shard_numbers: Dict[str, int] = {}
+    entities: Dict[str, Dict[str, int]] = {}
+    pages: Dict[str, Dict[str, List[str]]] = {}
+    for register, refs in sorted(entity_refs.items()):
+        for entity_id, entity_pages in sorted(refs.items()):
+            file_name = locations.get(register, {}).get(entity_id)
+            if file_name is not None:
+                if file_name not in shard_numbers:
+                    shard_numbers[file_name] = len(shard_files)
+                    shard_files.append(f'{bundle_url}/{file_name}' if bundle_url else file_name)
+                entities.setdefault(register, {})[entity_id] = shard_numbers[file_name]
+            for page in entity_pages:
+                pages.setdefault(page, {}).setdefault(register, []).append(entity_id)
+    return {
+        'version': MANIFEST_VERSION,
+        'shards': shard_files,
+        'entities': entities,
+        'pages': pages,
+    }
+
+def write_document_manifest(path, manifest: Dict) -> bool:
+    """Write a manifest unless an identical one is already there."""
+    content = json.dumps(manifest, ensure_ascii=False, separators=(',', ':'))
+    return _write_if_changed(Path(path), content)
@@ -0,0 +1,359 @@
+"""Corpus-wide inverted index of entity occurrences.
+
+The registers say what an entity is; this index says where it occurs. For
+every entity ID it holds the postings (document, page, anchor, character
+offset) of all its mentions in the converted corpus, so "every passage
+mentioning pers.humboldt" is a lookup instead of a re-parse of every TEI
+file.
+
+Occurrences are collected from the body HTML the converter writes, like
+the search index: ``OccurrenceCollector`` is fed the same HTML and counts
+offsets the same way (UTF-16 code units of the text). Unlike the search
+index, a mention's anchor is the last element ID opened before it (a
+page break, note marker, numbered div...), the place a reader would
+scroll to; paragraphs carry no IDs, so few mentions are inside one.
+Mentions inside notes are not part of the body text and are not indexed.
+
+On disk the index is one JSON file. Per document it lists the page labels
+and anchors; per entity it stores the postings as one string: the flat
+integer array (document, page, anchor, offset) in document order, delta
+encoded, written as varints and base64. A build rewrites only the
+postings of entities whose documents changed (``update_document``).
+
+    python entity_index.py output/entity-index.json pers.humboldt --with place.orinoco
+"""
+import argparse
+import base64
+import json
+import os
+from html.parser import HTMLParser
+from pathlib import Path
+from typing import Dict, Iterable, List, NamedTuple, Optional, Sequence, Tuple
+
+from search_index import utf16_len
+
+INDEX_VERSION = 1
+ENTITY_INDEX_NAME = 'entity-index.json'
+# Class of the span the converter emits for a mention -> register
+ENTITY_CLASSES = {
+    'person-name': 'persons',
+    'place-name': 'places',
+    'flora-name': 'flora',
+    'fauna-name': 'fauna',
+    'zoological-name': 'zoological',
+}
+SCOPES = ('anchor', 'page', 'document')
+
+class Occurrence(NamedTuple):
+    entity: str
+    document: str
+    page: str
+    anchor: str
+    offset: int
+
+class Passage(NamedTuple):
+    """A page, anchor or document in which several entities occur together."""
+    document: str
+    unit: str
+    occurrences: List[Occurrence]
+
+class DocumentOccurrences(NamedTuple):
+    """What OccurrenceCollector found in one document; postings are numbers into the tables."""
+    pages: List[str]
+    anchors: List[str]
+    # (register, entity ID, page number, anchor number, offset)
+    mentions: List[Tuple[str, str, int, int, int]]
+
+class OccurrenceCollector(HTMLParser):
+    """Finds entity mentions in converted body HTML, fed in any number of pieces."""
+
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        # Page 0 is the text before the first page break
+        self.pages: List[str] = ['']
+        self.anchors: List[str] = ['']
+        self._anchor_numbers: Dict[str, int] = {'': 0}
+        # Number of the last element ID opened so far
+        self._anchor = 0
+        self.mentions: List[Tuple[str, str, int, int, int]] = []
+        self.text_length = 0
+
+    def handle_starttag(self, tag, attrs):
+        attrs = dict(attrs)
+        classes = (attrs.get('class') or '').split()
+        element_id = attrs.get('id')
+        if 'page-break' in classes and element_id and element_id.startswith('page-'):
+            self.pages.append(element_id[len('page-'):])
+        if element_id:
+            self._anchor = self._anchor_numbers.setdefault(element_id, len(self.anchors))
+            if self._anchor == len(self.anchors):
+                self.anchors.append(element_id)
+        entity_id = attrs.get('data-id')
+        if entity_id:
+            register = next((ENTITY_CLASSES[c] for c in classes if c in ENTITY_CLASSES), None)
+            if register:
+                self.mentions.append((register, entity_id, len(self.pages) - 1, self._anchor,
+                                      self.text_length))
+
+    def handle_data(self, data):
+        self.text_length += utf16_len(data)
+
+    def result(self) -> DocumentOccurrences:
+        self.close()
+        return DocumentOccurrences(self.pages, self.anchors, self.mentions)
+
+def _zigzag(value: int) -> int:
+    return value * 2 if value >= 0 else -value * 2 - 1
+
+def _unzigzag(value: int) -> int:
+    return value >> 1 if not value & 1 else -(value >> 1) - 1
+
+def encode_postings(postings: Sequence[int]) -> str:
+    """Flat (document, page, anchor, offset) quadruples as a varint string.
+
+    The postings must be ordered by document and offset. Each field is
+    stored as the delta from the previous posting; page, anchor and offset
+    restart from 0 at every document. Page and anchor deltas can be
+    negative and are zigzag encoded.
+    """
+    out = bytearray()
+    document = page = anchor = offset = 0
+    for i in range(0, len(postings), 4):
+        if postings[i] != document:
+            page = anchor = offset = 0
+        values = (postings[i] - document, _zigzag(postings[i + 1] - page),
+                  _zigzag(postings[i + 2] - anchor), postings[i + 3] - offset)
+        document, page, anchor, offset = postings[i:i + 4]
+        for value in values:
+            while value > 0x7F:
+                out.append(value & 0x7F | 0x80)
+                value >>= 7
+            out.append(value)
+    return base64.b64encode(bytes(out)).decode('ascii')
+
+def decode_postings(encoded: str) -> List[int]:
+    values = []
+    value = shift = 0
+    for byte in base64.b64decode(encoded):
+        value |= (byte & 0x7F) << shift
+        if byte & 0x80:
+            shift += 7
+        else:
+            values.append(value)
+            value = shift = 0
+    postings = []
+    document = page = anchor = offset = 0
+    for i in range(0, len(values), 4):
+        if values[i]:
+            document += values[i]
+            page = anchor = offset = 0
+        page += _unzigzag(values[i + 1])
+        anchor += _unzigzag(values[i + 2])
+        offset += values[i + 3]
+        postings.extend((document, page, anchor, offset))
+    return postings
+
+class EntityIndex:
+    """Entity ID -> occurrences across a corpus, in memory or loaded from disk.
+
+    Documents keep their number when they are updated, and a removed
+    document's number goes to the next new one, so the postings of other
+    documents never need renumbering. Postings are decoded on first use
+    and re-encoded only for entities whose documents change.
+    """
+
+    def __init__(self):
+        # Per document number: {'path', 'pages', 'anchors', 'entities'}, or None
+        self.documents: List[Optional[Dict]] = []
+        self.registers: Dict[str, str] = {}
+        self.postings: Dict[str, str] = {}
+        self._numbers: Dict[str, int] = {}
+        self._decoded: Dict[str, List[int]] = {}
+        # Whether there are changes since loading or saving
+        self.modified = False
+
+    @classmethod
+    def load(cls, path) -> 'EntityIndex':
+        with open(path, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+        if data.get('version') != INDEX_VERSION:
+            raise ValueError(f"Unsupported entity index version {data.get('version')} in {path}")
+        index = cls()
+        index.documents = data['documents']
+        index.registers = data['registers']
+        index.postings = data['postings']
+        index._numbers = {document['path']: number for number, document
+                          in enumerate(index.documents) if document is not None}
+        return index
+
+    def save(self, path):
+        path = Path(path)
+        tmp_path = path.with_name(path.name + '.tmp')
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({
+                'version': INDEX_VERSION,
+                'documents': self.documents,
+                'registers': self.registers,
+                'postings': self.postings,
+            }, f, ensure_ascii=False, separators=(',', ':'))
+        os.replace(tmp_path, path)
+        self.modified = False
+
+    def _flat(self, entity_id: str) -> List[int]:
+        flat = self._decoded.get(entity_id)
+        if flat is None:
+            encoded = self.postings.get(entity_id)
+            flat = self._decoded[entity_id] = decode_postings(encoded) if encoded else []
+        return flat
+
+    def _store(self, entity_id: str, flat: List[int]):
+        if flat:
+            self.postings[entity_id] = encode_postings(flat)
+            self._decoded[entity_id] = flat
+        else:
+            self.postings.pop(entity_id, None)
+            self.registers.pop(entity_id, None)
+            self._decoded.pop(entity_id, None)
+
+    def _replace_postings(self, entity_id: str, number: int, postings: List[int]):
+        """Swap the postings of document ``number`` for ``postings``, keeping document order"""
+        flat = self._flat(entity_id)
+        start = 0
+        while start < len(flat) and flat[start] < number:
+            start += 4
+        end = start
+        while end < len(flat) and flat[end] == number:
+            end += 4
+        self._store(entity_id, flat[:start] + postings + flat[end:])
+
+    def remove_document(self, path: str):
+        number = self._numbers.pop(path, None)
+        if number is None:
+            return
+        for entity_id in self.documents[number]['entities']:
+            self._replace_postings(entity_id, number, [])
+        self.documents[number] = None
+        self.modified = True
+
+    def update_document(self, path: str, found: DocumentOccurrences):
+        """Replace the occurrences of one document (adding it if it is new)."""
+        number = self._numbers.get(path)
+        if number is None:
+            number = next((i for i, document in enumerate(self.documents) if document is None),
+                          len(self.documents))
+            if number == len(self.documents):
+                self.documents.append(None)
+            previous = []
+        else:
+            previous = self.documents[number]['entities']
+        by_entity: Dict[str, List[int]] = {}
+        for register, entity_id, page, anchor, offset in found.mentions:
+            self.registers[entity_id] = register
+            by_entity.setdefault(entity_id, []).extend((number, page, anchor, offset))
+        for entity_id in set(previous) | set(by_entity):
+            self._replace_postings(entity_id, number, by_entity.get(entity_id, []))
+        self.documents[number] = {'path': path, 'pages': found.pages, 'anchors': found.anchors,
+                                  'entities': sorted(by_entity)}
+        self._numbers[path] = number
+        self.modified = True
+
+    def paths(self) -> List[str]:
+        return list(self._numbers)
+
+    def entities(self, register: str = None) -> List[str]:
+        return sorted(entity_id for entity_id, name in self.registers.items()
+                      if register is None or name == register)
+
+    def _page_limits(self, number: int, pages: Tuple[Optional[str], Optional[str]]):
+        """Page numbers in a document for a (first, last) label range, or None"""
+        labels = self.documents[number]['pages']
+        first, last = pages
+        try:
+            low = labels.index(first) if first is not None else 0
+            high = len(labels) - 1 - labels[::-1].index(last) if last is not None else len(labels)
+        except ValueError:
+            return None
+        return low, high
+
+    def occurrences(self, entity_id: str, documents: Iterable[str] = None,
+                    pages: Tuple[Optional[str], Optional[str]] = None) -> List[Occurrence]:
+        """Mentions of an entity in document order.
+
+        ``documents`` limits them to some document paths. ``pages`` is an
+        inclusive (first, last) range of page labels, either end open when
+        None; documents without those labels are left out.
+        """
+        wanted = None if documents is None else {self._numbers.get(path) for path in documents}
+        flat = self._flat(entity_id)
+        result = []
+        limits: Dict[int, Optional[Tuple[int, int]]] = {}
+        for i in range(0, len(flat), 4):
+            number, page, anchor, offset = flat[i:i + 4]
+            if wanted is not None and number not in wanted:
+                continue
+            if pages is not None:
+                if number not in limits:
+                    limits[number] = self._page_limits(number, pages)
+                if limits[number] is None or not limits[number][0] <= page <= limits[number][1]:
+                    continue
+            document = self.documents[number]
+            result.append(Occurrence(entity_id, document['path'], document['pages'][page],
+                                     document['anchors'][anchor], offset))
+        return result
+
+    def documents_mentioning(self, entity_id: str) -> List[str]:
+        flat = self._flat(entity_id)
+        return [self.documents[number]['path'] for number in sorted(set(flat[::4]))]
+
+    def cooccurrences(self, entity_ids: Sequence[str], within: str = 'page',
+                      pages: Tuple[Optional[str], Optional[str]] = None) -> List[Passage]:
+        """Anchors, pages or documents in which all ``entity_ids`` occur.
+
+        Documents are narrowed down with the per-document entity lists
+        before any postings are decoded.
+        """
+        if within not in SCOPES:
+            raise ValueError(f"within must be one of {SCOPES}, not {within!r}")
+        candidates = None
+        for entity_id in entity_ids:
+            documents = set(self.documents_mentioning(entity_id))
+            candidates = documents if candidates is None else candidates & documents
+        if not candidates:
+            return []
+        units: Dict[Tuple[str, str], List[List[Occurrence]]] = {}
+        for k, entity_id in enumerate(entity_ids):
+            for occurrence in self.occurrences(entity_id, candidates, pages):
+                unit = {'anchor': occurrence.anchor, 'page': occurrence.page,
+                        'document': ''}[within]
+                groups = units.setdefault((occurrence.document, unit),
+                                          [[] for _ in entity_ids])
+                groups[k].append(occurrence)
+        return [Passage(document, unit, sorted((o for group in groups for o in group),
+                                               key=lambda o: o.offset))
+                for (document, unit), groups in units.items() if all(groups)]
+
+def main():
+    parser = argparse.ArgumentParser(description="Look up entity occurrences in a built corpus")
+    parser.add_argument("index", help=f"{ENTITY_INDEX_NAME} or the build output directory")
+    parser.add_argument("entity", help="Entity ID, e.g. pers.humboldt")
+    parser.add_argument("--with", dest="others", action="append", default=[],
+                        help="Only passages that also mention this entity (repeatable)")
+    parser.add_argument("--within", choices=SCOPES, default='page',
+                        help="Passage size for --with (default: page)")
+    parser.add_argument("--pages", nargs=2, metavar=('FIRST', 'LAST'),
+                        help="Page label range, '-' for an open end")
+    args = parser.parse_args()
+
+    path = Path(args.index)
+    index = EntityIndex.load(path / ENTITY_INDEX_NAME if path.is_dir() else path)
+    pages = tuple(None if label == '-' else label for label in args.pages) if args.pages else None
+    if args.others:
+        for passage in index.cooccurrences([args.entity] + args.others, args.within, pages):
+            mentions = ', '.join(f'{o.entity}@{o.offset}' for o in passage.occurrences)
+            print(f"{passage.document}\t{passage.unit}\t{mentions}")
+    else:
+        for o in index.occurrences(args.entity, pages=pages):
+            print(f"{o.document}\t{o.page}\t{o.anchor}\t{o.offset}")
+
+if __name__ == "__main__":
+    main()
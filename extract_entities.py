@@ -0,0 +1,181 @@
+"""Single-pass replacement for extract-entities.xsl.
+
+Walks a TEI document once with lxml's iterparse and routes ``person``,
+``place`` and ``name[@type]`` elements to per-register sinks, producing
+``persons.json``, ``places.json``, ``flora.json``, ``fauna.json`` and
+``zoological.json`` with the same structure as the stylesheet. Persons and
+places are keyed by ``@xml:id``; names by ``entity_key``, the same key the
+converter writes into ``data-id``, so repeated names share one entry.
+"""
+import argparse
+import json
+import os
+from typing import Callable, Dict, Iterable, List, Optional
+
+from lxml import etree
+
+from tei_to_html import entity_key
+
+TEI_NS = '{http://www.tei-c.org/ns/1.0}'
+XML_ID = '{http://www.w3.org/XML/1998/namespace}id'
+
+REGISTERS = ('persons', 'places', 'flora', 'fauna', 'zoological')
+NAME_DESCRIPTIONS = {
+    'flora': 'No additional information available.',
+    'fauna': 'No additional information available.',
+    'zoological': 'Scientific name of species.',
+}
+# Ancestors (nearest first) a person must have, as in the stylesheet's
+# //tei:teiHeader/tei:profileDesc/tei:particDesc/tei:listPerson/tei:person
+PERSON_PATH = ['listPerson', 'particDesc', 'profileDesc', 'teiHeader']
+
+def normalize_space(text: Optional[str]) -> str:
+    return ' '.join(text.split()) if text else ''
+
+def _text(element) -> str:
+    return normalize_space(''.join(element.itertext())) if element is not None else ''
+
+def _child(element, name: str, type_: str = None):
+    for child in element.iterchildren(TEI_NS + name):
+        if type_ is None or child.get('type') == type_:
+            return child
+    return None
+
+def person_record(element) -> Dict[str, str]:
+    record = {'name': _text(_child(element, 'persName'))}
+    for field in ('birth', 'death'):
+        child = _child(element, field)
+        if child is not None and child.get('when'):
+            record[field] = child.get('when')
+    for field in ('occupation', 'note'):
+        child = _child(element, field)
+        if child is not None:
+            record[field] = _text(child)
+    return record
+
+def place_record(element) -> Dict[str, str]:
+    record = {'name': _text(_child(element, 'placeName'))}
+    modern = _child(element, 'placeName', 'modern')
+    if modern is not None:
+        record['modernName'] = _text(modern)
+    location = _child(element, 'location')
+    geo = _child(location, 'geo') if location is not None else None
+    if geo is not None:
+        record['geo'] = _text(geo)
+    note = _child(element, 'note')
+    if note is not None:
+        record['note'] = _text(note)
+    return record
+
+RECORD_TAGS = {TEI_NS + 'person', TEI_NS + 'place', TEI_NS + 'name'}
+
+class EntityExtractor:
+    """Collects register entries from one or more TEI documents.
+
+    Sinks are keyed by element name and, for ``name``, by ``@type``; each
+    receives the completed element and returns ``(register, key, record)``
+    or ``None``. The first entry seen for a key wins.
+    """
+
+    def __init__(self):
+        self.registers: Dict[str, Dict[str, Dict]] = {name: {} for name in REGISTERS}
+        self.sinks: Dict[tuple, Callable] = {
+            ('person', None): self._person,
+            ('place', None): self._place,
+        }
+        for kind in NAME_DESCRIPTIONS:
+            self.sinks[('name', kind)] = self._name_sink(kind)
+
+    @staticmethod
+    def _person(element):
+        ancestors = [etree.QName(a).localname for a in element.iterancestors()]
+        if ancestors[:len(PERSON_PATH)] != PERSON_PATH or not element.get(XML_ID):
+            return None
+        return 'persons', element.get(XML_ID), person_record(element)
+
+    @staticmethod
+    def _place(element):
+        parent = element.getparent()
+        if parent is None or parent.tag != TEI_NS + 'listPlace' or not element.get(XML_ID):
+            return None
+        return 'places', element.get(XML_ID), place_record(element)
+
+    def _name_sink(self, kind: str) -> Callable:
+        # Names repeat heavily, so each distinct spelling is keyed only once.
+        keys: Dict[str, str] = {}
+        entries = self.registers[kind]
+
+        def sink(element):
+            name = normalize_space(element.text) if len(element) == 0 else _text(element)
+            if not name:
+                return None
+            key = keys.get(name)
+            if key is None:
+                key = keys[name] = entity_key(kind, name)
+            if key in entries:
+                return None
+            return kind, key, {'name': name, 'description': NAME_DESCRIPTIONS[kind]}
+        return sink
+
+    def feed(self, source):
+        """Extract from one TEI file (path or binary file object)."""
+        # Records need their subtree until they end, so nothing inside an
+        # open person, place or name is freed early.
+        open_records = 0
+        processed = 0
+        for event, element in etree.iterparse(source, events=('start', 'end'), tag=RECORD_TAGS,
+                                              huge_tree=True, remove_comments=True):
+            if event == 'start':
+                open_records += 1
+                continue
+            open_records -= 1
+            name = element.tag[len(TEI_NS):]
+            sink = self.sinks.get((name, element.get('type') if name == 'name' else None))
+            if sink is not None:
+                entry = sink(element)
+                if entry is not None:
+                    register, key, record = entry
+                    self.registers[register].setdefault(key, record)
+            if open_records:
+                continue
+            element.clear(keep_tail=True)
+            processed += 1
+            # Dropping everything read before this point also frees the
+            # paragraphs that contained earlier records; amortise the walk.
+            nodes = element.iterancestors() if processed % 1024 == 0 else ()
+            for node in (element, *nodes):
+                while node.getprevious() is not None:
+                    del node.getparent()[0]
+        return self.registers
+
+def extract_entities(sources: Iterable) -> Dict[str, Dict[str, Dict]]:
+    """Registers for one or more TEI files, keyed by register name"""
+    extractor = EntityExtractor()
+    for source in sources:
+        extractor.feed(source)
+    return extractor.registers
+
+def write_registers(registers: Dict[str, Dict[str, Dict]], output_dir: str) -> List[str]:
+    """Write each register as ``<name>.json`` in the stylesheet's layout"""
+    os.makedirs(output_dir, exist_ok=True)
+    paths = []
+    for name, entries in registers.items():
+        path = os.path.join(output_dir, f'{name}.json')
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump({name: entries}, f, ensure_ascii=False, indent=2)
+        paths.append(path)
+    return paths
+
+def main():
+    parser = argparse.ArgumentParser(description="Extract entity registers from TEI files")
+    parser.add_argument("inputs", nargs="+", help="TEI XML files")
+    parser.add_argument("-o", "--output-dir", default=".")
+    args = parser.parse_args()
+
+    registers = extract_entities(args.inputs)
+    for path in write_registers(registers, args.output_dir):
+        print(f"Wrote {path}")
+    print(", ".join(f"{len(entries)} {name}" for name, entries in registers.items()))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,260 @@
+"""Static IIIF level-0 tile pyramids and responsive thumbnails for facsimiles.
+
+Each image becomes a directory laid out like an IIIF Image API 3.0 service,
+so it can be served by any static web server:
+
+* ``info.json``, the image information with width, height, tiles and sizes;
+* ``full/<w>,<h>/0/default.jpg``, downscaled copies for ``srcset``;
+* ``<x>,<y>,<w>,<h>/<tw>,<th>/0/default.jpg``, the tiles of every scale
+  factor down to a single tile.
+
+The page shows a thumbnail first and the viewer fetches only the tiles in
+view when zooming (see js/viewer.js). Images are tiled in a process pool;
+a manifest with their content hashes lets later runs skip unchanged ones.
+Image ids are file names, so ``X.png`` and ``X.jpg`` get separate pyramids;
+the ``id`` in info.json must be absolute, hence the base URL the tile
+directory is deployed at. Requires Pillow (``pip install Pillow``).
+
+    python facsimile_tiles.py data/*.png -o output/facsimiles \
+        --base-url https://example.org/facsimiles
+"""
+import argparse
+import hashlib
+import json
+import math
+import os
+import shutil
+from concurrent.futures import ProcessPoolExecutor
+from html import escape
+from pathlib import Path
+from typing import Callable, Dict, List, NamedTuple, Optional, Tuple
+from urllib.parse import quote, urlsplit
+
+try:
+    from PIL import Image, ImageOps
+except ImportError:  # only needed to make pyramids
+    Image = ImageOps = None
+
+MANIFEST_NAME = 'facsimiles.json'
+MANIFEST_VERSION = 1
+TILE_SIZE = 512
+THUMBNAIL_WIDTHS = (256, 512, 1024)
+JPEG_QUALITY = 85
+IIIF_CONTEXT = 'http://iiif.io/api/image/3/context.json'
+
+class Facsimile(NamedTuple):
+    """A tiled image as a page sees it; ``url`` is the image service directory."""
+    url: str
+    width: int
+    height: int
+    sizes: Tuple[Tuple[int, int], ...]
+
+    @property
+    def info_url(self) -> str:
+        return f'{self.url}/info.json'
+
+    def size_url(self, width: int, height: int) -> str:
+        return f'{self.url}/full/{width},{height}/0/default.jpg'
+
+    def moved(self, prefix: str) -> 'Facsimile':
+        """This facsimile as seen from a page ``prefix`` away from the tile root"""
+        return self._replace(url=f'{prefix}/{self.url}')
+
+    def img_html(self, alt: str, lazy: bool = True) -> str:
+        """An <img> with the smallest size as src and all sizes in srcset"""
+        candidates = ', '.join(f'{escape(self.size_url(w, h))} {w}w' for w, h in self.sizes)
+        return (f'<img src="{escape(self.size_url(*self.sizes[0]))}" srcset="{candidates}" '
+                f'sizes="(min-width: 1200px) 33vw, 100vw" '
+                f'width="{self.width}" height="{self.height}" alt="{escape(alt)}" '
+                f'class="zoomable-image" data-iiif="{escape(self.info_url)}"'
+                + (' loading="lazy">' if lazy else '>'))
+
+def require_pillow():
+    if Image is None:
+        raise ImportError("Tiling facsimiles requires Pillow: pip install Pillow")
+
+def file_sha256(path) -> str:
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def service_id(base_url: str, image_id: str) -> str:
+    """The absolute IIIF id of an image tiled below ``base_url``"""
+    parts = urlsplit(base_url)
+    if not (parts.scheme and parts.netloc):
+        raise ValueError(f"IIIF ids must be absolute, got base URL {base_url!r}")
+    return f"{base_url.rstrip('/')}/{quote(image_id)}"
+
+def scale_factors(width: int, height: int, tile_size: int = TILE_SIZE) -> List[int]:
+    """Powers of two from full resolution down to the first that fits one tile"""
+    factors = [1]
+    while max(width, height) > tile_size * factors[-1]:
+        factors.append(factors[-1] * 2)
+    return factors
+
+def _save(image, path: Path):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    image.save(path, 'JPEG', quality=JPEG_QUALITY, optimize=True)
+
+def make_pyramid(source: str, dest: str, image_service_id: str, tile_size: int = TILE_SIZE,
+                 thumbnail_widths: Tuple[int, ...] = THUMBNAIL_WIDTHS) -> Dict:
+    """Process-pool worker: write the tiles, sizes and info.json for one image.
+
+    Each scale level is downscaled once and cut into tiles, rather than
+    resampling every tile from the master. Returns the info.json data.
+    """
+    require_pillow()
+    dest = Path(dest)
+    if dest.exists():
+        shutil.rmtree(dest)
+    with Image.open(source) as opened:
+        image = ImageOps.exif_transpose(opened)
+        if image.mode not in ('RGB', 'L'):
+            image = image.convert('RGB')
+        width, height = image.size
+        factors = scale_factors(width, height, tile_size)
+
+        for factor in factors:
+            level = image if factor == 1 else image.reduce(factor)
+            region = tile_size * factor
+            for y in range(0, height, region):
+                for x in range(0, width, region):
+                    region_w, region_h = min(region, width - x), min(region, height - y)
+                    tile_w, tile_h = math.ceil(region_w / factor), math.ceil(region_h / factor)
+                    left, top = x // factor, y // factor
+                    tile = level.crop((left, top, left + tile_w, top + tile_h))
+                    _save(tile, dest / f'{x},{y},{region_w},{region_h}' / f'{tile_w},{tile_h}'
+                          / '0' / 'default.jpg')
+
+        # The smallest level doubles as the first size, so clients asking
+        # for the whole image at that size get a file too.
+        widths = {math.ceil(width / factors[-1])}
+        widths.update(w for w in thumbnail_widths if w < width)
+        sizes = []
+        for w in sorted(widths):
+            h = max(1, round(height * w / width))
+            _save(image.resize((w, h), Image.LANCZOS),
+                  dest / 'full' / f'{w},{h}' / '0' / 'default.jpg')
+            sizes.append({'width': w, 'height': h})
+
+    info = {
+        '@context': IIIF_CONTEXT,
+        'id': image_service_id,
+        'type': 'ImageService3',
+        'protocol': 'http://iiif.io/api/image',
+        'profile': 'level0',
+        'width': width,
+        'height': height,
+        'sizes': sizes,
+        'tiles': [{'width': tile_size, 'scaleFactors': factors}],
+    }
+    with open(dest / 'info.json', 'w', encoding='utf-8') as f:
+        json.dump(info, f, indent=1)
+    return info
+
+def _set_id(info_path: Path, image_service_id: str):
+    with open(info_path, encoding='utf-8') as f:
+        info = json.load(f)
+    info['id'] = image_service_id
+    with open(info_path, 'w', encoding='utf-8') as f:
+        json.dump(info, f, indent=1)
+
+def _facsimile(image_id: str, info: Dict) -> Facsimile:
+    return Facsimile(image_id, info['width'], info['height'],
+                     tuple((size['width'], size['height']) for size in info['sizes']))
+
+def tile_images(images: Dict[str, str], output_dir, base_url: str, tile_size: int = TILE_SIZE,
+                thumbnail_widths: Tuple[int, ...] = THUMBNAIL_WIDTHS, jobs: Optional[int] = None,
+                force: bool = False, hasher: Callable[[Path], str] = None
+                ) -> Tuple[Dict[str, Facsimile], Dict[str, list]]:
+    """Tile ``images`` (image id -> file) into ``output_dir/<image id>/``.
+
+    ``base_url`` is where ``output_dir`` is deployed; it makes the ids in
+    info.json absolute. Images whose content hash and settings match the
+    manifest are skipped (only their info.json is rewritten if the base URL
+    changed), pyramids of images no longer listed are removed. ``hasher`` defaults to
+    file_sha256. Returns the facsimiles, with URLs relative to
+    ``output_dir``, and the ids that were tiled and removed.
+    """
+    require_pillow()
+    ids = {image_id: service_id(base_url, image_id) for image_id in images}
+    output_dir = Path(output_dir)
+    output_dir.mkdir(parents=True, exist_ok=True)
+    hasher = hasher or file_sha256
+    settings = {'tile_size': tile_size, 'thumbnail_widths': list(thumbnail_widths)}
+    old = {}
+    if not force:
+        try:
+            with open(output_dir / MANIFEST_NAME, encoding='utf-8') as f:
+                old = json.load(f)
+        except (OSError, ValueError):
+            pass
+    old_images = (old.get('images', {}) if old.get('version') == MANIFEST_VERSION
+                  and old.get('settings') == settings else {})
+
+    entries: Dict[str, Dict] = {}
+    pending = []
+    for image_id, source in images.items():
+        sha256 = hasher(Path(source))
+        entry = old_images.get(image_id)
+        if entry and entry['sha256'] == sha256 and (output_dir / image_id / 'info.json').exists():
+            entries[image_id] = entry
+            if entry.get('id') != ids[image_id]:
+                _set_id(output_dir / image_id / 'info.json', ids[image_id])
+                entry['id'] = ids[image_id]
+        else:
+            entries[image_id] = {'sha256': sha256, 'id': ids[image_id]}
+            pending.append((image_id, source))
+
+    args = ([str(source) for _, source in pending],
+            [str(output_dir / image_id) for image_id, _ in pending],
+            [ids[image_id] for image_id, _ in pending],
+            [tile_size] * len(pending), [tuple(thumbnail_widths)] * len(pending))
+    if jobs == 1 or len(pending) <= 1:
+        infos = list(map(make_pyramid, *args))
+    else:
+        with ProcessPoolExecutor(max_workers=jobs) as pool:
+            infos = list(pool.map(make_pyramid, *args))
+    for (image_id, _), info in zip(pending, infos):
+        entries[image_id].update(width=info['width'], height=info['height'], sizes=info['sizes'])
+
+    removed = []
+    for image_id in set(old.get('images', {})) - set(entries):
+        shutil.rmtree(output_dir / image_id, ignore_errors=True)
+        removed.append(image_id)
+
+    tmp_path = output_dir / (MANIFEST_NAME + '.tmp')
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump({'version': MANIFEST_VERSION, 'settings': settings, 'images': entries}, f,
+                  indent=1, sort_keys=True)
+    os.replace(tmp_path, output_dir / MANIFEST_NAME)
+    facsimiles = {image_id: _facsimile(image_id, entry) for image_id, entry in entries.items()}
+    return facsimiles, {'tiled': [image_id for image_id, _ in pending], 'removed': removed}
+
+def main():
+    parser = argparse.ArgumentParser(description='Make IIIF level-0 tile pyramids for facsimiles')
+    parser.add_argument('images', nargs='+')
+    parser.add_argument('-o', '--output-dir', required=True)
+    parser.add_argument('--base-url', required=True,
+                        help='Absolute URL the output directory is served at')
+    parser.add_argument('-j', '--jobs', type=int, default=None,
+                        help='Worker processes (default: all cores)')
+    parser.add_argument('--tile-size', type=int, default=TILE_SIZE)
+    parser.add_argument('--force', action='store_true', help='Ignore the manifest')
+    args = parser.parse_args()
+
+    images = {}
+    for image in args.images:
+        name = Path(image).name
+        if name in images:
+            parser.error(f"{images[name]} and {image} would share the pyramid {name}")
+        images[name] = image
+    _, changes = tile_images(images, args.output_dir, args.base_url, tile_size=args.tile_size, jobs=args.jobs,
+                             force=args.force)
+    print(f"{len(changes['tiled'])} tiled, {len(images) - len(changes['tiled'])} unchanged, "
+          f"{len(changes['removed'])} removed")
+
+if __name__ == "__main__":
+    main()
@@ -11,11 +11,11 @@ document.addEventListener('DOMContentLoaded', function() {
   // Initialize Table of Contents scrolling
   initializeTOCScroll();
 
-  // Placeholder for entity data
-  let entityData = {};
-
-  // Load entity data from external JSON files
-  loadEntityData();
+  // Entity data, filled in as registers or shards are loaded
+  const entityData = {};
+  const entityRequests = {};
+  const manifestUrl = document.getElementById('text-content').dataset.entityManifest;
+  let entityManifest = null;
 
   // Function to initialize entity filters
   function initializeEntityFilters() {
@@ -39,12 +39,13 @@ document.addEventListener('DOMContentLoaded', function() {
       if (target.matches('.person-name, .place-name, .flora-name, .fauna-name, .zoological-name')) {
         const entityId = target.getAttribute('data-id');
         const entityType = getEntityTypeFromClass(target.classList);
-        const entityInfo = getEntityInfo(entityId, entityType);
-        if (entityInfo) {
-          showEntityInfoModal(entityInfo);
-        } else {
-          alert('No additional information available for this entity.');
-        }
+        getEntityInfo(entityId, entityType).then(function(entityInfo) {
+          if (entityInfo) {
+            showEntityInfoModal(entityInfo);
+          } else {
+            alert('No additional information available for this entity.');
+          }
+        });
       }
     });
   }
@@ -59,31 +60,54 @@ document.addEventListener('DOMContentLoaded', function() {
     return null;
   }
 
-  // Function to load entity data
-  function loadEntityData() {
-    // Load entity data from JSON files
-    Promise.all([
-      fetch('persons.json').then(response => response.json()),
-      fetch('places.json').then(response => response.json()),
-      fetch('flora.json').then(response => response.json()),
-      fetch('fauna.json').then(response => response.json()),
-      fetch('zoological.json').then(response => response.json())
-    ]).then(([personsData, placesData, floraData, faunaData, zoologicalData]) => {
-      entityData.persons = personsData.persons;
-      entityData.places = placesData.places;
-      entityData.flora = floraData.flora;
-      entityData.fauna = faunaData.fauna;
-      entityData.zoological = zoologicalData.zoological;
-    }).catch(error => console.error('Error loading entity data:', error));
+  // Function to load the page's entity manifest (see entity_bundles.py),
+  // which says which register shard holds each entity the page mentions
+  function loadEntityManifest() {
+    if (!entityManifest) {
+      const base = new URL(manifestUrl, document.baseURI);
+      entityManifest = fetch(base).then(response => response.json()).then(manifest => {
+        manifest.shardUrls = manifest.shards.map(shard => new URL(shard, base).href);
+        return manifest;
+      }).catch(error => {
+        entityManifest = null;
+        console.error('Error loading entity manifest:', error);
+        return null;
+      });
+    }
+    return entityManifest;
   }
 
-  // Function to get entity information
+  // Function to load a register or shard once, merging its entries of one type
+  function loadEntityData(url, type) {
+    if (!entityRequests[url]) {
+      entityRequests[url] = fetch(url).then(response => response.json()).then(data => {
+        entityData[type] = Object.assign(entityData[type] || {}, data[type]);
+      }).catch(error => {
+        delete entityRequests[url];
+        console.error('Error loading entity data:', error);
+      });
+    }
+    return entityRequests[url];
+  }
+
+  // Function to get entity information; resolves to null if there is none.
+  // Only the shard (or without a manifest, the register) of the clicked
+  // entity's type is fetched, the first time it is needed.
   function getEntityInfo(id, type) {
-    if (entityData[type] && entityData[type][id]) {
-      return entityData[type][id];
-    } else {
-      return null;
+    const known = () => (entityData[type] && entityData[type][id]) || null;
+    if (known() || !type) {
+      return Promise.resolve(known());
+    }
+    if (!manifestUrl) {
+      return loadEntityData(type + '.json', type).then(known);
     }
+    return loadEntityManifest().then(manifest => {
+      const shard = manifest && manifest.entities[type] && manifest.entities[type][id];
+      if (shard === undefined) {
+        return null;
+      }
+      return loadEntityData(manifest.shardUrls[shard], type).then(known);
+    });
   }
 
   // Function to display entity information in a modal
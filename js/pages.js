@@ -0,0 +1,62 @@
+// Lazy page loading for paginated shells (tei_to_html.py convert_pages):
+// page fragments and their notes are fetched as they near the viewport.
+
+(function() {
+    const textContent = document.getElementById('text-content');
+    if (!textContent || !textContent.querySelector('section.page')) {
+        return;
+    }
+    const noteSections = {
+        'footnote': 'footnotes',
+        'editorial-note': 'editorial-notes',
+        'apparatus-entry': 'apparatus-entries'
+    };
+
+    // Resolves once the page's text is in; search (viewer.js) waits on it
+    function loadPage(section) {
+        if (section.pageLoaded) {
+            return section.pageLoaded;
+        }
+        observer.unobserve(section);
+        section.pageLoaded = fetch(section.dataset.fragment).then(response => response.text())
+            .then(html => {
+                section.innerHTML = html;
+                section.style.minHeight = '';
+            });
+        if (section.dataset.notes) {
+            fetch(section.dataset.notes).then(response => response.text()).then(html => {
+                const holder = document.createElement('div');
+                holder.innerHTML = html;
+                Array.from(holder.children).forEach(entry => {
+                    const kind = Object.keys(noteSections).find(name => entry.classList.contains(name));
+                    if (kind) {
+                        document.getElementById(noteSections[kind]).appendChild(entry);
+                    }
+                });
+            });
+        }
+        return section.pageLoaded;
+    }
+    window.loadPage = loadPage;
+
+    // Load pages shortly before they scroll into view
+    const observer = new IntersectionObserver(entries => {
+        entries.forEach(entry => {
+            if (entry.isIntersecting) {
+                loadPage(entry.target);
+            }
+        });
+    }, {rootMargin: '100% 0px'});
+    textContent.querySelectorAll('section.page').forEach(section => observer.observe(section));
+
+    // Note markers arrive with their page, so listen on the container
+    textContent.addEventListener('click', e => {
+        const marker = e.target.closest('[data-target]');
+        const target = marker && document.getElementById(marker.dataset.target);
+        if (target) {
+            document.querySelectorAll('.highlighted').forEach(el => el.classList.remove('highlighted'));
+            target.classList.add('highlighted');
+            target.scrollIntoView({behavior: 'smooth', block: 'center'});
+        }
+    });
+})();
@@ -0,0 +1,426 @@
+// Viewer for pages written by tei_to_html.py: facsimile zoom (deep zoom
+// for tiled facsimiles), note highlighting, apparatus filtering, entity
+// lookups and full-text search.
+
+document.addEventListener('DOMContentLoaded', function() {
+    // Enhanced image viewer functionality
+    let scale = 1;
+    window.zoomIn = function() {
+        scale *= 1.2;
+        updateZoom();
+    };
+    window.zoomOut = function() {
+        scale /= 1.2;
+        updateZoom();
+    };
+    window.resetZoom = function() {
+        scale = 1;
+        updateZoom();
+    };
+    function updateZoom() {
+        document.querySelectorAll('.facsimile img:not([data-iiif])').forEach(img => {
+            img.style.transform = `scale(${scale})`;
+        });
+        tiledImages.forEach(image => image.zoom(scale));
+    }
+
+    // Tiled facsimiles (facsimile_tiles.py) are enlarged in their figure,
+    // which scrolls, and covered with the tiles in view at the resolution
+    // the zoom needs. The thumbnail underneath shows until they arrive.
+    function TiledImage(img) {
+        this.img = img;
+        this.figure = img.closest('figure');
+        this.infoUrl = new URL(img.dataset.iiif, document.baseURI);
+        this.info = null;
+        this.tiles = {};
+        this.layer = document.createElement('div');
+        this.layer.style.cssText = 'position: absolute; pointer-events: none; overflow: hidden';
+        this.figure.style.position = 'relative';
+        this.figure.appendChild(this.layer);
+        this.figure.addEventListener('scroll', () => this.update(), {passive: true});
+    }
+
+    TiledImage.prototype.zoom = function(scale) {
+        if (!this.baseWidth) {
+            this.baseWidth = this.img.getBoundingClientRect().width;
+        }
+        this.figure.style.overflow = scale > 1 ? 'auto' : '';
+        this.img.style.maxWidth = scale > 1 ? 'none' : '';
+        this.img.style.width = scale > 1 ? `${this.baseWidth * scale}px` : '';
+        this.update();
+    };
+
+    TiledImage.prototype.update = function() {
+        const rect = this.img.getBoundingClientRect();
+        if (!rect.width || !this.baseWidth || (!this.info && rect.width <= this.baseWidth)) {
+            return;
+        }
+        if (!this.info) {
+            if (!this.loading) {
+                this.loading = fetch(this.infoUrl).then(response => response.json()).then(info => {
+                    this.info = info;
+                    this.update();
+                });
+            }
+            return;
+        }
+        const info = this.info;
+        const layer = this.layer;
+        layer.style.left = `${this.img.offsetLeft}px`;
+        layer.style.top = `${this.img.offsetTop}px`;
+        layer.style.width = `${this.img.offsetWidth}px`;
+        layer.style.height = `${this.img.offsetHeight}px`;
+
+        // Coarsest scale factor that still has a pixel per screen pixel
+        const pixelsPerPixel = info.width / (rect.width * window.devicePixelRatio);
+        const factors = info.tiles[0].scaleFactors;
+        const factor = factors.filter(f => f <= pixelsPerPixel).pop() || factors[0];
+        const region = info.tiles[0].width * factor;
+
+        // Visible part of the image, in image pixels
+        const view = this.figure.getBoundingClientRect();
+        const ratio = info.width / rect.width;
+        const left = Math.max(0, (Math.max(view.left, 0) - rect.left) * ratio);
+        const top = Math.max(0, (Math.max(view.top, 0) - rect.top) * ratio);
+        const right = Math.min(info.width,
+            (Math.min(view.right, window.innerWidth) - rect.left) * ratio);
+        const bottom = Math.min(info.height,
+            (Math.min(view.bottom, window.innerHeight) - rect.top) * ratio);
+
+        Object.values(this.tiles).forEach(tile => {
+            tile.style.display = tile.dataset.factor == factor ? '' : 'none';
+        });
+        for (let y = Math.floor(top / region) * region; y < bottom; y += region) {
+            for (let x = Math.floor(left / region) * region; x < right; x += region) {
+                const key = `${factor}:${x},${y}`;
+                if (this.tiles[key]) {
+                    continue;
+                }
+                const w = Math.min(region, info.width - x);
+                const h = Math.min(region, info.height - y);
+                const tile = document.createElement('img');
+                tile.alt = '';
+                tile.dataset.factor = factor;
+                tile.src = new URL(`${x},${y},${w},${h}/${Math.ceil(w / factor)},` +
+                                   `${Math.ceil(h / factor)}/0/default.jpg`, this.infoUrl);
+                // Percentages keep tiles in place when the zoom changes
+                tile.style.cssText = `position: absolute; left: ${x / info.width * 100}%; ` +
+                    `top: ${y / info.height * 100}%; width: ${w / info.width * 100}%; ` +
+                    `height: ${h / info.height * 100}%`;
+                layer.appendChild(tile);
+                this.tiles[key] = tile;
+            }
+        }
+    };
+
+    const tiledImages = Array.from(document.querySelectorAll('.facsimile img[data-iiif]'))
+        .map(img => new TiledImage(img));
+    window.addEventListener('scroll', () => tiledImages.forEach(image => image.update()),
+                            {passive: true});
+
+    // Enhanced text highlighting
+    document.querySelectorAll('[data-target]').forEach(item => {
+        item.addEventListener('click', e => {
+            const targetId = e.currentTarget.getAttribute('data-target');
+            const targetElement = document.getElementById(targetId);
+            if (targetElement) {
+                // Remove previous highlights
+                document.querySelectorAll('.highlighted').forEach(el => {
+                    el.classList.remove('highlighted');
+                });
+                // Add new highlight
+                targetElement.classList.add('highlighted');
+                targetElement.scrollIntoView({behavior: 'smooth', block: 'center'});
+            }
+        });
+    });
+
+    // Apparatus filtering
+    document.getElementById('apparatus-filter').addEventListener('change', function(e) {
+        const filter = e.target.value;
+        const sections = {
+            'footnotes': document.getElementById('footnotes'),
+            'editorial': document.getElementById('editorial-notes'),
+            'variants': document.getElementById('apparatus-entries')
+        };
+
+        if (filter === 'all') {
+            Object.values(sections).forEach(section => {
+                section.style.display = 'block';
+            });
+        } else {
+            Object.entries(sections).forEach(([key, section]) => {
+                section.style.display = key === filter ? 'block' : 'none';
+            });
+        }
+    });
+
+    // Entity lookups: the page's manifest (entity_bundles.py) says which
+    // register shard holds each entity it mentions; a shard is fetched the
+    // first time one of its entities is clicked.
+    const entityClasses = {
+        'person-name': 'persons',
+        'place-name': 'places',
+        'flora-name': 'flora',
+        'fauna-name': 'fauna',
+        'zoological-name': 'zoological'
+    };
+    const entitySelector = Object.keys(entityClasses).map(name => `.${name}[data-id]`).join(', ');
+    const entityText = document.getElementById('text-content');
+    const manifestUrl = entityText.dataset.entityManifest;
+    const entityData = {};
+    const shardRequests = {};
+    let entityManifest = null;
+    let entityInfo = null;
+
+    function loadEntityManifest() {
+        if (!entityManifest) {
+            const base = new URL(manifestUrl, document.baseURI);
+            entityManifest = fetch(base).then(response => response.json()).then(manifest => {
+                manifest.shardUrls = manifest.shards.map(shard => new URL(shard, base).href);
+                return manifest;
+            }).catch(error => {
+                entityManifest = null;
+                console.error('Error loading entity manifest:', error);
+                return null;
+            });
+        }
+        return entityManifest;
+    }
+
+    function loadShard(url, type) {
+        if (!shardRequests[url]) {
+            shardRequests[url] = fetch(url).then(response => response.json()).then(shard => {
+                entityData[type] = Object.assign(entityData[type] || {}, shard[type]);
+            }).catch(error => {
+                delete shardRequests[url];
+                console.error('Error loading entity data:', error);
+            });
+        }
+        return shardRequests[url];
+    }
+
+    // Resolves to the register entry, or null if the entity has none
+    function getEntityInfo(id, type) {
+        const known = () => (entityData[type] && entityData[type][id]) || null;
+        if (known()) {
+            return Promise.resolve(known());
+        }
+        return loadEntityManifest().then(manifest => {
+            const shard = manifest && manifest.entities[type] && manifest.entities[type][id];
+            if (shard === undefined) {
+                return null;
+            }
+            return loadShard(manifest.shardUrls[shard], type).then(known);
+        });
+    }
+
+    function showEntityInfo(span, info) {
+        if (!entityInfo) {
+            entityInfo = document.createElement('aside');
+            entityInfo.className = 'entity-info';
+            entityInfo.style.cssText = 'position: absolute; z-index: 10; max-width: 24em; ' +
+                'padding: 0.5em 0.75em; background: #fff; border: 1px solid #ccc; ' +
+                'box-shadow: 0 2px 6px rgba(0, 0, 0, 0.2)';
+            document.body.appendChild(entityInfo);
+        }
+        entityInfo.replaceChildren();
+        const name = document.createElement('strong');
+        name.textContent = info ? info.name || span.dataset.id : span.textContent;
+        entityInfo.appendChild(name);
+        const details = info ? [
+            [info.birth, info.death].filter(Boolean).join('–'),
+            info.occupation,
+            info.note || info.description
+        ] : ['No additional information available for this entity.'];
+        details.filter(Boolean).forEach(text => {
+            const line = document.createElement('p');
+            line.style.margin = '0.25em 0 0';
+            line.textContent = text;
+            entityInfo.appendChild(line);
+        });
+        const rect = span.getBoundingClientRect();
+        entityInfo.style.left = `${rect.left + window.scrollX}px`;
+        entityInfo.style.top = `${rect.bottom + window.scrollY + 4}px`;
+        entityInfo.hidden = false;
+    }
+
+    if (manifestUrl) {
+        // Delegated, so entities on lazily loaded pages work too
+        entityText.addEventListener('click', e => {
+            const span = e.target.closest(entitySelector);
+            if (!span) {
+                return;
+            }
+            const type = entityClasses[Array.from(span.classList).find(name => entityClasses[name])];
+            getEntityInfo(span.dataset.id, type).then(info => showEntityInfo(span, info));
+        });
+        document.addEventListener('click', e => {
+            if (entityInfo && !e.target.closest(`${entitySelector}, .entity-info`)) {
+                entityInfo.hidden = true;
+            }
+        });
+    }
+
+    // Text search: look terms up in the prebuilt index and
+    // highlight the hits by character offset
+    const searchInput = document.getElementById('search');
+    const textContent = document.getElementById('text-content');
+    const indexUrl = textContent.dataset.searchIndex;
+    const shardCache = {};
+    let searchIndex = null;
+    let searchTimeout;
+
+    function normalizeTerm(token) {
+        return token.toLowerCase().normalize('NFKD').replace(/\p{M}/gu, '');
+    }
+
+    function fetchJson(url) {
+        return fetch(new URL(url, document.baseURI)).then(response => response.json());
+    }
+
+    function loadIndex() {
+        if (!searchIndex) {
+            searchIndex = fetchJson(indexUrl).then(index => {
+                index.base = new URL(indexUrl, document.baseURI);
+                return index;
+            });
+        }
+        return searchIndex;
+    }
+
+    function shardTerms(index, term) {
+        if (index.terms) {
+            return Promise.resolve([index.terms]);
+        }
+        const keys = Object.keys(index.shards).filter(key =>
+            key.startsWith(term) || term.startsWith(key));
+        return Promise.all(keys.map(key => {
+            if (!shardCache[key]) {
+                shardCache[key] = fetchJson(new URL(index.shards[key], index.base))
+                    .then(shard => shard.terms);
+            }
+            return shardCache[key];
+        }));
+    }
+
+    function decode(encoded) {
+        const hits = [];
+        let position = 0, offset = 0;
+        for (let i = 0; i < encoded.length; i += 4) {
+            position += encoded[i];
+            offset += encoded[i + 1];
+            hits.push({position: position, offset: offset, length: encoded[i + 2],
+                       anchor: encoded[i + 3]});
+        }
+        return hits;
+    }
+
+    function termHits(index, term, prefix) {
+        return shardTerms(index, term).then(shards => {
+            const hits = [];
+            shards.forEach(terms => {
+                Object.keys(terms).forEach(key => {
+                    if (key === term || (prefix && key.startsWith(term))) {
+                        decode(terms[key]).forEach(hit => hits.push(hit));
+                    }
+                });
+            });
+            return hits;
+        });
+    }
+
+    function search(query) {
+        const terms = (query.match(/[\p{L}\p{N}_]+/gu) || []).map(normalizeTerm);
+        if (!terms.length) {
+            return Promise.resolve([]);
+        }
+        return loadIndex().then(index => Promise.all(terms.map((term, i) =>
+            termHits(index, term, i === terms.length - 1)
+        ))).then(groups => {
+            // Keep hits in anchors that contain every term
+            const common = groups.map(hits => new Set(hits.map(hit => hit.anchor)))
+                .reduce((a, b) => new Set([...a].filter(anchor => b.has(anchor))));
+            return groups.flat().filter(hit => common.has(hit.anchor))
+                .sort((a, b) => a.offset - b.offset);
+        });
+    }
+
+    function clearHighlights() {
+        textContent.querySelectorAll('mark.search-hit').forEach(mark => {
+            const parent = mark.parentNode;
+            parent.replaceChild(document.createTextNode(mark.textContent), mark);
+            parent.normalize();
+        });
+    }
+
+    // Wrap hits in <mark>s; offsets count from the start of root's text
+    function highlightIn(root, hits, base) {
+        const walker = document.createTreeWalker(root, NodeFilter.SHOW_TEXT);
+        const ranges = [];
+        let node = walker.nextNode(), nodeStart = base, i = 0;
+        while (node && i < hits.length) {
+            const nodeEnd = nodeStart + node.data.length;
+            if (hits[i].offset >= nodeEnd) {
+                nodeStart = nodeEnd;
+                node = walker.nextNode();
+                continue;
+            }
+            const range = document.createRange();
+            const start = Math.max(0, hits[i].offset - nodeStart);
+            range.setStart(node, start);
+            range.setEnd(node, Math.min(node.data.length, start + hits[i].length));
+            ranges.push(range);
+            i++;
+        }
+        // Wrap from the end so earlier ranges stay valid
+        ranges.reverse().forEach(range => {
+            const mark = document.createElement('mark');
+            mark.className = 'search-hit';
+            range.surroundContents(mark);
+        });
+    }
+
+    function highlight(hits) {
+        // Paginated shells: hits are counted over all pages, and each page
+        // records where its text starts; load just the pages with hits.
+        const sections = Array.from(textContent.querySelectorAll('section.page[data-text-offset]'));
+        if (!sections.length) {
+            highlightIn(textContent, hits, 0);
+            return Promise.resolve();
+        }
+        const byPage = new Map();
+        hits.forEach(hit => {
+            const section = sections.filter(s => Number(s.dataset.textOffset) <= hit.offset).pop();
+            if (!byPage.has(section)) {
+                byPage.set(section, []);
+            }
+            byPage.get(section).push(hit);
+        });
+        return Promise.all(Array.from(byPage.keys()).map(section => window.loadPage(section)))
+            .then(() => byPage.forEach((pageHits, section) =>
+                highlightIn(section, pageHits, Number(section.dataset.textOffset))));
+    }
+
+    if (!indexUrl) {
+        searchInput.disabled = true;
+    }
+    searchInput.addEventListener('input', function(e) {
+        clearTimeout(searchTimeout);
+        searchTimeout = setTimeout(() => {
+            const query = e.target.value;
+            search(query).then(hits => {
+                if (query !== searchInput.value) {
+                    return;
+                }
+                clearHighlights();
+                return highlight(hits.slice(0, 500)).then(() => {
+                    const first = textContent.querySelector('mark.search-hit');
+                    if (first && query === searchInput.value) {
+                        first.scrollIntoView({behavior: 'smooth', block: 'center'});
+                    }
+                });
+            });
+        }, 150);
+    });
+});
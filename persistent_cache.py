@@ -0,0 +1,167 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+from dataclasses import asdict, dataclass
+from typing import Any, Optional
+
+# Returned by PersistentCache.get() on a miss, so that a cached None
+# ("no match") can be told apart from "not cached".
+MISSING = object()
+
+@dataclass
+class CacheStats:
+    hits: int = 0
+    misses: int = 0
+    expired: int = 0
+    evictions: int = 0
+    writes: int = 0
+
+    @property
+    def hit_rate(self) -> float:
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0.0
+
+    def as_dict(self) -> dict:
+        return dict(asdict(self), hit_rate=round(self.hit_rate, 4))
+
+class PersistentCache:
+    """SQLite-backed key/value cache with TTL and LRU eviction.
+
+    Values are stored as JSON. ``None`` is a valid value and is used for
+    negative caching ("the service had no answer"); it can be given its own
+    TTL so that misses are retried sooner than hits. Each namespace holds at
+    most ``max_entries`` rows; when that is exceeded, the least recently used
+    tenth is evicted. Several caches can share one database file by using
+    different namespaces. Instances are safe to share between threads.
+
+    Writes are cheap because each instance keeps two things to itself until
+    its next write or close(): the access times of its hits (so lookups never
+    take the database write lock), and an estimate of the namespace size
+    (its count at open plus its own inserts). When several processes share a
+    file, the LRU order therefore lags by their unflushed hits, and the
+    estimate misses the others' inserts and evictions. It is re-read from
+    SQLite when it passes ``max_entries`` and after every tenth of
+    ``max_entries`` own inserts, and rows are only evicted by that count, so
+    a shared namespace exceeds ``max_entries`` by at most a tenth per writer.
+    """
+
+    def __init__(self, path: str, namespace: str = 'default', ttl: Optional[float] = 30 * 86400,
+                 negative_ttl: Optional[float] = None, max_entries: int = 100_000):
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.path = path
+        self.namespace = namespace
+        self.ttl = ttl
+        self.negative_ttl = ttl if negative_ttl is None else negative_ttl
+        self.max_entries = max_entries
+        self.stats = CacheStats()
+        self._lock = threading.Lock()
+        self._accessed = {}
+        self.conn = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.execute('PRAGMA synchronous=NORMAL')
+        self.conn.execute(
+            'CREATE TABLE IF NOT EXISTS cache ('
+            ' namespace TEXT NOT NULL, key TEXT NOT NULL, value TEXT,'
+            ' created REAL NOT NULL, accessed REAL NOT NULL,'
+            ' PRIMARY KEY (namespace, key))'
+        )
+        self.conn.execute('CREATE INDEX IF NOT EXISTS cache_lru ON cache (namespace, accessed)')
+        self.conn.commit()
+        self._size = self._count()
+        self._inserts_since_count = 0
+
+    def _count(self) -> int:
+        return self.conn.execute(
+            'SELECT COUNT(*) FROM cache WHERE namespace = ?', (self.namespace,)).fetchone()[0]
+
+    def get(self, key: str) -> Any:
+        with self._lock:
+            return self._get(key)
+
+    def _get(self, key: str) -> Any:
+        row = self.conn.execute(
+            'SELECT value, created FROM cache WHERE namespace = ? AND key = ?',
+            (self.namespace, key)).fetchone()
+        if row is None:
+            self.stats.misses += 1
+            return MISSING
+        value, created = row
+        now = time.time()
+        ttl = self.negative_ttl if value is None else self.ttl
+        if ttl is not None and now - created > ttl:
+            self.stats.expired += 1
+            self.stats.misses += 1
+            return MISSING
+        # Access times are buffered and written with the next write or close(),
+        # so lookups never hold a write lock on the database.
+        self._accessed[key] = now
+        self.stats.hits += 1
+        return None if value is None else json.loads(value)
+
+    def set(self, key: str, value: Any):
+        with self._lock:
+            self._set(key, value)
+
+    def _flush_accessed(self):
+        if self._accessed:
+            self.conn.executemany(
+                'UPDATE cache SET accessed = ? WHERE namespace = ? AND key = ?',
+                [(accessed, self.namespace, key) for key, accessed in self._accessed.items()])
+            self._accessed.clear()
+
+    def _set(self, key: str, value: Any):
+        self._flush_accessed()
+        now = time.time()
+        stored = None if value is None else json.dumps(value, ensure_ascii=False)
+        cursor = self.conn.execute(
+            'UPDATE cache SET value = ?, created = ?, accessed = ? WHERE namespace = ? AND key = ?',
+            (stored, now, now, self.namespace, key))
+        if cursor.rowcount == 0:
+            self.conn.execute('INSERT INTO cache VALUES (?, ?, ?, ?, ?)',
+                              (self.namespace, key, stored, now, now))
+            self._size += 1
+            self._inserts_since_count += 1
+        self.stats.writes += 1
+        if (self._size > self.max_entries
+                or self._inserts_since_count >= max(1, self.max_entries // 10)):
+            # Other processes may have inserted or evicted since we counted
+            self._size = self._count()
+            self._inserts_since_count = 0
+            if self._size > self.max_entries:
+                self._evict(self._size - int(self.max_entries * 0.9))
+        self.conn.commit()
+
+    def _evict(self, count: int):
+        evicted = self.conn.execute(
+            'DELETE FROM cache WHERE rowid IN ('
+            ' SELECT rowid FROM cache WHERE namespace = ? ORDER BY accessed LIMIT ?)',
+            (self.namespace, count)).rowcount
+        self._size -= evicted
+        self.stats.evictions += evicted
+
+    def clear(self):
+        with self._lock:
+            self._accessed.clear()
+            self.conn.execute('DELETE FROM cache WHERE namespace = ?', (self.namespace,))
+            self.conn.commit()
+            self._size = 0
+
+    def __len__(self) -> int:
+        with self._lock:
+            self._size = self._count()
+            return self._size
+
+    def close(self):
+        with self._lock:
+            self._flush_accessed()
+            self.conn.commit()
+            self.conn.close()
+
+    def __enter__(self) -> 'PersistentCache':
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
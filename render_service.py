@@ -0,0 +1,400 @@
+"""Long-running local HTTP service that renders TEI previews.
+
+    python render_service.py --port 8770
+
+The service keeps one warm converter and listens on localhost only:
+
+* ``POST /render`` takes a TEI document as the request body and returns the
+  HTML edition. ``?images=a.png,b.png`` names the facsimile images.
+* ``GET /render/<etag>`` returns an earlier rendering again, e.g. for a
+  preview frame that reloads.
+* ``GET /assets/<file>`` serves the stylesheet and viewer bundles the
+  previews link to, built at startup (see static_assets.py).
+* ``GET /images/<file>`` serves facsimiles from the image directory
+  (``--images``, default: the working directory).
+* ``GET /metrics`` returns cache hit rates and render latencies as JSON.
+
+Previews link assets and images by absolute path, so they look the same
+whichever of the two render URLs they were loaded from.
+
+Renderings are cached twice: in memory (LRU, bounded in bytes) and on disk
+in a PersistentCache. The key is a hash of the converter fingerprint, the
+image names and the input, so a changed converter never serves stale HTML.
+The key doubles as the ETag. Rendering is a pure function of the request,
+so ``POST /render`` honours If-None-Match as well and answers 304 without
+converting.
+"""
+import argparse
+import asyncio
+import hashlib
+import json
+import mimetypes
+import time
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from http import HTTPStatus
+from pathlib import Path
+from typing import Deque, Dict, List, Optional, Sequence, Tuple
+from urllib.parse import parse_qs, quote, unquote, urlsplit
+
+from corpus_build import converter_fingerprint, viewer_scripts
+from persistent_cache import MISSING, PersistentCache
+from static_assets import build_bundles, relocate
+from tei_to_html import ConversionJob, TEItoHTMLConverter
+
+DEFAULT_PORT = 8770
+ASSET_PREFIX = '/assets'
+IMAGE_PREFIX = '/images'
+MAX_BODY_BYTES = 64 * 1024 * 1024
+# Latency samples kept for the percentiles in /metrics
+LATENCY_SAMPLES = 1000
+WARM_UP_TEI = (b'<TEI xmlns="http://www.tei-c.org/ns/1.0"><teiHeader><fileDesc><titleStmt>'
+               b'<title>warm-up</title></titleStmt></fileDesc></teiHeader>'
+               b'<text><body><p>warm-up</p></body></text></TEI>')
+
+class HTTPError(Exception):
+    def __init__(self, status: HTTPStatus, message: str = ''):
+        super().__init__(message or status.phrase)
+        self.status = status
+
+class MemoryLRU:
+    """Rendered pages by key, evicting the least recently used beyond ``max_bytes``."""
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self.size = 0
+        self._entries: 'OrderedDict[str, bytes]' = OrderedDict()
+
+    def get(self, key: str) -> Optional[bytes]:
+        value = self._entries.get(key)
+        if value is not None:
+            self._entries.move_to_end(key)
+        return value
+
+    def put(self, key: str, value: bytes):
+        if len(value) > self.max_bytes:
+            return
+        old = self._entries.pop(key, None)
+        if old is not None:
+            self.size -= len(old)
+        self._entries[key] = value
+        self.size += len(value)
+        while self.size > self.max_bytes:
+            _, evicted = self._entries.popitem(last=False)
+            self.size -= len(evicted)
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+def latency_summary(samples: Deque[float]) -> Dict:
+    """Count, mean and percentiles in milliseconds"""
+    if not samples:
+        return {'count': 0}
+    ordered = sorted(samples)
+    def percentile(p: float) -> float:
+        return round(ordered[min(len(ordered) - 1, int(p * len(ordered)))] * 1000, 3)
+    return {
+        'count': len(ordered),
+        'mean_ms': round(sum(ordered) / len(ordered) * 1000, 3),
+        'p50_ms': percentile(0.5),
+        'p95_ms': percentile(0.95),
+        'max_ms': round(ordered[-1] * 1000, 3),
+    }
+
+@dataclass
+class ServiceMetrics:
+    requests: int = 0
+    memory_hits: int = 0
+    disk_hits: int = 0
+    misses: int = 0
+    not_modified: int = 0
+    errors: int = 0
+    render_seconds: Deque[float] = field(default_factory=lambda: deque(maxlen=LATENCY_SAMPLES))
+    response_seconds: Deque[float] = field(default_factory=lambda: deque(maxlen=LATENCY_SAMPLES))
+
+    @property
+    def hit_rate(self) -> float:
+        lookups = self.memory_hits + self.disk_hits + self.misses
+        return (self.memory_hits + self.disk_hits) / lookups if lookups else 0.0
+
+    def as_dict(self) -> Dict:
+        return {
+            'requests': self.requests,
+            'memory_hits': self.memory_hits,
+            'disk_hits': self.disk_hits,
+            'misses': self.misses,
+            'not_modified': self.not_modified,
+            'errors': self.errors,
+            'hit_rate': round(self.hit_rate, 4),
+            'render_latency': latency_summary(self.render_seconds),
+            'response_latency': latency_summary(self.response_seconds),
+        }
+
+class RenderService:
+    """Serves renderings from the caches, converting on a miss.
+
+    Conversions run on a thread pool so that cache hits are answered while
+    a document renders; concurrent requests for the same key share one
+    conversion.
+    """
+
+    def __init__(self, cache_path: Optional[str] = '.cache/render.sqlite',
+                 memory_bytes: int = 64 * 1024 * 1024, disk_entries: int = 2000,
+                 workers: int = 2, converter: TEItoHTMLConverter = None,
+                 stylesheets: Sequence[str] = ('styles.css',),
+                 asset_dir: str = '.cache/render-assets', image_dir: str = '.'):
+        self.converter = converter if converter is not None else TEItoHTMLConverter()
+        self.fingerprint = converter_fingerprint()
+        self.asset_dir = Path(asset_dir)
+        self.image_dir = Path(image_dir).resolve()
+        bundles, _ = build_bundles(self.asset_dir, stylesheets, viewer_scripts())
+        self.assets = relocate(bundles, ASSET_PREFIX)
+        self.memory = MemoryLRU(memory_bytes)
+        self.disk = (PersistentCache(cache_path, namespace='render', ttl=None,
+                                     max_entries=disk_entries) if cache_path else None)
+        self.metrics = ServiceMetrics()
+        self.executor = ThreadPoolExecutor(workers, thread_name_prefix='render')
+        self._pending: Dict[str, asyncio.Future] = {}
+
+    def cache_key(self, tei: bytes, image_files: List[str]) -> str:
+        digest = hashlib.sha256(self.fingerprint.encode())
+        # Bundle names carry their content hash
+        digest.update('\0'.join(self.assets.stylesheets + self.assets.scripts).encode('utf-8'))
+        digest.update(b'\0\0' + '\0'.join(image_files).encode('utf-8') + b'\0\0')
+        digest.update(tei)
+        return digest.hexdigest()
+
+    def warm_up(self):
+        """Render a tiny document so the first preview doesn't pay for lazy setup."""
+        self.converter.convert_job(ConversionJob(WARM_UP_TEI))
+
+    def _load(self, key: str, job: Optional[ConversionJob]) -> Tuple[Optional[bytes], str, float]:
+        """Disk lookup, then conversion; runs on the executor."""
+        if self.disk is not None:
+            html = self.disk.get(key)
+            if html is not MISSING:
+                return html.encode('utf-8'), 'disk', 0.0
+        if job is None:
+            return None, 'miss', 0.0
+        start = time.perf_counter()
+        result = self.converter.convert_job(job)
+        elapsed = time.perf_counter() - start
+        if result.error:
+            raise HTTPError(HTTPStatus.UNPROCESSABLE_ENTITY, result.error)
+        if self.disk is not None:
+            self.disk.set(key, result.html)
+        return result.html.encode('utf-8'), 'miss', elapsed
+
+    async def rendering(self, key: str, job: Optional[ConversionJob] = None) -> Tuple[bytes, str]:
+        """The HTML for ``key`` and where it came from (memory, disk or miss).
+
+        Without a ``job`` only the caches are consulted.
+        """
+        html = self.memory.get(key)
+        if html is not None:
+            self.metrics.memory_hits += 1
+            return html, 'memory'
+        pending = self._pending.get(key)
+        if pending is None:
+            loop = asyncio.get_running_loop()
+            pending = self._pending[key] = loop.run_in_executor(self.executor, self._load, key, job)
+            pending.add_done_callback(lambda _: self._pending.pop(key, None))
+        html, source, elapsed = await asyncio.shield(pending)
+        if html is None:
+            raise HTTPError(HTTPStatus.NOT_FOUND, f'No rendering cached for {key}')
+        if source == 'disk':
+            self.metrics.disk_hits += 1
+        else:
+            self.metrics.misses += 1
+            if elapsed:
+                self.metrics.render_seconds.append(elapsed)
+        self.memory.put(key, html)
+        return html, source
+
+    async def static_file(self, root: Path, name: str, cache_control: str
+                          ) -> Tuple[HTTPStatus, Dict[str, str], bytes]:
+        """A file below ``root``; names that lead outside it are not found."""
+        path = (root / unquote(name)).resolve()
+        if root.resolve() not in path.parents or not path.is_file():
+            raise HTTPError(HTTPStatus.NOT_FOUND)
+        data = await asyncio.get_running_loop().run_in_executor(self.executor, path.read_bytes)
+        content_type = mimetypes.guess_type(path.name)[0] or 'application/octet-stream'
+        return HTTPStatus.OK, {'Content-Type': content_type, 'Cache-Control': cache_control}, data
+
+    def metrics_dict(self) -> Dict:
+        return dict(self.metrics.as_dict(), memory_entries=len(self.memory),
+                    memory_bytes=self.memory.size,
+                    disk_entries=len(self.disk) if self.disk is not None else 0)
+
+    async def respond(self, method: str, target: str, headers: Dict[str, str],
+                      body: bytes) -> Tuple[HTTPStatus, Dict[str, str], bytes]:
+        url = urlsplit(target)
+        for prefix, root, cache_control in (
+                (ASSET_PREFIX, self.asset_dir, 'public, max-age=31536000, immutable'),
+                (IMAGE_PREFIX, self.image_dir, 'no-cache')):
+            if url.path.startswith(prefix + '/'):
+                if method not in ('GET', 'HEAD'):
+                    raise HTTPError(HTTPStatus.METHOD_NOT_ALLOWED)
+                return await self.static_file(root, url.path[len(prefix) + 1:], cache_control)
+        if url.path == '/metrics':
+            if method != 'GET':
+                raise HTTPError(HTTPStatus.METHOD_NOT_ALLOWED)
+            return (HTTPStatus.OK, {'Content-Type': 'application/json'},
+                    json.dumps(self.metrics_dict(), indent=2).encode('utf-8'))
+        if url.path == '/render':
+            if method != 'POST':
+                raise HTTPError(HTTPStatus.METHOD_NOT_ALLOWED)
+            if not body:
+                raise HTTPError(HTTPStatus.BAD_REQUEST, 'Send the TEI document as the request body')
+            images = parse_qs(url.query).get('images', [''])[-1]
+            image_files = [f'{IMAGE_PREFIX}/{quote(name)}' for name in images.split(',') if name]
+            key = self.cache_key(body, image_files)
+            job = ConversionJob(body, image_files, assets=self.assets)
+        elif url.path.startswith('/render/'):
+            if method != 'GET':
+                raise HTTPError(HTTPStatus.METHOD_NOT_ALLOWED)
+            key, job = url.path[len('/render/'):], None
+        else:
+            raise HTTPError(HTTPStatus.NOT_FOUND)
+
+        etag = f'"{key}"'
+        cache_headers = {'ETag': etag, 'Cache-Control': 'no-cache'}
+        if etag_matches(headers.get('if-none-match', ''), etag):
+            self.metrics.not_modified += 1
+            return HTTPStatus.NOT_MODIFIED, cache_headers, b''
+        html, source = await self.rendering(key, job)
+        return (HTTPStatus.OK, dict(cache_headers, **{'Content-Type': 'text/html; charset=utf-8',
+                                                      'X-Cache': source}), html)
+
+    async def handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            while True:
+                try:
+                    request = await read_request(reader)
+                except HTTPError as e:
+                    writer.write(encode_response(e.status, {'Connection': 'close'},
+                                                 str(e).encode('utf-8')))
+                    break
+                if request is None:
+                    break
+                start = time.perf_counter()
+                method, target, headers, body, keep_alive = request
+                self.metrics.requests += 1
+                try:
+                    status, response_headers, payload = await self.respond(method, target,
+                                                                           headers, body)
+                except HTTPError as e:
+                    self.metrics.errors += 1
+                    status, response_headers, payload = (
+                        e.status, {'Content-Type': 'text/plain; charset=utf-8'},
+                        str(e).encode('utf-8'))
+                if not keep_alive:
+                    response_headers['Connection'] = 'close'
+                writer.write(encode_response(status, response_headers,
+                                             b'' if method == 'HEAD' else payload))
+                await writer.drain()
+                self.metrics.response_seconds.append(time.perf_counter() - start)
+                if not keep_alive:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    async def serve(self, host: str = '127.0.0.1', port: int = DEFAULT_PORT):
+        server = await asyncio.start_server(self.handle, host, port)
+        address = server.sockets[0].getsockname()
+        print(f"Rendering TEI on http://{address[0]}:{address[1]}/render "
+              f"(metrics at /metrics)")
+        async with server:
+            await server.serve_forever()
+
+    def close(self):
+        self.executor.shutdown()
+        if self.disk is not None:
+            self.disk.close()
+
+def etag_matches(if_none_match: str, etag: str) -> bool:
+    """Whether an If-None-Match header lists ``etag`` (weak comparison) or is ``*``"""
+    for candidate in if_none_match.split(','):
+        candidate = candidate.strip()
+        if candidate == '*' or candidate.removeprefix('W/') == etag:
+            return True
+    return False
+
+async def read_request(reader: asyncio.StreamReader):
+    """Method, target, lower-cased headers, body and keep-alive flag; None at EOF."""
+    line = await reader.readline()
+    if not line.strip():
+        return None
+    try:
+        method, target, version = line.decode('latin-1').split()
+    except ValueError:
+        raise HTTPError(HTTPStatus.BAD_REQUEST, 'Malformed request line')
+    headers = {}
+    while True:
+        line = await reader.readline()
+        if line in (b'\r\n', b'\n', b''):
+            break
+        name, _, value = line.decode('latin-1').partition(':')
+        headers[name.strip().lower()] = value.strip()
+    if 'chunked' in headers.get('transfer-encoding', '').lower():
+        raise HTTPError(HTTPStatus.LENGTH_REQUIRED, 'Send a Content-Length instead of chunks')
+    try:
+        length = int(headers.get('content-length') or 0)
+    except ValueError:
+        length = -1
+    if length < 0:
+        raise HTTPError(HTTPStatus.BAD_REQUEST, 'Malformed Content-Length')
+    if length > MAX_BODY_BYTES:
+        raise HTTPError(HTTPStatus.REQUEST_ENTITY_TOO_LARGE)
+    body = await reader.readexactly(length) if length else b''
+    connection = headers.get('connection', '').lower()
+    keep_alive = connection != 'close' if version == 'HTTP/1.1' else connection == 'keep-alive'
+    return method.upper(), target, headers, body, keep_alive
+
+def encode_response(status: HTTPStatus, headers: Dict[str, str], body: bytes) -> bytes:
+    lines = [f'HTTP/1.1 {status.value} {status.phrase}']
+    lines += [f'{name}: {value}' for name, value in headers.items()]
+    lines.append(f'Content-Length: {len(body)}')
+    return ('\r\n'.join(lines) + '\r\n\r\n').encode('latin-1') + body
+
+def run(host: str = '127.0.0.1', port: int = DEFAULT_PORT, **options):
+    service = RenderService(**options)
+    service.warm_up()
+    try:
+        asyncio.run(service.serve(host, port))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        service.close()
+
+def add_arguments(parser: argparse.ArgumentParser):
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=DEFAULT_PORT)
+    parser.add_argument('--cache', default='.cache/render.sqlite',
+                        help="SQLite file for rendered pages ('' disables the disk cache)")
+    parser.add_argument('--memory-mb', type=float, default=64,
+                        help='Memory cache size in megabytes')
+    parser.add_argument('--disk-entries', type=int, default=2000,
+                        help='Renderings kept on disk')
+    parser.add_argument('--workers', type=int, default=2, help='Conversion threads')
+    parser.add_argument('--css', action='append',
+                        help='Stylesheet path or URL for the previews; repeatable '
+                             '(default: styles.css)')
+    parser.add_argument('--images', default='.',
+                        help='Directory the ?images= facsimiles are served from')
+
+def run_from_args(args: argparse.Namespace):
+    run(args.host, args.port, cache_path=args.cache or None,
+        memory_bytes=int(args.memory_mb * 1024 * 1024), disk_entries=args.disk_entries,
+        workers=args.workers, stylesheets=args.css or ['styles.css'], image_dir=args.images)
+
+def main():
+    parser = argparse.ArgumentParser(description='Serve TEI previews over HTTP on localhost')
+    add_arguments(parser)
+    run_from_args(parser.parse_args())
+
+if __name__ == "__main__":
+    main()
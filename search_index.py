@@ -0,0 +1,299 @@
+"""Full-text search index for converted TEI documents.
+
+The converter feeds the HTML it writes for the body into a
+``SearchIndexBuilder``, which tokenises the text exactly as the browser will
+see it (``textContent`` of ``#text-content``). Each normalised term maps to
+its postings: token position, UTF-16 character offset and length (so the
+viewer can highlight without touching ``innerHTML``) and the innermost
+element ``id`` enclosing the token.
+
+On disk an index is one JSON file. Large indexes are split into shards by
+term prefix; the JSON file then only holds the anchors and the shard table,
+and readers (the viewer and ``SearchIndex``) load the shards they need.
+"""
+import argparse
+import json
+import os
+import re
+import shutil
+import unicodedata
+from html.parser import HTMLParser
+from pathlib import Path
+from typing import Dict, Iterable, Iterator, List, NamedTuple, Optional, Tuple
+
+INDEX_VERSION = 1
+TOKEN_RE = re.compile(r'\w+')
+# Tags that separate words even when no whitespace surrounds them.
+BLOCK_TAGS = {
+    'address', 'article', 'aside', 'blockquote', 'br', 'dd', 'div', 'dl', 'dt', 'figcaption',
+    'figure', 'footer', 'h1', 'h2', 'h3', 'h4', 'h5', 'h6', 'header', 'hr', 'li', 'main', 'ol',
+    'p', 'pre', 'section', 'table', 'td', 'th', 'tr', 'ul',
+}
+VOID_TAGS = {'area', 'base', 'br', 'col', 'embed', 'hr', 'img', 'input', 'link', 'meta',
+             'source', 'track', 'wbr'}
+# Indexes with more distinct terms than this are written as shards.
+MAX_TERMS_PER_FILE = 50_000
+SHARD_PREFIX_LENGTH = 2
+
+class Posting(NamedTuple):
+    position: int
+    offset: int
+    length: int
+    anchor: str
+
+def normalize_term(token: str) -> str:
+    """Case- and accent-insensitive form of a token (mirrored by the viewer's JS)."""
+    decomposed = unicodedata.normalize('NFKD', token.lower())
+    return ''.join(c for c in decomposed if not unicodedata.combining(c))
+
+def tokenize_query(query: str) -> List[str]:
+    return [term for term in (normalize_term(t) for t in TOKEN_RE.findall(query)) if term]
+
+def utf16_len(text: str) -> int:
+    if text.isascii():
+        return len(text)
+    return len(text) + sum(1 for c in text if ord(c) > 0xFFFF)
+
+def search_index_path(html_path) -> Path:
+    """Index file written next to an HTML file: ``doc.html`` -> ``doc.search.json``."""
+    html_path = Path(html_path)
+    return html_path.with_name(html_path.stem + '.search.json')
+
+def shard_dir(index_path) -> Path:
+    index_path = Path(index_path)
+    return index_path.with_name(index_path.name[:-len('.json')])
+
+class SearchIndexBuilder(HTMLParser):
+    """Incremental HTML tokeniser producing an inverted index.
+
+    Feed it the HTML of the document body in as many pieces as convenient,
+    then call ``index()``. Words split by inline markup (``Hum<i>boldt</i>``)
+    are indexed as one token, as they read in the browser.
+    """
+
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.terms: Dict[str, List[int]] = {}
+        self.anchors: List[str] = ['']
+        self._anchor_numbers: Dict[str, int] = {'': 0}
+        self._open: List[Tuple[str, int]] = []
+        self.text_length = 0
+        self.token_count = 0
+        self._word = ''
+        self._word_offset = 0
+        self._word_anchor = 0
+        self._word_end = -1
+
+    def _anchor(self) -> int:
+        return self._open[-1][1] if self._open else 0
+
+    def _flush_word(self):
+        if not self._word:
+            return
+        term = normalize_term(self._word)
+        if term:
+            self.terms.setdefault(term, []).extend(
+                (self.token_count, self._word_offset, utf16_len(self._word), self._word_anchor))
+            self.token_count += 1
+        self._word = ''
+
+    def handle_starttag(self, tag, attrs):
+        if tag in BLOCK_TAGS:
+            self._flush_word()
+        if tag in VOID_TAGS:
+            return
+        element_id = dict(attrs).get('id')
+        if element_id:
+            anchor = self._anchor_numbers.setdefault(element_id, len(self.anchors))
+            if anchor == len(self.anchors):
+                self.anchors.append(element_id)
+        else:
+            anchor = self._anchor()
+        self._open.append((tag, anchor))
+
+    def handle_startendtag(self, tag, attrs):
+        if tag in BLOCK_TAGS:
+            self._flush_word()
+
+    def handle_endtag(self, tag):
+        if tag in BLOCK_TAGS:
+            self._flush_word()
+        # Tolerate unclosed inline elements, as browsers do.
+        for i in range(len(self._open) - 1, -1, -1):
+            if self._open[i][0] == tag:
+                del self._open[i:]
+                break
+
+    def handle_data(self, data):
+        start = self.text_length
+        ascii_only = data.isascii()
+        word_end = None
+        for match in TOKEN_RE.finditer(data):
+            token = match.group()
+            offset = start + (match.start() if ascii_only else utf16_len(data[:match.start()]))
+            if match.start() == 0 and self._word and self._word_end == start:
+                self._word += token
+            else:
+                self._flush_word()
+                self._word = token
+                self._word_offset = offset
+                self._word_anchor = self._anchor()
+            word_end = match.end()
+        self.text_length += len(data) if ascii_only else utf16_len(data)
+        if word_end == len(data):
+            self._word_end = self.text_length
+        else:
+            self._flush_word()
+
+    def index(self) -> 'SearchIndex':
+        self.close()
+        self._flush_word()
+        return SearchIndex(self.anchors, self.terms)
+
+class SearchIndex:
+    """Inverted index of one document, in memory or loaded from disk.
+
+    ``terms`` maps each term to a flat list of (position, offset, length,
+    anchor number) quadruples in document order. Loaded sharded indexes fill
+    it lazily, one shard per looked-up prefix.
+    """
+
+    def __init__(self, anchors: List[str], terms: Dict[str, List[int]],
+                 shards: Dict[str, str] = None, base_dir: Optional[Path] = None,
+                 prefix_length: int = SHARD_PREFIX_LENGTH):
+        self.anchors = anchors
+        self.terms = terms
+        self.shards = shards
+        self.base_dir = base_dir
+        self.prefix_length = prefix_length
+        self._loaded = set()
+
+    @staticmethod
+    def _encode(postings: List[int]) -> List[int]:
+        # Positions and offsets grow, so store them as deltas.
+        encoded = list(postings)
+        for i in range(len(encoded) - 4, 0, -4):
+            encoded[i] -= encoded[i - 4]
+            encoded[i + 1] -= encoded[i - 3]
+        return encoded
+
+    @staticmethod
+    def _decode(encoded: List[int]) -> List[int]:
+        postings = list(encoded)
+        for i in range(4, len(postings), 4):
+            postings[i] += postings[i - 4]
+            postings[i + 1] += postings[i - 3]
+        return postings
+
+    def _shard_key(self, term: str) -> str:
+        return term[:self.prefix_length]
+
+    def write(self, path, max_terms: int = MAX_TERMS_PER_FILE):
+        """Write the index to ``path``, sharded by prefix beyond ``max_terms`` terms."""
+        path = Path(path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        directory = shard_dir(path)
+        if directory.exists():
+            shutil.rmtree(directory)
+        data = {'version': INDEX_VERSION, 'anchors': self.anchors}
+        if len(self.terms) <= max_terms:
+            data['terms'] = {term: self._encode(p) for term, p in sorted(self.terms.items())}
+        else:
+            groups: Dict[str, Dict[str, List[int]]] = {}
+            for term, postings in sorted(self.terms.items()):
+                groups.setdefault(self._shard_key(term), {})[term] = self._encode(postings)
+            directory.mkdir(parents=True)
+            data['prefix_length'] = self.prefix_length
+            data['shards'] = {}
+            for number, (prefix, terms) in enumerate(groups.items()):
+                name = f'{directory.name}/{number}.json'
+                with open(path.parent / name, 'w', encoding='utf-8') as f:
+                    json.dump({'terms': terms}, f, ensure_ascii=False, separators=(',', ':'))
+                data['shards'][prefix] = name
+        tmp_path = path.with_name(path.name + '.tmp')
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(data, f, ensure_ascii=False, separators=(',', ':'))
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path) -> 'SearchIndex':
+        path = Path(path)
+        with open(path, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+        if data.get('version') != INDEX_VERSION:
+            raise ValueError(f"Unsupported search index version {data.get('version')} in {path}")
+        if 'shards' in data:
+            return cls(data['anchors'], {}, data['shards'], path.parent, data['prefix_length'])
+        return cls(data['anchors'], {term: cls._decode(p) for term, p in data['terms'].items()})
+
+    def _load_shard(self, prefix: str):
+        if self.shards is None or prefix in self._loaded or prefix not in self.shards:
+            return
+        with open(self.base_dir / self.shards[prefix], 'r', encoding='utf-8') as f:
+            terms = json.load(f)['terms']
+        self.terms.update((term, self._decode(p)) for term, p in terms.items())
+        self._loaded.add(prefix)
+
+    def postings(self, term: str) -> List[Posting]:
+        """Occurrences of a normalised term, in document order"""
+        self._load_shard(self._shard_key(term))
+        flat = self.terms.get(term, [])
+        return [Posting(flat[i], flat[i + 1], flat[i + 2], self.anchors[flat[i + 3]])
+                for i in range(0, len(flat), 4)]
+
+    def terms_with_prefix(self, prefix: str) -> List[str]:
+        if self.shards is not None:
+            for shard_prefix in self.shards:
+                if shard_prefix.startswith(prefix) or prefix.startswith(shard_prefix):
+                    self._load_shard(shard_prefix)
+        return sorted(term for term in self.terms if term.startswith(prefix))
+
+    def search(self, query: str, prefix: bool = False) -> List[Posting]:
+        """Occurrences of the query terms within anchors that contain all of them.
+
+        With ``prefix`` the last query term also matches longer terms, for
+        search-as-you-type.
+        """
+        terms = tokenize_query(query)
+        if not terms:
+            return []
+        groups = [self.postings(term) for term in terms[:-1]]
+        if prefix:
+            groups.append([p for term in self.terms_with_prefix(terms[-1])
+                           for p in self.postings(term)])
+        else:
+            groups.append(self.postings(terms[-1]))
+        anchors = set.intersection(*({p.anchor for p in group} for group in groups))
+        return sorted(p for group in groups for p in group if p.anchor in anchors)
+
+def remove_index(path):
+    """Delete an index file and its shards, if present."""
+    path = Path(path)
+    if path.exists():
+        path.unlink()
+    directory = shard_dir(path)
+    if directory.exists():
+        shutil.rmtree(directory)
+
+def search_corpus(index_paths: Iterable, query: str,
+                  prefix: bool = False) -> Iterator[Tuple[str, Posting]]:
+    """(index path, posting) for every hit across several documents"""
+    for path in index_paths:
+        for posting in SearchIndex.load(path).search(query, prefix=prefix):
+            yield str(path), posting
+
+def main():
+    parser = argparse.ArgumentParser(description="Search converted documents")
+    parser.add_argument("query")
+    parser.add_argument("paths", nargs="+", help="*.search.json files or output directories")
+    parser.add_argument("--prefix", action="store_true", help="Match the last term as a prefix")
+    args = parser.parse_args()
+
+    index_paths = []
+    for path in map(Path, args.paths):
+        index_paths.extend(sorted(path.rglob('*.search.json')) if path.is_dir() else [path])
+    for path, posting in search_corpus(index_paths, args.query, prefix=args.prefix):
+        print(f"{path}\t{posting.anchor}\t{posting.position}\t{posting.offset}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,337 @@
+"""Shared, minified and content-hashed JS and CSS bundles.
+
+Instead of every page carrying its own copy of the viewer, a build writes
+one ``viewer.<hash>.js`` and one ``viewer.<hash>.css`` to ``assets/`` and
+links them from every page. The hash changes with the content, so the
+bundles can be served with far-future cache headers.
+
+Stylesheets and scripts are file paths or URLs. URLs (e.g. Bootstrap from
+a CDN) stay external links, in front of the bundle, unless ``vendor`` is
+set: then they are downloaded (and cached in ``.cache/vendor``) and bundled
+too, for offline deploys. Files a stylesheet references with ``url()``,
+such as icon fonts, are copied next to the bundle under hashed names.
+
+Pages written from the XSL stylesheets can be rewritten to use bundles as
+well:
+
+    python static_assets.py index.html -o site --vendor
+"""
+import argparse
+import hashlib
+import os
+import re
+from pathlib import Path
+from typing import Callable, Dict, List, Sequence, Tuple
+from urllib.parse import urljoin, urlsplit
+
+import requests
+
+from tei_to_html import PageAssets
+
+ASSET_DIR = 'assets'
+USER_AGENT = "telota-pe-assets/1.0 (https://github.com/chpollin/telota-pe)"
+
+CSS_URL_RE = re.compile(r'''url\(\s*(['"]?)([^'")]+)\1\s*\)''')
+SOURCE_MAP_RE = re.compile(r'^\s*(//[#@] sourceMappingURL=.*|/\*[#@] sourceMappingURL=.*\*/)\s*$',
+                           re.MULTILINE)
+STYLESHEET_LINK_RE = re.compile(
+    r'''<link\b(?=[^>]*\brel=["']stylesheet["'])[^>]*\bhref=["']([^"']+)["'][^>]*/?>''')
+SCRIPT_SRC_RE = re.compile(r'''<script\b[^>]*\bsrc=["']([^"']+)["'][^>]*>\s*</script>''')
+
+# A '/' after one of these starts a regular expression literal, not a division.
+_REGEX_PRECEDERS = set('(,=:[!&|?{};+-*%<>~^')
+_REGEX_KEYWORDS = {'return', 'typeof', 'case', 'do', 'else', 'in', 'of', 'void', 'yield',
+                   'await', 'delete', 'throw', 'new', 'instanceof'}
+# Whitespace next to these can go, except between two of '+' and '-'.
+_JS_PUNCTUATION = set('{}()[];,:=<>+-*%&|!?.~^')
+# A line break after / before these can go without changing where
+# automatic semicolon insertion applies.
+_JS_JOIN_AFTER = set('{;,([=&|?:')
+_JS_JOIN_BEFORE = set('})].,;?:')
+
+def is_url(ref: str) -> bool:
+    return urlsplit(ref).scheme in ('http', 'https') or ref.startswith('//')
+
+def hashed_name(stem: str, data: bytes, suffix: str) -> str:
+    return f'{stem}.{hashlib.sha256(data).hexdigest()[:12]}{suffix}'
+
+def _skip_string(source: str, i: int) -> int:
+    """Index after the string or template literal starting at ``i``"""
+    quote = source[i]
+    i += 1
+    while i < len(source) and source[i] != quote:
+        i += 2 if source[i] == '\\' else 1
+    return i + 1
+
+def _skip_regex(source: str, i: int) -> int:
+    """Index after the regular expression literal (and flags) starting at ``i``"""
+    i += 1
+    in_class = False
+    while i < len(source):
+        c = source[i]
+        if c == '\\':
+            i += 1
+        elif c == '[':
+            in_class = True
+        elif c == ']':
+            in_class = False
+        elif c == '/' and not in_class:
+            break
+        i += 1
+    i += 1
+    while i < len(source) and (source[i].isalnum() or source[i] == '_'):
+        i += 1
+    return i
+
+def _starts_regex(out: List[str]) -> bool:
+    text = ''.join(out[-3:]).rstrip()
+    if not text:
+        return True
+    if text[-1] in _REGEX_PRECEDERS:
+        return True
+    word = re.search(r'[\w$]+$', text)
+    return bool(word) and word.group() in _REGEX_KEYWORDS
+
+def minify_js(source: str) -> str:
+    """Strip comments and redundant whitespace from a script.
+
+    Conservative: strings, template literals and regular expressions are
+    copied verbatim, and a line break is only dropped where it cannot end a
+    statement, so automatic semicolon insertion behaves as before.
+    """
+    out: List[str] = []
+    i, n = 0, len(source)
+    while i < n:
+        c = source[i]
+        if c in '"\'`':
+            j = _skip_string(source, i)
+            out.append(source[i:j])
+            i = j
+        elif source.startswith('//', i):
+            j = source.find('\n', i)
+            i = n if j < 0 else j
+        elif source.startswith('/*', i):
+            j = source.find('*/', i + 2)
+            j = n if j < 0 else j + 2
+            out.append('\n' if '\n' in source[i:j] else ' ')
+            i = j
+        elif c == '/' and _starts_regex(out):
+            j = _skip_regex(source, i)
+            out.append(source[i:j])
+            i = j
+        elif c.isspace():
+            j = i
+            while j < n and source[j].isspace():
+                j += 1
+            out.append('\n' if '\n' in source[i:j] else ' ')
+            i = j
+        else:
+            j = i + 1
+            while j < n and not source[j].isspace() and source[j] not in '"\'`/':
+                j += 1
+            out.append(source[i:j])
+            i = j
+
+    # Merge whitespace runs (a line break wins over a space), then drop the
+    # whitespace that separates nothing.
+    tokens: List[str] = []
+    for token in out:
+        if token in (' ', '\n') and tokens and tokens[-1] in (' ', '\n'):
+            if token == '\n':
+                tokens[-1] = '\n'
+        elif token:
+            tokens.append(token)
+    result: List[str] = []
+    for k, token in enumerate(tokens):
+        if token not in (' ', '\n'):
+            result.append(token)
+            continue
+        prev = result[-1][-1] if result else ''
+        nxt = tokens[k + 1][:1] if k + 1 < len(tokens) else ''
+        if not prev or not nxt:
+            continue
+        if token == '\n':
+            if prev not in _JS_JOIN_AFTER and nxt not in _JS_JOIN_BEFORE:
+                result.append('\n')
+        elif prev not in _JS_PUNCTUATION and nxt not in _JS_PUNCTUATION or (
+                prev in '+-' and nxt in '+-'):
+            result.append(' ')
+    return ''.join(result).strip() + '\n'
+
+def minify_css(source: str) -> str:
+    """Strip comments and redundant whitespace from a stylesheet."""
+    parts = re.split(r'''("(?:[^"\\]|\\.)*"|'(?:[^'\\]|\\.)*')''', source)
+    for k in range(0, len(parts), 2):
+        text = re.sub(r'/\*.*?\*/', '', parts[k], flags=re.DOTALL)
+        text = re.sub(r'\s+', ' ', text)
+        # Not before ':', which would join a descendant selector to a pseudo-class
+        text = re.sub(r'\s*([{};,>])\s*', r'\1', text)
+        text = re.sub(r':\s+', ':', text)
+        parts[k] = text.replace(';}', '}')
+    return ''.join(parts).strip() + '\n'
+
+class AssetFetcher:
+    """Downloads CDN assets once; later builds read them from ``cache_dir``."""
+
+    def __init__(self, cache_dir: str = '.cache/vendor'):
+        self.cache_dir = Path(cache_dir)
+        self.session = requests.Session()
+        self.session.headers['User-Agent'] = USER_AGENT
+
+    def __call__(self, url: str) -> bytes:
+        if url.startswith('//'):
+            url = 'https:' + url
+        path = self.cache_dir / hashlib.sha256(url.encode('utf-8')).hexdigest()
+        if path.exists():
+            return path.read_bytes()
+        response = self.session.get(url, timeout=30)
+        response.raise_for_status()
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        tmp_path = path.with_suffix('.tmp')
+        tmp_path.write_bytes(response.content)
+        os.replace(tmp_path, path)
+        return response.content
+
+def _write_hashed(dest_dir: Path, stem: str, data: bytes, suffix: str) -> str:
+    name = hashed_name(stem, data, suffix)
+    path = dest_dir / name
+    if not path.exists():
+        tmp_path = dest_dir / (name + '.tmp')
+        tmp_path.write_bytes(data)
+        os.replace(tmp_path, path)
+    return name
+
+def _copy_css_references(css: str, base: str, dest_dir: Path, fetch: Callable[[str], bytes],
+                         written: List[str]) -> str:
+    """Copy the files ``css`` references with url() next to the bundle and point at the copies.
+
+    ``base`` is the stylesheet's path or URL. Absolute URLs in a local
+    stylesheet and data: URLs are left alone.
+    """
+    def replace(match):
+        ref = match.group(2).strip()
+        if ref.startswith(('data:', '#')) or (is_url(ref) and not is_url(base)):
+            return match.group(0)
+        url = urlsplit(ref)
+        name = os.path.basename(url.path)
+        stem, suffix = os.path.splitext(name)
+        try:
+            if is_url(base):
+                data = fetch(urljoin(base, ref))
+            else:
+                data = Path(base).parent.joinpath(url.path).read_bytes()
+        except (OSError, requests.RequestException) as e:
+            print(f"Warning: {ref} referenced by {base} not copied: {e}")
+            return match.group(0)
+        copy = _write_hashed(dest_dir, stem, data, suffix)
+        written.append(copy)
+        return f'url("{copy}' + (f'#{url.fragment}' if url.fragment else '') + '")'
+    return CSS_URL_RE.sub(replace, css)
+
+def build_bundles(dest_dir, stylesheets: Sequence[str] = (), scripts: Sequence[str] = (),
+                  vendor: bool = False, name: str = 'viewer',
+                  fetch: Callable[[str], bytes] = None) -> Tuple[PageAssets, List[str]]:
+    """Write the bundles for ``stylesheets`` and ``scripts`` to ``dest_dir``.
+
+    Local files are minified, vendored ones (already minified upstream) are
+    taken as they are. Missing local files are skipped with a warning, and
+    URLs that cannot be downloaded stay links.
+    Returns the page assets, relative to ``dest_dir`` apart from external
+    URLs, and the names of all files written.
+    """
+    dest_dir = Path(dest_dir)
+    dest_dir.mkdir(parents=True, exist_ok=True)
+    if vendor and fetch is None:
+        fetch = AssetFetcher()
+    written: List[str] = []
+    links: Dict[str, List[str]] = {}
+    for suffix, sources, minify in (('.css', stylesheets, minify_css), ('.js', scripts, minify_js)):
+        external, parts = [], []
+        for ref in sources:
+            if is_url(ref) and not vendor:
+                external.append(ref)
+                continue
+            try:
+                if is_url(ref):
+                    text = SOURCE_MAP_RE.sub('', fetch(ref).decode('utf-8'))
+                else:
+                    with open(ref, encoding='utf-8') as f:
+                        text = minify(f.read())
+            except (OSError, requests.RequestException) as e:
+                if is_url(ref):
+                    print(f"Warning: {ref} not vendored, linking it instead: {e}")
+                    external.append(ref)
+                else:
+                    print(f"Warning: {ref} not bundled: {e}")
+                continue
+            if suffix == '.css':
+                text = _copy_css_references(text, ref, dest_dir, fetch, written)
+            parts.append(text.rstrip('\n') + '\n')
+        if parts:
+            # Scripts are joined with a ';' so one ending without a semicolon
+            # cannot run into the next.
+            data = (';\n' if suffix == '.js' else '').join(parts).encode('utf-8')
+            bundle = _write_hashed(dest_dir, name, data, suffix)
+            written.append(bundle)
+            external.append(bundle)
+        links[suffix] = external
+    return PageAssets(tuple(links['.css']), tuple(links['.js'])), written
+
+def relocate(assets: PageAssets, prefix: str) -> PageAssets:
+    """``assets`` as seen from a page ``prefix`` away from the bundle directory"""
+    def move(ref: str) -> str:
+        return ref if is_url(ref) else f'{prefix}/{ref}'
+    return PageAssets(tuple(map(move, assets.stylesheets)), tuple(map(move, assets.scripts)))
+
+def bundle_page(page: str, output_dir: str, vendor: bool = False, name: str = 'site') -> List[str]:
+    """Rewrite an HTML page to link bundles of its stylesheets and scripts.
+
+    The page is written to ``output_dir``, the bundles to its ``assets/``.
+    The first stylesheet link and the first external script are replaced by
+    the bundle links, the others removed; inline scripts stay where they
+    are. Returns the names of the files written to ``assets/``.
+    """
+    with open(page, encoding='utf-8') as f:
+        html = f.read()
+    base = os.path.dirname(os.path.abspath(page))
+    def resolve(ref: str) -> str:
+        return ref if is_url(ref) else os.path.join(base, urlsplit(ref).path)
+    stylesheets = [resolve(ref) for ref in STYLESHEET_LINK_RE.findall(html)]
+    scripts = [resolve(ref) for ref in SCRIPT_SRC_RE.findall(html)]
+    assets, written = build_bundles(Path(output_dir) / ASSET_DIR, stylesheets, scripts,
+                                    vendor=vendor, name=name)
+    assets = relocate(assets, ASSET_DIR)
+
+    def replace_all(pattern: re.Pattern, tags: List[str], text: str) -> str:
+        first = True
+        def replace(match):
+            nonlocal first
+            if not first:
+                return ''
+            first = False
+            return '\n'.join(tags)
+        return pattern.sub(replace, text)
+    html = replace_all(STYLESHEET_LINK_RE, [f'<link rel="stylesheet" href="{ref}">'
+                                            for ref in assets.stylesheets], html)
+    html = replace_all(SCRIPT_SRC_RE, [f'<script src="{ref}"></script>'
+                                       for ref in assets.scripts], html)
+    os.makedirs(output_dir, exist_ok=True)
+    with open(os.path.join(output_dir, os.path.basename(page)), 'w', encoding='utf-8') as f:
+        f.write(html)
+    return written
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Rewrite HTML pages to link minified, content-hashed asset bundles')
+    parser.add_argument('pages', nargs='+', help='HTML pages, e.g. index.html from the XSL')
+    parser.add_argument('-o', '--output-dir', required=True)
+    parser.add_argument('--vendor', action='store_true',
+                        help='Download CDN assets into the bundles for offline use')
+    args = parser.parse_args()
+
+    for page in args.pages:
+        written = bundle_page(page, args.output_dir, vendor=args.vendor)
+        print(f"{page}: {', '.join(written) or 'no assets'}")
+
+if __name__ == "__main__":
+    main()
@@ -5,6 +5,10 @@
     exclude-result-prefixes="tei"
     version="1.0">
     
+    <!-- Optional entity manifest (entity_bundles.py); without it main.js
+         fetches a register the first time one of its entities is clicked -->
+    <xsl:param name="entity-manifest" select="''"/>
+    
     <!-- Identity template -->
     <xsl:template match="@* | node()">
         <xsl:copy>
@@ -93,6 +97,11 @@
                             <div class="page-indicator">Page <span id="current-page">1</span></div>
                             <!-- Text Content -->
                             <div id="text-content">
+                                <xsl:if test="$entity-manifest != ''">
+                                    <xsl:attribute name="data-entity-manifest">
+                                        <xsl:value-of select="$entity-manifest"/>
+                                    </xsl:attribute>
+                                </xsl:if>
                                 <xsl:apply-templates select="tei:text/tei:body"/>
                             </div>
                         </main>
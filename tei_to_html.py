@@ -1,22 +1,409 @@
+import argparse
 from bs4 import BeautifulSoup
+from bs4.element import NavigableString, Tag
+from lxml import etree
+import io
+import json
 import re
-from typing import Dict, List
-import uuid
+import tempfile
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+from functools import lru_cache, partial
+from html import escape
+from typing import (IO, Callable, Dict, Iterable, Iterator, List, NamedTuple, Optional, Tuple,
+                    Union)
 import os
 import shutil
+import time
+
+from conversion_profiler import ConversionProfiler, output_size
+from entity_index import OccurrenceCollector
+from facsimile_tiles import Facsimile
+from search_index import SearchIndex, SearchIndexBuilder, search_index_path
+
+# Bump when the HTML produced for unchanged input changes.
+CONVERTER_VERSION = '8'
+
+XML_NS = '{http://www.w3.org/XML/1998/namespace}'
+
+# Viewer scripts, in load order. Pages inline them by default; corpus builds
+# link a shared bundle instead (see static_assets.py).
+VIEWER_SCRIPT, PAGE_LOADER_SCRIPT = 'js/viewer.js', 'js/pages.js'
+VIEWER_SCRIPTS = (VIEWER_SCRIPT, PAGE_LOADER_SCRIPT)
+
+class Rule(NamedTuple):
+    # Called as handler(converter, element, ctx); per-document state such
+    # as notes and the current page lives in ctx, a ConversionContext.
+    handler: Callable
+    # Container rules return an (open, close) pair and leave the children to
+    # the converter; all other rules render the whole element themselves.
+    # Container rules must only look at the element's attributes, since the
+    # streaming converter calls them before the children have been parsed.
+    container: bool = False
+
+class RuleRegistry:
+    """Dispatch table mapping TEI elements to rendering rules.
+
+    Rules are keyed by tag name and may be refined by the value of a single
+    attribute per tag (``hi/@rend``, ``note/@type``, ``list/@type``, ...).
+    Attribute values are matched token by token, so ``rend="bold italic"``
+    picks the first token that has a rule. Lookups fall back to the plain
+    tag rule, and elements without any rule just render their children.
+    """
+
+    def __init__(self):
+        self._tag_rules: Dict[str, Rule] = {}
+        self._attr_rules: Dict[str, Tuple[str, Dict[str, Rule]]] = {}
+
+    def register(self, tag: str, handler: Callable, attr: str = None,
+                 value: str = None, container: bool = False):
+        rule = Rule(handler, container)
+        if attr is None:
+            self._tag_rules[tag] = rule
+            return
+        keyed_attr, by_value = self._attr_rules.setdefault(tag, (attr, {}))
+        if keyed_attr != attr:
+            raise ValueError(f'Rules for <{tag}> are already keyed by @{keyed_attr}')
+        by_value[value] = rule
+
+    def rule(self, tag: str, attr: str = None, value: str = None, container: bool = False):
+        """Decorator form of :meth:`register`."""
+        def decorator(handler: Callable) -> Callable:
+            self.register(tag, handler, attr=attr, value=value, container=container)
+            return handler
+        return decorator
+
+    def lookup(self, element) -> Optional[Rule]:
+        keyed = self._attr_rules.get(element.name)
+        if keyed is not None:
+            attr, by_value = keyed
+            for token in element.get(attr, '').split():
+                rule = by_value.get(token)
+                if rule is not None:
+                    return rule
+        return self._tag_rules.get(element.name)
+
+    def label(self, name: str, attrs) -> str:
+        """Profiling label: the tag, plus the keyed attribute value its rule matched."""
+        keyed = self._attr_rules.get(name)
+        if keyed is not None:
+            attr, by_value = keyed
+            for token in attrs.get(attr, '').split():
+                if token in by_value:
+                    return f'{name}[@{attr}={token}]'
+        return name
+
+    def copy(self) -> 'RuleRegistry':
+        registry = RuleRegistry()
+        registry._tag_rules = dict(self._tag_rules)
+        registry._attr_rules = {
+            tag: (attr, dict(by_value)) for tag, (attr, by_value) in self._attr_rules.items()
+        }
+        return registry
+
+def ref_id(ref: str) -> str:
+    """Strip a leading '#' (or any URI part) from a TEI pointer."""
+    return ref.rsplit('#', 1)[-1]
+
+def entity_key(kind: str, name: str) -> str:
+    """Stable register key for entities that only exist as names in the text."""
+    slug = re.sub(r'\W+', '_', ' '.join(name.split()).lower()).strip('_')
+    return f'{kind}.{slug}'
+
+DEFAULT_RULES = RuleRegistry()
+
+@DEFAULT_RULES.rule('supplied')
+def _supplied(converter, element, ctx):
+    return f'<span class="supplied" title="Editorial addition">[{element.get_text()}]</span>'
+
+@DEFAULT_RULES.rule('foreign')
+def _foreign(converter, element, ctx):
+    return f'<span class="foreign" lang="{element.get("xml:lang", "")}">{element.get_text()}</span>'
+
+@DEFAULT_RULES.rule('note', attr='type', value='footnote')
+def _footnote(converter, element, ctx):
+    note_id = f'fn-{ctx.generate_id(element)}'
+    ctx.footnotes.append((note_id, element.get_text(), ctx.current_page))
+    return f'<sup class="footnote-marker" data-target="{note_id}">{len(ctx.footnotes)}</sup>'
+
+@DEFAULT_RULES.rule('note', attr='type', value='editorial')
+def _editorial_note(converter, element, ctx):
+    note_id = f'en-{ctx.generate_id(element)}'
+    ctx.editorial_notes.append((note_id, element.get_text(), ctx.current_page))
+    return f'<span class="editorial-note" data-target="{note_id}">†</span>'
+
+@DEFAULT_RULES.rule('app')
+def _app(converter, element, ctx):
+    lem = element.find('lem')
+    rdg = element.find('rdg')
+    if not (lem and rdg):
+        return None
+    app_id = f'app-{ctx.generate_id(element)}'
+    ctx.apparatus_entries.append((
+        app_id,
+        f'Lemma: {lem.get_text()}, Reading: {rdg.get_text()} ({rdg.get("type", "")}, {rdg.get("resp", "")})',
+        ctx.current_page
+    ))
+    return f'<span class="apparatus" id="{app_id}" data-type="variant">{lem.get_text()}</span>'
+
+@DEFAULT_RULES.rule('pb')
+def _pb(converter, element, ctx):
+    page_num = element.get('n', '')
+    ctx.current_page = page_num
+    return f'<div class="page-break" id="page-{page_num}">|{page_num}|</div>'
+
+@DEFAULT_RULES.rule('hi', attr='rend', value='underline', container=True)
+def _hi_underline(converter, element, ctx):
+    return '<span class="underline">', '</span>'
+
+@DEFAULT_RULES.rule('hi', attr='rend', value='italic', container=True)
+def _hi_italic(converter, element, ctx):
+    return '<span class="italic">', '</span>'
+
+@DEFAULT_RULES.rule('hi', attr='rend', value='bold', container=True)
+def _hi_bold(converter, element, ctx):
+    return '<span class="bold">', '</span>'
+
+@DEFAULT_RULES.rule('hi', attr='rend', value='superscript', container=True)
+def _hi_superscript(converter, element, ctx):
+    return '<sup>', '</sup>'
+
+@DEFAULT_RULES.rule('hi', attr='rend', value='subscript', container=True)
+def _hi_subscript(converter, element, ctx):
+    return '<sub>', '</sub>'
+
+@DEFAULT_RULES.rule('choice')
+def _choice(converter, element, ctx):
+    abbr = element.find('abbr')
+    expan = element.find('expan')
+    if abbr and expan:
+        return f'<abbr title="{expan.get_text()}" class="expansion">{abbr.get_text()}</abbr>'
+    return None
+
+@DEFAULT_RULES.rule('del', container=True)
+def _del(converter, element, ctx):
+    return '<del class="deletion">', '</del>'
+
+@DEFAULT_RULES.rule('title', container=True)
+def _title(converter, element, ctx):
+    return '<span class="title">', '</span>'
+
+@DEFAULT_RULES.rule('persName', container=True)
+def _pers_name(converter, element, ctx):
+    ref = element.get('ref')
+    if ref:
+        ctx.record_entity('persons', ref_id(ref))
+    data_id = f' data-id="{escape(ref_id(ref))}"' if ref else ''
+    return f'<span class="person person-name"{data_id}>', '</span>'
+
+@DEFAULT_RULES.rule('placeName', container=True)
+def _place_name(converter, element, ctx):
+    ref = element.get('ref')
+    if ref:
+        ctx.record_entity('places', ref_id(ref))
+    data_id = f' data-id="{escape(ref_id(ref))}"' if ref else ''
+    return f'<span class="place-name"{data_id}>', '</span>'
+
+def _named_entity(kind: str, title: str, converter, element, ctx):
+    name = element.get_text()
+    ctx.record_entity(kind, entity_key(kind, name))
+    key = escape(entity_key(kind, name))
+    return f'<span class="{kind}-name" data-id="{key}" title="{title}">{name}</span>'
+
+# partial() rather than closures, so the rules (and converters) can be
+# pickled for process pools.
+DEFAULT_RULES.register('name', partial(_named_entity, 'flora', 'Flora'),
+                       attr='type', value='flora')
+DEFAULT_RULES.register('name', partial(_named_entity, 'fauna', 'Fauna'),
+                       attr='type', value='fauna')
+DEFAULT_RULES.register('name', partial(_named_entity, 'zoological', 'Zoological Name'),
+                       attr='type', value='zoological')
+
+@DEFAULT_RULES.rule('date', container=True)
+def _date(converter, element, ctx):
+    attrs = ''.join(
+        f' {html_attr}="{escape(element[tei_attr])}"'
+        for tei_attr, html_attr in (('when', 'datetime'), ('notBefore', 'data-not-before'),
+                                    ('notAfter', 'data-not-after'))
+        if element.get(tei_attr)
+    )
+    return f'<time class="date"{attrs}>', '</time>'
+
+@DEFAULT_RULES.rule('term', container=True)
+def _term(converter, element, ctx):
+    return '<span class="term">', '</span>'
+
+@DEFAULT_RULES.rule('q', container=True)
+def _q(converter, element, ctx):
+    return '<q>', '</q>'
+
+@DEFAULT_RULES.rule('list', attr='type', value='ordered', container=True)
+def _ordered_list(converter, element, ctx):
+    if element.get('rend', '') == 'letters':
+        return '<ol class="letter-list">', '</ol>'
+    return '<ol>', '</ol>'
+
+@DEFAULT_RULES.rule('list', container=True)
+def _list(converter, element, ctx):
+    return '<ul>', '</ul>'
+
+@DEFAULT_RULES.rule('item', container=True)
+def _item(converter, element, ctx):
+    return '<li>', '</li>'
+
+@DEFAULT_RULES.rule('p', container=True)
+def _p(converter, element, ctx):
+    return '<p>', '</p>'
+
+@DEFAULT_RULES.rule('head', container=True)
+def _head(converter, element, ctx):
+    return '<h2>', '</h2>'
+
+@DEFAULT_RULES.rule('div', container=True)
+def _div(converter, element, ctx):
+    div_type = element.get('type', '')
+    n = element.get('n', '')
+    div_class = f'class="{div_type}"' if div_type else ''
+    div_id = f' id="div-{n}"' if n else ''
+    return f'<div {div_class}{div_id}>', '</div>'
+
+class ConversionContext:
+    """Per-document state of one conversion.
+
+    Rules record notes, apparatus entries, entity mentions and the current
+    page here rather than on the converter, so one configured converter can
+    convert any number of documents, also concurrently. Pass a context to
+    the ``convert*`` methods to read the search index and entity
+    references afterwards.
+    """
 
-class TEItoHTMLConverter:
     def __init__(self):
         self.footnotes = []
         self.editorial_notes = []
         self.apparatus_entries = []
         self.current_page = ""
-        self.facsimile_images = []
-        
-    def generate_id(self) -> str:
-        return str(uuid.uuid4())[:8]
+        self.id_counter = 0
+        # Set by the convert methods when a search index URL is given.
+        self.search_index: Optional[SearchIndex] = None
+        # Register name -> entity ID -> pages it is mentioned on
+        self.entity_refs: Dict[str, Dict[str, List[str]]] = {}
+        # Set by the caller to collect entity postings from the body HTML.
+        self.occurrences: Optional[OccurrenceCollector] = None
+
+    def generate_id(self, element=None) -> str:
+        """ID for an emitted anchor: the element's @xml:id, else its position.
+
+        Only called for elements that actually emit an anchor, and numbered in
+        document order, so identical input yields byte-identical HTML.
+        """
+        xml_id = element.get('xml:id') if element is not None else None
+        if xml_id:
+            return escape(xml_id)
+        self.id_counter += 1
+        return str(self.id_counter)
+
+    def record_entity(self, register: str, entity_id: str):
+        """Note a mention of a register entry on the current page."""
+        pages = self.entity_refs.setdefault(register, {}).setdefault(entity_id, [])
+        if not pages or pages[-1] != self.current_page:
+            pages.append(self.current_page)
+
+    def spool_notes(self):
+        """Collect notes in temporary files instead of lists (streaming conversions)."""
+        self.footnotes = NoteSpool()
+        self.editorial_notes = NoteSpool()
+        self.apparatus_entries = NoteSpool()
+
+    def close_spools(self):
+        for spool in (self.footnotes, self.editorial_notes, self.apparatus_entries):
+            if isinstance(spool, NoteSpool):
+                spool.close()
+        self.footnotes = []
+        self.editorial_notes = []
+        self.apparatus_entries = []
+
+    def note_entries(self, notes, css_class: str,
+                     numbered: bool = False) -> Iterator[Tuple[str, str, str]]:
+        """(id, page, HTML) per note, with the page the note occurred on.
+
+        Notes are (id, content, page) tuples; rules that append (id, content)
+        pairs get the current page.
+        """
+        for i, (id, content, *page) in enumerate(notes):
+            page = page[0] if page else self.current_page
+            label = f'{i+1}. ' if numbered else ''
+            yield id, page, f'<div id="{id}" class="{css_class}" data-page="{page}">{label}{content}</div>'
+
+    def footnote_entries(self) -> Iterator[str]:
+        return (html for _, _, html in self.note_entries(self.footnotes, 'footnote', numbered=True))
+
+    def editorial_note_entries(self) -> Iterator[str]:
+        return (html for _, _, html in self.note_entries(self.editorial_notes, 'editorial-note'))
+
+    def apparatus_entry_entries(self) -> Iterator[str]:
+        return (html for _, _, html in self.note_entries(self.apparatus_entries, 'apparatus-entry'))
+
+class PageAssets(NamedTuple):
+    """Stylesheet and script URLs a page links to, in order."""
+    stylesheets: Tuple[str, ...] = ()
+    scripts: Tuple[str, ...] = ()
+
+@lru_cache(maxsize=None)
+def read_script(name: str) -> str:
+    """A viewer script, relative to this module"""
+    with open(os.path.join(os.path.dirname(os.path.abspath(__file__)), name),
+              encoding='utf-8') as f:
+        return f.read()
+
+class ConversionJob(NamedTuple):
+    """One document for :meth:`TEItoHTMLConverter.convert_many`.
 
-    def create_html_template(self, title: str) -> str:
+    ``source`` is a file path or the TEI document as bytes.
+    """
+    source: Union[str, bytes]
+    image_files: Optional[List[str]] = None
+    search_index_url: str = ''
+    entity_manifest_url: str = ''
+    assets: Optional[PageAssets] = None
+
+class ConversionResult(NamedTuple):
+    """Outcome of one job; ``error`` is set instead of ``html`` when it failed."""
+    index: int
+    source: Optional[str]
+    html: Optional[str]
+    search_index: Optional[SearchIndex]
+    entity_refs: Dict[str, Dict[str, List[str]]]
+    error: Optional[str] = None
+
+class TEItoHTMLConverter:
+    """Renders TEI documents to HTML through a RuleRegistry.
+
+    A converter holds configuration only (rules and an optional profiler);
+    everything that belongs to one document is in its ConversionContext, so
+    a converter can be reused and shared between threads.
+    """
+
+    def __init__(self, rules: RuleRegistry = None):
+        # Each converter gets its own copy so register_rule() stays local.
+        self.rules = rules if rules is not None else DEFAULT_RULES.copy()
+        # Set by enable_profiling()
+        self.profiler: Optional[ConversionProfiler] = None
+
+    def create_html_template(self, title: str, assets: PageAssets = None,
+                             paged: bool = False) -> str:
+        """Page template with ``%s`` slots; see convert() for their order.
+
+        Without ``assets`` the page links styles.css and inlines the viewer
+        script (plus the page loader when ``paged``), so it works on its own.
+        """
+        if assets is None:
+            head = '<link rel="stylesheet" href="styles.css">'
+            scripts = '\n'.join(f'<script>\n{read_script(name)}</script>'
+                                 for name in (VIEWER_SCRIPTS if paged else (VIEWER_SCRIPT,)))
+        else:
+            head = '\n'.join(f'<link rel="stylesheet" href="{escape(url)}">'
+                              for url in assets.stylesheets)
+            scripts = '\n'.join(f'<script src="{escape(url)}"></script>'
+                                 for url in assets.scripts)
         return """
         <!DOCTYPE html>
         <html lang="de">
@@ -24,7 +411,7 @@ class TEItoHTMLConverter:
             <meta charset="UTF-8">
             <meta name="viewport" content="width=device-width, initial-scale=1.0">
             <title>%s</title>
-            <link rel="stylesheet" href="styles.css">
+            %s
         </head>
         <body>
             <div class="container">
@@ -43,7 +430,7 @@ class TEItoHTMLConverter:
                         <input type="text" id="search" placeholder="Search text...">
                         <button onclick="toggleNotes()">Toggle Notes</button>
                     </div>
-                    %s
+                    <div id="text-content" data-search-index="%s" data-entity-manifest="%s">%s</div>
                 </div>
                 <div class="apparatus">
                     <h3>Critical Apparatus</h3>
@@ -69,257 +456,652 @@ class TEItoHTMLConverter:
                     </div>
                 </div>
             </div>
-            <script>
-                document.addEventListener('DOMContentLoaded', function() {
-                    // Enhanced image viewer functionality
-                    let scale = 1;
-                    window.zoomIn = function() {
-                        scale *= 1.2;
-                        updateZoom();
-                    };
-                    window.zoomOut = function() {
-                        scale /= 1.2;
-                        updateZoom();
-                    };
-                    window.resetZoom = function() {
-                        scale = 1;
-                        updateZoom();
-                    };
-                    function updateZoom() {
-                        document.querySelectorAll('.facsimile img').forEach(img => {
-                            img.style.transform = `scale(${scale})`;
-                        });
-                    }
-
-                    // Enhanced text highlighting
-                    document.querySelectorAll('[data-target]').forEach(item => {
-                        item.addEventListener('click', e => {
-                            const targetId = e.currentTarget.getAttribute('data-target');
-                            const targetElement = document.getElementById(targetId);
-                            if (targetElement) {
-                                // Remove previous highlights
-                                document.querySelectorAll('.highlighted').forEach(el => {
-                                    el.classList.remove('highlighted');
-                                });
-                                // Add new highlight
-                                targetElement.classList.add('highlighted');
-                                targetElement.scrollIntoView({behavior: 'smooth', block: 'center'});
-                            }
-                        });
-                    });
-
-                    // Apparatus filtering
-                    document.getElementById('apparatus-filter').addEventListener('change', function(e) {
-                        const filter = e.target.value;
-                        const sections = {
-                            'footnotes': document.getElementById('footnotes'),
-                            'editorial': document.getElementById('editorial-notes'),
-                            'variants': document.getElementById('apparatus-entries')
-                        };
-                        
-                        if (filter === 'all') {
-                            Object.values(sections).forEach(section => {
-                                section.style.display = 'block';
-                            });
-                        } else {
-                            Object.entries(sections).forEach(([key, section]) => {
-                                section.style.display = key === filter ? 'block' : 'none';
-                            });
-                        }
-                    });
-
-                    // Text search functionality
-                    const searchInput = document.getElementById('search');
-                    let searchTimeout;
-                    searchInput.addEventListener('input', function(e) {
-                        clearTimeout(searchTimeout);
-                        searchTimeout = setTimeout(() => {
-                            const searchText = e.target.value.toLowerCase();
-                            const content = document.querySelector('.main-text');
-                            if (!searchText) {
-                                // Reset highlights
-                                content.innerHTML = content.innerHTML.replace(/<mark>|<\/mark>/g, '');
-                                return;
-                            }
-                            
-                            const regex = new RegExp(searchText, 'gi');
-                            content.innerHTML = content.innerHTML.replace(/<mark>|<\/mark>/g, '');
-                            content.innerHTML = content.innerHTML.replace(regex, match => `<mark>${match}</mark>`);
-                        }, 300);
-                    });
-                });
-            </script>
+            %s
         </body>
         </html>
+        """ % ('%s', head.replace('%', '%%'), '%s', '%s', '%s', '%s', '%s', '%s', '%s', '%s',
+               scripts.replace('%', '%%'))
+
+    def register_rule(self, tag: str, handler: Callable, attr: str = None,
+                      value: str = None, container: bool = False):
+        """Register a project-specific rule on this converter only."""
+        self.rules.register(tag, handler, attr=attr, value=value, container=container)
+
+    def enable_profiling(self, profiler: ConversionProfiler = None) -> ConversionProfiler:
+        """Record per-element statistics for subsequent conversions.
+
+        ``process_element`` is replaced on this instance by a profiling
+        wrapper; the streaming targets check ``self.profiler`` when created.
+        A profiling converter records into one profiler, so it must convert
+        one document at a time.
         """
+        self.profiler = profiler if profiler is not None else ConversionProfiler()
+        profiler = self.profiler
+        unprofiled = type(self).process_element.__get__(self)
+        label = self.rules.label
+
+        def process_element(element, ctx: ConversionContext) -> str:
+            if not element or isinstance(element, str):
+                return unprofiled(element, ctx)
+            profiler.enter(label(element.name, element.attrs))
+            html = unprofiled(element, ctx)
+            profiler.exit(output_size(html))
+            return html
+        self.process_element = process_element
+        return profiler
 
-    def process_element(self, element) -> str:
+    def disable_profiling(self):
+        self.profiler = None
+        self.__dict__.pop('process_element', None)
+
+    def process_element(self, element, ctx: ConversionContext) -> str:
         if not element:
             return ""
-            
+
         if isinstance(element, str):
             return element
-            
-        element_id = self.generate_id()
-        
-        if element.name == 'supplied':
-            return f'<span class="supplied" title="Editorial addition">[{element.get_text()}]</span>'
-            
-        elif element.name == 'foreign':
-            return f'<span class="foreign" lang="{element.get("xml:lang", "")}">{element.get_text()}</span>'
-            
-        elif element.name == 'note':
-            note_type = element.get('type', '')
-            if note_type == 'footnote':
-                note_id = f'fn-{element_id}'
-                self.footnotes.append((note_id, element.get_text()))
-                return f'<sup class="footnote-marker" data-target="{note_id}">{len(self.footnotes)}</sup>'
-            elif note_type == 'editorial':
-                note_id = f'en-{element_id}'
-                self.editorial_notes.append((note_id, element.get_text()))
-                return f'<span class="editorial-note" data-target="{note_id}">†</span>'
-                
-        elif element.name == 'app':
-            app_id = f'app-{element_id}'
-            lem = element.find('lem')
-            rdg = element.find('rdg')
-            if lem and rdg:
-                self.apparatus_entries.append((
-                    app_id,
-                    f'Lemma: {lem.get_text()}, Reading: {rdg.get_text()} ({rdg.get("type", "")}, {rdg.get("resp", "")})'
-                ))
-                return f'<span class="apparatus" id="{app_id}" data-type="variant">{lem.get_text()}</span>'
-                
-        elif element.name == 'pb':
-            page_num = element.get('n', '')
-            self.current_page = page_num
-            return f'<div class="page-break" id="page-{page_num}">|{page_num}|</div>'
-            
-        elif element.name == 'hi':
-            rend = element.get('rend', '')
-            if 'underline' in rend:
-                return f'<span class="underline">{self.process_children(element)}</span>'
-            elif 'italic' in rend:
-                return f'<span class="italic">{self.process_children(element)}</span>'
-            elif 'bold' in rend:
-                return f'<span class="bold">{self.process_children(element)}</span>'
-                
-        elif element.name == 'choice':
-            abbr = element.find('abbr')
-            expan = element.find('expan')
-            if abbr and expan:
-                return f'<abbr title="{expan.get_text()}" class="expansion">{abbr.get_text()}</abbr>'
-                
-        elif element.name == 'del':
-            return f'<del class="deletion">{self.process_children(element)}</del>'
-            
-        elif element.name == 'title':
-            return f'<span class="title">{self.process_children(element)}</span>'
-            
-        elif element.name == 'persName':
-            return f'<span class="person">{self.process_children(element)}</span>'
-            
-        elif element.name == 'list':
-            list_type = element.get('type', '')
-            rend = element.get('rend', '')
-            if list_type == 'ordered':
-                if rend == 'letters':
-                    return f'<ol class="letter-list">{self.process_children(element)}</ol>'
-                else:
-                    return f'<ol>{self.process_children(element)}</ol>'
-            else:
-                return f'<ul>{self.process_children(element)}</ul>'
-                
-        elif element.name == 'item':
-            return f'<li>{self.process_children(element)}</li>'
-            
-        elif element.name == 'p':
-            return f'<p>{self.process_children(element)}</p>'
-            
-        elif element.name == 'head':
-            return f'<h2>{self.process_children(element)}</h2>'
-            
-        elif element.name == 'div':
-            div_type = element.get('type', '')
-            n = element.get('n', '')
-            div_class = f'class="{div_type}"' if div_type else ''
-            div_id = f' id="div-{n}"' if n else ''
-            return f'<div {div_class}{div_id}>{self.process_children(element)}</div>'
-            
-        return self.process_children(element)
-
-    def process_children(self, element) -> str:
-        return ''.join(self.process_element(child) for child in element.children)
-
-    def process_facsimile(self, image_files: List[str]) -> str:
-        return '\n'.join(
-            f'<figure class="manuscript-page">'
-            f'<img src="{img}" alt="Manuscript page {i+1}" class="zoomable-image">'
-            f'<figcaption>Page {i+1}</figcaption>'
-            f'</figure>'
-            for i, img in enumerate(image_files)
-        )
 
-    def convert(self, xml_content: str, image_files: List[str] = None) -> str:
+        rule = self.rules.lookup(element)
+        if rule is None:
+            return self.process_children(element, ctx)
+        if rule.container:
+            open_tag, close_tag = rule.handler(self, element, ctx)
+            return f'{open_tag}{self.process_children(element, ctx)}{close_tag}'
+        html = rule.handler(self, element, ctx)
+        if html is None:
+            return self.process_children(element, ctx)
+        return html
+
+    def process_children(self, element, ctx: ConversionContext) -> str:
+        return ''.join(self.process_element(child, ctx) for child in element.children)
+
+    def facsimile_figure(self, image: Union[str, Facsimile], page: str, lazy: bool = False) -> str:
+        """A facsimile page: plain image URL, or tiled with thumbnails (see facsimile_tiles.py)"""
+        if isinstance(image, Facsimile):
+            img = image.img_html(f'Manuscript page {page}', lazy=lazy)
+        else:
+            img = (f'<img src="{escape(image)}" alt="Manuscript page {escape(page)}" '
+                   f'class="zoomable-image"' + (' loading="lazy">' if lazy else '>'))
+        return (f'<figure class="manuscript-page">{img}'
+                f'<figcaption>Page {escape(page)}</figcaption></figure>')
+
+    def process_facsimile(self, image_files: List[Union[str, Facsimile]]) -> str:
+        return '\n'.join(self.facsimile_figure(image, str(i + 1), lazy=i > 0)
+                         for i, image in enumerate(image_files))
+
+    def convert(self, xml_content: str, image_files: List[str] = None,
+                search_index_url: str = '', entity_manifest_url: str = '',
+                context: ConversionContext = None, assets: PageAssets = None) -> str:
+        """Convert a TEI document to HTML.
+
+        With ``search_index_url`` the body text is also indexed into
+        ``context.search_index``; the caller writes it to that URL (see
+        :meth:`SearchIndex.write`) and the page's search box loads it from there.
+        Entity mentions are collected in ``context.entity_refs``; the page looks
+        up their register entries through ``entity_manifest_url`` (see
+        entity_bundles.py). Without ``context`` a fresh one is used. ``assets``
+        are the shared stylesheets and scripts to link; without them the
+        viewer script is inlined (see create_html_template).
+        """
+        started = time.perf_counter()
+        ctx = context if context is not None else ConversionContext()
         soup = BeautifulSoup(xml_content, 'xml')
-        
+
         # Process main content
         body = soup.find('body')
-        main_content = self.process_element(body) if body else ""
-        
+        main_content = self.process_element(body, ctx) if body else ""
+        if search_index_url:
+            builder = SearchIndexBuilder()
+            builder.feed(main_content)
+            ctx.search_index = builder.index()
+        if ctx.occurrences is not None:
+            ctx.occurrences.feed(main_content)
+
         # Generate apparatus sections
-        footnotes_html = '\n'.join(
-            f'<div id="{id}" class="footnote" data-page="{self.current_page}">{i+1}. {content}</div>'
-            for i, (id, content) in enumerate(self.footnotes)
-        )
-        
-        editorial_notes_html = '\n'.join(
-            f'<div id="{id}" class="editorial-note" data-page="{self.current_page}">{content}</div>'
-            for id, content in self.editorial_notes
-        )
-        
-        apparatus_entries_html = '\n'.join(
-            f'<div id="{id}" class="apparatus-entry" data-page="{self.current_page}">{content}</div>'
-            for id, content in self.apparatus_entries
-        )
+        footnotes_html = '\n'.join(ctx.footnote_entries())
+        editorial_notes_html = '\n'.join(ctx.editorial_note_entries())
+        apparatus_entries_html = '\n'.join(ctx.apparatus_entry_entries())
         
         # Process facsimile images
         facsimile_html = self.process_facsimile(image_files) if image_files else ""
         
         # Fill template
         title = "Philosophische Bemerkungen"
-        template = self.create_html_template(title)
+        template = self.create_html_template(title, assets)
         html = template % (
             title,
             facsimile_html,
             title,
+            escape(search_index_url),
+            escape(entity_manifest_url),
             main_content,
             footnotes_html,
             editorial_notes_html,
             apparatus_entries_html
         )
+        if self.profiler is not None:
+            self.profiler.document_done(time.perf_counter() - started)
         
         return html
 
-def main():
+    def convert_stream(self, source: Union[str, IO[bytes]], sink: IO[str],
+                       image_files: List[str] = None, chunk_size: int = 1 << 16,
+                       search_index_url: str = '', entity_manifest_url: str = '',
+                       context: ConversionContext = None, assets: PageAssets = None):
+        """Convert a TEI file to HTML without holding either document in memory.
+
+        ``source`` is a path or a binary file object, ``sink`` anything with a
+        ``write(str)`` method. Body HTML is written as elements close; notes and
+        apparatus entries are spooled to temporary files and appended once the
+        body is done, so memory use depends on nesting depth, not file size.
+        The output is identical to :meth:`convert`, and so is the search index
+        built when ``search_index_url`` is given.
+        """
+        started = time.perf_counter()
+        ctx = context if context is not None else ConversionContext()
+        ctx.spool_notes()
+
+        facsimile_html = self.process_facsimile(image_files) if image_files else ""
+        title = "Philosophische Bemerkungen"
+        template = self.create_html_template(title, assets)
+        parts = (template % ((title, facsimile_html, title, escape(search_index_url),
+                              escape(entity_manifest_url)) + ('\0',) * 4)).split('\0')
+
+        sink.write(parts[0])
+        write = sink.write
+        builder = SearchIndexBuilder() if search_index_url else None
+        feeders = [f.feed for f in (builder, ctx.occurrences) if f is not None]
+        if feeders:
+            def write(html: str):
+                sink.write(html)
+                for feed in feeders:
+                    feed(html)
+        parser = etree.XMLParser(target=StreamingTarget(self, ctx, write), huge_tree=True)
+        if isinstance(source, str):
+            with open(source, 'rb') as f:
+                self._feed(parser, f, chunk_size)
+        else:
+            self._feed(parser, source, chunk_size)
+        parser.close()
+        if builder is not None:
+            ctx.search_index = builder.index()
+
+        for part, entries in zip(parts[1:], (ctx.footnote_entries(),
+                                             ctx.editorial_note_entries(),
+                                             ctx.apparatus_entry_entries())):
+            sink.write(part)
+            for i, entry in enumerate(entries):
+                sink.write(f'\n{entry}' if i else entry)
+        sink.write(parts[4])
+        ctx.close_spools()
+        if self.profiler is not None:
+            self.profiler.document_done(time.perf_counter() - started)
+
+    def convert_pages(self, source: Union[str, IO[bytes]], output_dir: str, stem: str,
+                      image_files: List[str] = None, chunk_size: int = 1 << 16,
+                      entity_manifest_url: str = '', context: ConversionContext = None,
+                      assets: PageAssets = None, search_index_url: str = '') -> Dict:
+        """Convert a TEI file to one HTML fragment per page and a shell page.
+
+        Writes to ``output_dir``:
+
+        * ``<stem>.pages/NNNN.html``, the body between two <pb>s, with the
+          elements open at the break closed and reopened on the next page;
+        * ``<stem>.pages/NNNN.notes.html``, the notes and apparatus entries
+          that occur on that page;
+        * ``<stem>.pages.json``, the manifest: per page its ``n``, fragment,
+          notes fragment, facsimile and note IDs;
+        * ``<stem>.html``, a shell that fetches pages as they scroll into view.
+
+        With ``search_index_url`` the text of all pages is indexed into
+        ``context.search_index``, as by :meth:`convert`; every page records
+        the offset its text starts at (``text_offset``), so the viewer
+        fetches only the pages with hits.
+
+        Text before the first <pb> becomes an extra first page unless it is
+        blank. A page's facsimile is its <pb>'s ``@facs`` URL if it has one,
+        else the image at the same position in ``image_files``; the manifest
+        lists tiled images by their info.json URL. Returns the manifest.
+        """
+        started = time.perf_counter()
+        ctx = context if context is not None else ConversionContext()
+        ctx.spool_notes()
+        image_files = image_files or []
+
+        pages_dir = os.path.join(output_dir, stem + '.pages')
+        if os.path.isdir(pages_dir):
+            shutil.rmtree(pages_dir)
+        os.makedirs(pages_dir)
+        pages: List[Dict] = []
+        page_images: List[Union[str, Facsimile, None]] = []
+        page_breaks = 0
+        current = [None]
+        builder = SearchIndexBuilder() if search_index_url else None
+        feeders = [f.feed for f in (builder, ctx.occurrences) if f is not None]
+
+        def open_page(pb: Optional[Tag]) -> Callable[[str], None]:
+            nonlocal page_breaks
+            if current[0] is not None:
+                current[0].close()
+            name = f'{len(pages):04d}'
+            facsimile = None
+            if pb is not None:
+                facs = pb.get('facs', '')
+                if facs and not facs.startswith('#'):
+                    facsimile = facs
+                elif page_breaks < len(image_files):
+                    facsimile = image_files[page_breaks]
+                page_breaks += 1
+            pages.append({
+                'n': pb.get('n', '') if pb is not None else '',
+                'fragment': f'{stem}.pages/{name}.html',
+                'notes': None,
+                'facsimile': (facsimile.info_url if isinstance(facsimile, Facsimile)
+                              else facsimile),
+                'footnotes': [],
+                'editorial_notes': [],
+                'apparatus_entries': [],
+            })
+            if builder is not None:
+                pages[-1]['text_offset'] = builder.text_length
+            page_images.append(facsimile)
+            current[0] = open(os.path.join(pages_dir, name + '.html'), 'w', encoding='utf-8')
+            if not feeders:
+                return current[0].write
+            page_file = current[0]
+
+            # Only text that ends up on a page is indexed, so blank front
+            # matter doesn't shift the offsets.
+            def write(html: str):
+                page_file.write(html)
+                for feed in feeders:
+                    feed(html)
+            return write
+
+        front_matter = io.StringIO()
+
+        def new_page(pb: Tag) -> Callable[[str], None]:
+            if not pages and re.sub(r'<[^>]*>', '', front_matter.getvalue()).strip():
+                open_page(None)(front_matter.getvalue())
+            return open_page(pb)
+
+        parser = etree.XMLParser(target=PaginatingTarget(self, ctx, front_matter.write, new_page),
+                                 huge_tree=True)
+        if isinstance(source, str):
+            with open(source, 'rb') as f:
+                self._feed(parser, f, chunk_size)
+        else:
+            self._feed(parser, source, chunk_size)
+        parser.close()
+        if not pages:
+            open_page(None)(front_matter.getvalue())
+        current[0].close()
+        if builder is not None:
+            ctx.search_index = builder.index()
+
+        # Notes are in document order, and so are pages; match them up by @n.
+        for key, notes, css_class, numbered in (
+                ('footnotes', ctx.footnotes, 'footnote', True),
+                ('editorial_notes', ctx.editorial_notes, 'editorial-note', False),
+                ('apparatus_entries', ctx.apparatus_entries, 'apparatus-entry', False)):
+            index = 0
+            for note_id, page, entry in ctx.note_entries(notes, css_class, numbered):
+                index = next((i for i in range(index, len(pages)) if pages[i]['n'] == page), index)
+                notes_name = pages[index]['fragment'][:-len('.html')] + '.notes.html'
+                with open(os.path.join(output_dir, notes_name), 'a', encoding='utf-8') as f:
+                    f.write(entry + '\n')
+                pages[index]['notes'] = notes_name
+                pages[index][key].append(note_id)
+        ctx.close_spools()
+
+        title = "Philosophische Bemerkungen"
+        manifest = {'version': 1, 'title': title, 'pages': pages}
+        with open(os.path.join(output_dir, stem + '.pages.json'), 'w', encoding='utf-8') as f:
+            json.dump(manifest, f, ensure_ascii=False, indent=1)
+
+        facsimile_html = '\n'.join(
+            self.facsimile_figure(image, page['n'], lazy=True)
+            for page, image in zip(pages, page_images) if image
+        )
+        placeholders = '\n'.join(
+            f'<section class="page" id="page-section-{i}" data-page="{escape(page["n"])}" '
+            f'data-fragment="{escape(page["fragment"])}"'
+            + (f' data-notes="{escape(page["notes"])}"' if page['notes'] else '')
+            + (f' data-text-offset="{page["text_offset"]}"' if builder is not None else '')
+            + ' style="min-height: 60vh"></section>'
+            for i, page in enumerate(pages)
+        )
+        with open(os.path.join(output_dir, stem + '.html'), 'w', encoding='utf-8') as f:
+            f.write(self.create_html_template(title, assets, paged=True) % (
+                title, facsimile_html, title, escape(search_index_url), escape(entity_manifest_url),
+                placeholders, '', '', ''))
+        if self.profiler is not None:
+            self.profiler.document_done(time.perf_counter() - started)
+        return manifest
+
+    def convert_job(self, job: ConversionJob, index: int = 0) -> ConversionResult:
+        """Convert one job in memory; a failure is reported in the result, not raised."""
+        source = job.source
+        name = None if isinstance(source, bytes) else os.fspath(source)
+        ctx = ConversionContext()
+        sink = io.StringIO()
+        try:
+            self.convert_stream(io.BytesIO(source) if name is None else name, sink,
+                                job.image_files, search_index_url=job.search_index_url,
+                                entity_manifest_url=job.entity_manifest_url, context=ctx,
+                                assets=job.assets)
+        except Exception as e:
+            return ConversionResult(index, name, None, None, {}, f'{type(e).__name__}: {e}')
+        return ConversionResult(index, name, sink.getvalue(), ctx.search_index, ctx.entity_refs)
+
+    def convert_many(self, jobs: Iterable[Union[str, bytes, ConversionJob]],
+                     executor: Union[str, Executor] = 'thread', max_workers: Optional[int] = None,
+                     ordered: bool = True) -> Iterator[ConversionResult]:
+        """Convert several documents in parallel with this converter.
+
+        ``jobs`` are paths, TEI documents as bytes, or ConversionJobs.
+        ``executor`` is ``'thread'``, ``'process'`` or an existing executor,
+        which is left running, so a long-lived service can keep one pool.
+        Use processes for CPU-bound batches: the rules are then pickled to
+        the workers, so they must be module-level functions or partials.
+        Results come in input order, or as they complete when ``ordered`` is
+        false; ``ConversionResult.index`` identifies the job either way.
+        """
+        if self.profiler is not None:
+            raise ValueError('A profiling converter can only convert one document at a time')
+        jobs = [job if isinstance(job, ConversionJob) else ConversionJob(job) for job in jobs]
+        if executor == 'thread':
+            pool, owned = ThreadPoolExecutor(max_workers), True
+        elif executor == 'process':
+            pool, owned = ProcessPoolExecutor(max_workers), True
+        elif isinstance(executor, Executor):
+            pool, owned = executor, False
+        else:
+            raise ValueError(f"executor must be 'thread', 'process' or an Executor, not {executor!r}")
+        convert = (partial(_convert_job, self) if isinstance(pool, ProcessPoolExecutor)
+                   else self.convert_job)
+        return self._results(pool, owned, convert, jobs, ordered)
+
+    @staticmethod
+    def _results(pool: Executor, owned: bool, convert: Callable, jobs: List[ConversionJob],
+                 ordered: bool) -> Iterator[ConversionResult]:
+        try:
+            if ordered:
+                yield from pool.map(convert, jobs, range(len(jobs)))
+            else:
+                futures = [pool.submit(convert, job, i) for i, job in enumerate(jobs)]
+                for future in as_completed(futures):
+                    yield future.result()
+        finally:
+            if owned:
+                pool.shutdown(cancel_futures=True)
+
+    @staticmethod
+    def _feed(parser, f: IO[bytes], chunk_size: int):
+        while True:
+            chunk = f.read(chunk_size)
+            if not chunk:
+                break
+            parser.feed(chunk)
+
+def _convert_job(converter: TEItoHTMLConverter, job: ConversionJob,
+                 index: int) -> ConversionResult:
+    """Process-pool entry point for convert_many()."""
+    return converter.convert_job(job, index)
+
+class NoteSpool:
+    """Append-only list of note tuples that spills to a temporary file."""
+
+    def __init__(self, max_size: int = 1 << 20):
+        self._file = tempfile.SpooledTemporaryFile(max_size=max_size, mode='w+', encoding='utf-8')
+        self._count = 0
+
+    def append(self, entry: tuple):
+        self._file.write(json.dumps(entry, ensure_ascii=False))
+        self._file.write('\n')
+        self._count += 1
+
+    def __len__(self) -> int:
+        return self._count
+
+    def __iter__(self) -> Iterator[tuple]:
+        self._file.seek(0)
+        try:
+            for line in self._file:
+                yield tuple(json.loads(line))
+        finally:
+            self._file.seek(0, os.SEEK_END)
+
+    def close(self):
+        self._file.close()
+
+def _local_name(tag: str) -> str:
+    return tag.rsplit('}', 1)[-1]
+
+def _attr_name(name: str) -> str:
+    # BeautifulSoup exposes xml:lang and friends under their prefixed name.
+    if name.startswith(XML_NS):
+        return 'xml:' + name[len(XML_NS):]
+    return _local_name(name)
+
+class StreamingTarget:
+    """lxml parser target that renders <body> through a converter's rules.
+
+    Container rules are applied on the start tag, with their closing tags
+    kept on a stack. Elements handled by other rules are small (notes, apps,
+    choices), so their subtree is collected into a BeautifulSoup tag and
+    handed to ``process_element`` once it is complete.
+
+    When the converter has a profiler, ``start``, ``end`` and ``write`` are
+    replaced on the instance by profiling versions.
+    """
+
+    def __init__(self, converter: TEItoHTMLConverter, ctx: ConversionContext,
+                 write: Callable[[str], None]):
+        self.converter = converter
+        self.ctx = ctx
+        self.profiler = converter.profiler
+        self.body_depth = 0
+        self.open_tags: List[str] = []
+        self.close_tags: List[str] = []
+        self.captured: List[Tag] = []
+        self.pending_text: List[str] = []
+        self.write = self.counted(write)
+        if self.profiler is not None:
+            self._unprofiled_start, self.start = self.start, self._profiled_start
+            self._unprofiled_end, self.end = self.end, self._profiled_end
+
+    def counted(self, write: Callable[[str], None]) -> Callable[[str], None]:
+        """``write``, reporting output sizes to the profiler if there is one."""
+        profiler = self.profiler
+        if profiler is None:
+            return write
+
+        def counted_write(html: str):
+            profiler.count_output(html)
+            write(html)
+        return counted_write
+
+    def _profiled_start(self, tag, attrib):
+        self.flush_text()
+        name = _local_name(tag)
+        if self.captured or not (self.body_depth or name == 'body'):
+            self._unprofiled_start(tag, attrib)
+            return
+        started, bytes_at_start = time.perf_counter(), self.profiler.bytes_written
+        self._unprofiled_start(tag, attrib)
+        # Atomic elements are profiled by process_element when emitted.
+        if not self.captured:
+            self.profiler.enter(self.converter.rules.label(name, attrib), started, bytes_at_start)
+
+    def _profiled_end(self, tag):
+        self.flush_text()
+        profiled = not self.captured and self.body_depth
+        self._unprofiled_end(tag)
+        if profiled:
+            self.profiler.exit()
+
+    def start(self, tag, attrib):
+        self.flush_text()
+        name = _local_name(tag)
+        element = Tag(name=name, attrs={_attr_name(k): v for k, v in attrib.items()})
+        if self.captured:
+            self.captured[-1].append(element)
+            self.captured.append(element)
+            return
+        if not self.body_depth:
+            if name == 'body':
+                self.body_depth = 1
+            return
+        self.body_depth += 1
+        rule = self.converter.rules.lookup(element)
+        if rule is None:
+            self.open_tags.append('')
+            self.close_tags.append('')
+        elif rule.container:
+            open_tag, close_tag = rule.handler(self.converter, element, self.ctx)
+            self.write(open_tag)
+            self.open_tags.append(open_tag)
+            self.close_tags.append(close_tag)
+        else:
+            self.captured.append(element)
+
+    def end(self, tag):
+        self.flush_text()
+        if self.captured:
+            element = self.captured.pop()
+            if not self.captured:
+                self.body_depth -= 1
+                self.emit(element)
+            return
+        if self.body_depth > 1:
+            self.open_tags.pop()
+            self.write(self.close_tags.pop())
+        if self.body_depth:
+            self.body_depth -= 1
+
+    def emit(self, element: Tag):
+        """Render a completed top-level atomic element."""
+        self.write(self.converter.process_element(element, self.ctx))
+
+    def data(self, text):
+        if self.captured or self.body_depth:
+            self.pending_text.append(text)
+
+    def flush_text(self):
+        if not self.pending_text:
+            return
+        text = ''.join(self.pending_text)
+        self.pending_text.clear()
+        # Collapse whitespace-only runs the same way BeautifulSoup does.
+        if not text.strip(' \n\t\f\r'):
+            text = '\n' if '\n' in text else ' '
+        if self.captured:
+            self.captured[-1].append(NavigableString(text))
+        else:
+            self.write(text)
+
+    def close(self):
+        pass
+
+# The id attribute of a container's start tag
+CONTAINER_ID = re.compile(r'\s+id="[^"]*"')
+
+class PaginatingTarget(StreamingTarget):
+    """StreamingTarget that starts a new output at every top-level <pb>.
+
+    At a page break the open container elements are closed, ``new_page``
+    is called with the <pb> and returns the writer for the next page, and
+    the same elements are reopened there, so every page is well-formed HTML.
+    Reopened elements lose their ``id``, which stays unique to the page the
+    element starts on, and are marked ``data-continued``.
+    """
+
+    def __init__(self, converter: TEItoHTMLConverter, ctx: ConversionContext,
+                 write: Callable[[str], None], new_page: Callable[[Tag], Callable[[str], None]]):
+        super().__init__(converter, ctx, write)
+        self.new_page = new_page
+
+    def emit(self, element: Tag):
+        if element.name == 'pb':
+            self.write(''.join(reversed(self.close_tags)))
+            self.write = self.counted(self.new_page(element))
+            self.write(''.join(map(self.continued, self.open_tags)))
+        super().emit(element)
+
+    @staticmethod
+    def continued(open_tag: str) -> str:
+        if not open_tag:
+            return open_tag
+        return CONTAINER_ID.sub('', open_tag, count=1)[:-1] + ' data-continued>'
+
+def main(argv: List[str] = None):
+    parser = argparse.ArgumentParser(description='Convert TEI XML to HTML.')
+    subparsers = parser.add_subparsers(dest='command')
+    build_parser = subparsers.add_parser(
+        'build', help='Convert a corpus, re-rendering only changed documents')
+    build_parser.add_argument('inputs', nargs='+', help='TEI files, directories or glob patterns')
+    build_parser.add_argument('-o', '--output-dir', default='output')
+    build_parser.add_argument('-j', '--jobs', type=int, default=None,
+                              help='Worker processes (default: all cores)')
+    build_parser.add_argument('--css', action='append',
+                              help='Stylesheet path or URL to bundle; repeatable '
+                                   '(default: styles.css)')
+    build_parser.add_argument('--tiles', action='store_true',
+                              help='Publish facsimiles as IIIF tile pyramids with thumbnails '
+                                   '(needs Pillow)')
+    build_parser.add_argument('--tiles-base-url', metavar='URL',
+                              help='Absolute URL the facsimiles/ directory is deployed at, '
+                                   'for the IIIF ids (required with --tiles)')
+    build_parser.add_argument('--vendor', action='store_true',
+                              help='Download stylesheets given as URLs into the bundle '
+                                   'for offline deploys')
+    build_parser.add_argument('--force', action='store_true', help='Ignore the build manifest')
+    build_parser.add_argument('--registers', help='Directory with persons.json, places.json, ... '
+                                                  'to publish as sharded entity bundles')
+    build_parser.add_argument('--paginate', action='store_true',
+                              help='Write one fragment per <pb> page behind a lazy-loading shell')
+    build_parser.add_argument('--profile', metavar='DIR',
+                              help='Profile rendered documents; write profile.json and '
+                                   'profile.folded (flame graph input) to DIR')
+    serve_parser = subparsers.add_parser(
+        'serve', help='Render TEI previews over HTTP on localhost, with a cache')
+    from render_service import add_arguments
+    add_arguments(serve_parser)
+    args = parser.parse_args(argv)
+
+    if args.command == 'serve':
+        from render_service import run_from_args
+        run_from_args(args)
+        return
+
+    if args.command == 'build':
+        if args.tiles and not args.tiles_base_url:
+            build_parser.error('--tiles needs --tiles-base-url')
+        from corpus_build import build
+        report = build(args.inputs, args.output_dir, css=args.css or 'styles.css', jobs=args.jobs,
+                       force=args.force, registers=args.registers, paginate=args.paginate,
+                       profile_dir=args.profile, vendor=args.vendor, tiles=args.tiles,
+                       tiles_base_url=args.tiles_base_url)
+        print(report.summary())
+        return
+
     # Create output directory if it doesn't exist
     output_dir = 'output'
     os.makedirs(output_dir, exist_ok=True)
 
-    # Read TEI XML file
-    with open('data/KG21III6b69.xml', 'r', encoding='utf-8') as f:
-        xml_content = f.read()
-    
     # List of facsimile images
     image_files = ['KG21III6b69-img.png']
     
-    # Convert to HTML
+    # Convert TEI XML straight to the HTML output file
     converter = TEItoHTMLConverter()
-    html_output = converter.convert(xml_content, image_files)
-    
-    # Write HTML output
-    with open(os.path.join(output_dir, 'KG21III6b69.html'), 'w', encoding='utf-8') as f:
-        f.write(html_output)
+    context = ConversionContext()
+    html_path = os.path.join(output_dir, 'KG21III6b69.html')
+    index_path = search_index_path(html_path)
+    with open(html_path, 'w', encoding='utf-8') as f:
+        converter.convert_stream('data/KG21III6b69.xml', f, image_files,
+                                 search_index_url=index_path.name, context=context)
+    context.search_index.write(index_path)
 
     # Copy CSS file to output directory
     css_source = 'styles.css'
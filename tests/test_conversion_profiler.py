@@ -0,0 +1,63 @@
+import io
+import json
+import os
+import sys
+from collections import Counter
+
+from lxml import etree
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from tei_to_html import TEItoHTMLConverter  # noqa: E402
+
+SOURCE = os.path.join(ROOT, 'data', 'o1-generated-tei.xml')
+TEI_NS = {'tei': 'http://www.tei-c.org/ns/1.0'}
+
+def body_tags():
+    body = etree.parse(SOURCE).find('.//tei:body', TEI_NS)
+    return Counter(etree.QName(e).localname for e in body.iter() if isinstance(e.tag, str))
+
+def test_profiling_does_not_change_the_output(tmp_path):
+    with open(SOURCE, encoding='utf-8') as f:
+        xml = f.read()
+    profiled = TEItoHTMLConverter()
+    profiler = profiled.enable_profiling()
+    assert profiled.convert(xml) == TEItoHTMLConverter().convert(xml)
+
+    plain_sink, profiled_sink = io.StringIO(), io.StringIO()
+    TEItoHTMLConverter().convert_stream(SOURCE, plain_sink)
+    profiled.convert_stream(SOURCE, profiled_sink)
+    assert profiled_sink.getvalue() == plain_sink.getvalue()
+
+    TEItoHTMLConverter().convert_pages(SOURCE, str(tmp_path / 'plain'), 'doc')
+    profiled.convert_pages(SOURCE, str(tmp_path / 'profiled'), 'doc')
+    plain_files = sorted(p.relative_to(tmp_path / 'plain')
+                         for p in (tmp_path / 'plain').rglob('*') if p.is_file())
+    assert plain_files == sorted(p.relative_to(tmp_path / 'profiled')
+                                 for p in (tmp_path / 'profiled').rglob('*') if p.is_file())
+    for name in plain_files:
+        assert ((tmp_path / 'profiled' / name).read_bytes()
+                == (tmp_path / 'plain' / name).read_bytes()), name
+
+    assert profiler.documents == 3
+    tags = body_tags()
+    elements = profiler.to_dict()['elements']
+    for tag in ('p', 'placeName', 'persName'):
+        assert elements[tag]['count'] == 3 * tags[tag]
+
+def test_streaming_profile_accounts_for_every_byte(tmp_path):
+    converter = TEItoHTMLConverter()
+    profiler = converter.enable_profiling()
+    converter.convert_stream(SOURCE, io.StringIO())
+
+    elements = profiler.to_dict()['elements']
+    assert sum(stats['self_output_bytes'] for stats in elements.values()) == profiler.bytes_written
+    assert elements['body']['output_bytes'] == profiler.bytes_written
+    for stats in elements.values():
+        assert 0 <= stats['self_seconds'] <= stats['cumulative_seconds'] + 1e-9
+    assert all(line.startswith('body') for line in profiler.folded())
+
+    profiler.write_json(str(tmp_path / 'profile.json'))
+    with open(tmp_path / 'profile.json', encoding='utf-8') as f:
+        assert json.load(f)['elements'].keys() == elements.keys()
@@ -0,0 +1,15 @@
+import os
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from corpus_build import find_images  # noqa: E402
+
+def test_find_images_needs_a_separator_after_the_stem(tmp_path):
+    for name in ('X.xml', 'X0.xml', 'X.png', 'X-img.png', 'X_2.JPG', 'X0-img.png', 'Xa.png',
+                 'X-notes.txt'):
+        (tmp_path / name).touch()
+
+    assert [p.name for p in find_images(tmp_path / 'X.xml')] == ['X-img.png', 'X.png', 'X_2.JPG']
+    assert [p.name for p in find_images(tmp_path / 'X0.xml')] == ['X0-img.png']
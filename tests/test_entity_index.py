@@ -0,0 +1,58 @@
+import os
+import sys
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from entity_index import (EntityIndex, OccurrenceCollector, decode_postings,  # noqa: E402
+                          encode_postings)
+from tei_to_html import ConversionContext, TEItoHTMLConverter  # noqa: E402
+
+SAMPLE = os.path.join(ROOT, 'data', 'o1-generated-tei.xml')
+
+@pytest.fixture(scope='module')
+def sample_occurrences():
+    context = ConversionContext()
+    context.occurrences = OccurrenceCollector()
+    with open(SAMPLE, encoding='utf-8') as f:
+        TEItoHTMLConverter().convert(f.read(), context=context)
+    return context.occurrences.result()
+
+def test_postings_round_trip():
+    postings = [0, 0, 0, 5, 0, 2, 1, 40, 0, 1, 3, 41, 3, 0, 0, 0, 3, 4, 2, 9000]
+    assert decode_postings(encode_postings(postings)) == postings
+
+def test_sample_mentions_have_anchors(sample_occurrences):
+    anchors = sample_occurrences.anchors
+    mentions = sample_occurrences.mentions
+    assert mentions
+    # Mentions before the first page break precede every ID in the body
+    after_first_page = [m for m in mentions if m[2] > 0]
+    assert after_first_page
+    assert all(anchors[anchor] for _, _, page, anchor, _ in after_first_page)
+    assert len({anchors[m[3]] for m in mentions}) > 1
+
+def test_cooccurrence_by_anchor_is_narrower_than_by_document(sample_occurrences):
+    index = EntityIndex()
+    index.update_document('doc1.html', sample_occurrences)
+    places = index.entities('places')
+    pairs = [(a, b) for i, a in enumerate(places) for b in places[i + 1:]]
+    assert any(len(index.cooccurrences(pair, 'anchor')) > len(index.cooccurrences(pair, 'document'))
+               for pair in pairs)
+
+def test_update_and_remove(sample_occurrences):
+    index = EntityIndex()
+    index.update_document('a.html', sample_occurrences)
+    index.update_document('b.html', sample_occurrences)
+    entity = index.entities()[0]
+    count = len(index.occurrences(entity, documents=['a.html']))
+    assert index.documents_mentioning(entity) == ['a.html', 'b.html']
+
+    index.remove_document('a.html')
+    assert index.documents_mentioning(entity) == ['b.html']
+    index.update_document('c.html', sample_occurrences)
+    # c.html takes the number a.html left free
+    assert index.documents_mentioning(entity) == ['c.html', 'b.html']
+    assert len(index.occurrences(entity, documents=['c.html'])) == count
@@ -0,0 +1,54 @@
+import json
+import os
+import sys
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+Image = pytest.importorskip('PIL.Image')
+
+from facsimile_tiles import tile_images  # noqa: E402
+
+BASE_URL = 'https://example.org/facsimiles'
+
+def count_tiles(pyramid):
+    return sum(1 for path in pyramid.rglob('default.jpg') if 'full' not in path.parts)
+
+def test_pyramids_are_keyed_by_file_name_with_absolute_ids(tmp_path):
+    sources = {}
+    for name, size, color in (('X0.png', (1200, 700), 'red'), ('X0.jpg', (300, 200), 'blue')):
+        Image.new('RGB', size, color).save(tmp_path / name)
+        sources[name] = tmp_path / name
+    out = tmp_path / 'facsimiles'
+
+    facsimiles, changes = tile_images(sources, out, BASE_URL, tile_size=256, jobs=1)
+    assert sorted(changes['tiled']) == ['X0.jpg', 'X0.png']
+    for name, (width, height) in (('X0.png', (1200, 700)), ('X0.jpg', (300, 200))):
+        with open(out / name / 'info.json') as f:
+            info = json.load(f)
+        assert info['id'] == f'{BASE_URL}/{name}'
+        assert (info['width'], info['height']) == (width, height)
+        assert (facsimiles[name].width, facsimiles[name].height) == (width, height)
+        for size in info['sizes']:
+            assert (out / name / 'full' / f"{size['width']},{size['height']}" / '0'
+                    / 'default.jpg').exists()
+    # 5x3 tiles at full size, 3x2 at half, 2x1 at quarter, 1 at an eighth
+    assert count_tiles(out / 'X0.png') == 15 + 6 + 2 + 1
+    assert count_tiles(out / 'X0.jpg') == 2 + 1
+
+    # Unchanged images are skipped; a new base URL only rewrites the ids
+    _, changes = tile_images(sources, out, 'https://mirror.example.org/f/', tile_size=256, jobs=1)
+    assert changes['tiled'] == []
+    with open(out / 'X0.jpg' / 'info.json') as f:
+        assert json.load(f)['id'] == 'https://mirror.example.org/f/X0.jpg'
+
+    del sources['X0.jpg']
+    _, changes = tile_images(sources, out, BASE_URL, tile_size=256, jobs=1)
+    assert changes['removed'] == ['X0.jpg'] and not (out / 'X0.jpg').exists()
+
+def test_relative_base_url_is_rejected(tmp_path):
+    Image.new('RGB', (10, 10)).save(tmp_path / 'p.png')
+    with pytest.raises(ValueError):
+        tile_images({'p.png': tmp_path / 'p.png'}, tmp_path / 'out', 'facsimiles')
@@ -0,0 +1,87 @@
+import os
+import random
+import sys
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+VIS_DIR = os.path.join(ROOT, 'vis')
+sys.path.insert(0, ROOT)
+sys.path.insert(0, VIS_DIR)
+
+pytest.importorskip('requests')  # geocoding, for the backend base class
+
+from gazetteer import (Gazetteer, GazetteerBackend, build_gazetteer,  # noqa: E402
+                       haversine_km)
+
+# geonameid, name, asciiname, alternatenames, latitude, longitude, feature class,
+# feature code, country, cc2, admin1-4, population, elevation, dem, timezone, modified
+PLACES = [
+    (3645528, 'Cumaná', 'Cumana', 'Cumana,Nueva Toledo', 10.45397, -64.18256, 'P', 'PPLA',
+     'VE', 423546),
+    (3649957, 'Ciudad Bolívar', 'Ciudad Bolivar', 'Angostura', 8.12923, -63.54086, 'P', 'PPLA',
+     'VE', 338000),
+    (3631000, 'Angostura', 'Angostura', '', 6.0, -61.5, 'T', 'GRGE', 'VE', 0),
+    (3630000, 'Orinoco', 'Orinoco', 'Rio Orinoco', 8.6, -60.5, 'H', 'STM', 'VE', 0),
+    (3630001, 'Orinoco', 'Orinoco', '', 3.2, -65.8, 'P', 'PPL', 'VE', 0),
+    (3379000, 'Esmeralda', 'Esmeralda', '', 3.17, -65.55, 'P', 'PPL', 'VE', 1000),
+    (3379001, 'Esmeralda', 'Esmeralda', '', 5.0, -58.0, 'P', 'PPL', 'GY', 2000),
+]
+
+def write_tsv(path, places):
+    with open(path, 'w', encoding='utf-8') as f:
+        for geonameid, name, ascii_name, alternates, lat, lon, cls, code, country, pop in places:
+            f.write('\t'.join(map(str, [geonameid, name, ascii_name, alternates, lat, lon, cls,
+                                        code, country, '', '', '', '', '', pop, '', '',
+                                        'America/Caracas', '2024-01-01'])) + '\n')
+
+@pytest.fixture(scope='module')
+def gazetteer(tmp_path_factory):
+    directory = tmp_path_factory.mktemp('gazetteer')
+    rng = random.Random(11)
+    # Filler around the Orinoco, and on both sides of the antimeridian
+    filler = []
+    for i in range(3000):
+        if i % 4:
+            lat, lon = rng.uniform(0, 12), rng.uniform(-70, -55)
+        else:
+            lat, lon = rng.uniform(-20, -15), rng.uniform(178, 180) - (360 if i % 8 else 0)
+        filler.append((5_000_000 + i, f'Site {i}', f'Site {i}', '', round(lat, 5), round(lon, 5),
+                       'S', 'SITE', 'VE', 0))
+    write_tsv(directory / 'places.txt', PLACES + filler)
+    meta = build_gazetteer(str(directory / 'places.txt'), str(directory / 'index'))
+    assert meta['records'] == len(PLACES) + len(filler)
+    gazetteer = Gazetteer(str(directory / 'index'))
+    yield gazetteer, PLACES + filler
+    gazetteer.close()
+
+def test_lookup_ranks_and_filters(gazetteer):
+    gazetteer, _ = gazetteer
+    assert gazetteer.lookup('cumana')[0].name == 'Cumaná'
+    assert gazetteer.lookup('Nueva Toledo')[0].geonameid == 3645528
+    # An alternate name of a city outranks an unpopulated place of that name
+    assert [p.geonameid for p in gazetteer.lookup('Angostura')] == [3649957, 3631000]
+    # Equal population: populated places before rivers
+    assert [p.feature_class for p in gazetteer.lookup('Orinoco')] == ['P', 'H']
+    assert gazetteer.lookup('Orinoco', feature_classes='H')[0].geonameid == 3630000
+    assert [p.country for p in gazetteer.lookup('Esmeralda')] == ['GY', 'VE']
+    assert gazetteer.lookup('Esmeralda', country='VE')[0].geonameid == 3379000
+    assert gazetteer.lookup('Esmeralda', limit=1)[0].geonameid == 3379001
+    assert gazetteer.lookup('Atlantis') == []
+
+def test_nearest_matches_brute_force(gazetteer):
+    gazetteer, places = gazetteer
+    rng = random.Random(5)
+    points = [(rng.uniform(1, 11), rng.uniform(-68, -57)) for _ in range(20)]
+    points += [(-17.5, 179.9), (-17.5, -179.9)]
+    for lat, lon in points:
+        expected = sorted((haversine_km(lat, lon, p[4], p[5]), p[0]) for p in places)
+        expected = [(round(d, 3), geonameid) for d, geonameid in expected[:5] if d <= 500]
+        found = gazetteer.nearest(lat, lon, k=5)
+        assert [(p.distance_km, p.geonameid) for p in found] == expected, (lat, lon)
+
+def test_backend_returns_coordinates(gazetteer):
+    gazetteer, _ = gazetteer
+    backend = GazetteerBackend(gazetteer, country='VE')
+    assert backend.lookup('Esmeralda') == (3.17, -65.55)
+    assert backend.lookup('Atlantis') is None
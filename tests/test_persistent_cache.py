@@ -0,0 +1,79 @@
+import os
+import sys
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import persistent_cache  # noqa: E402
+from persistent_cache import MISSING, PersistentCache  # noqa: E402
+
+class Clock:
+    def __init__(self):
+        self.now = 1_000_000.0
+
+    def time(self):
+        return self.now
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(persistent_cache, 'time', clock)
+    return clock
+
+def test_ttl_and_negative_ttl(tmp_path, clock):
+    with PersistentCache(str(tmp_path / 'cache.sqlite'), ttl=100, negative_ttl=10) as cache:
+        cache.set('found', {'qid': 'Q1'})
+        cache.set('not found', None)
+        clock.now += 5
+        assert cache.get('found') == {'qid': 'Q1'}
+        assert cache.get('not found') is None
+        clock.now += 10
+        assert cache.get('found') == {'qid': 'Q1'}
+        assert cache.get('not found') is MISSING
+        clock.now += 100
+        assert cache.get('found') is MISSING
+        assert cache.get('never set') is MISSING
+        assert (cache.stats.hits, cache.stats.misses, cache.stats.expired) == (3, 3, 2)
+
+def test_lru_eviction_keeps_recently_read_entries(tmp_path, clock):
+    with PersistentCache(str(tmp_path / 'cache.sqlite'), max_entries=10) as cache:
+        for i in range(10):
+            clock.now += 1
+            cache.set(f'k{i}', i)
+        clock.now += 1
+        assert cache.get('k0') == 0  # buffered, written with the next set
+        clock.now += 1
+        cache.set('k10', 10)
+        # Over the limit: the least recently used down to 90% are evicted
+        assert len(cache) == 9
+        assert cache.stats.evictions == 2
+        assert cache.get('k0') == 0
+        assert cache.get('k1') is MISSING and cache.get('k2') is MISSING
+        assert cache.get('k3') == 3
+
+def test_eviction_recounts_rows_of_other_instances(tmp_path, clock):
+    path = str(tmp_path / 'cache.sqlite')
+    first = PersistentCache(path, max_entries=10)
+    second = PersistentCache(path, max_entries=10)
+    try:
+        for i in range(8):
+            clock.now += 1
+            first.set(f'a{i}', i)
+        for i in range(3):
+            clock.now += 1
+            second.set(f'b{i}', i)
+        # second estimated 3 rows; the 11 in the file were evicted down to 9
+        assert len(first) == len(second) == 9
+        assert second.stats.evictions == 2
+        assert first.get('a0') is MISSING and first.get('a2') == 2
+        for i in range(3):
+            clock.now += 1
+            first.set(f'c{i}', i)
+        # first recounts after every insert (a tenth of 10), so it sees
+        # second's eviction and only c1 takes the namespace over the limit
+        assert len(first) == 10 and first.stats.evictions == 2
+    finally:
+        first.close()
+        second.close()
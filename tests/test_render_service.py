@@ -0,0 +1,88 @@
+import asyncio
+import os
+import re
+import sys
+from http import HTTPStatus
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from render_service import HTTPError, RenderService, read_request  # noqa: E402
+
+TEI = (b'<TEI xmlns="http://www.tei-c.org/ns/1.0"><text><body>'
+       b'<p>Angostura, <persName ref="#pers.humboldt">Humboldt</persName></p>'
+       b'</body></text></TEI>')
+
+@pytest.fixture
+def make_service(tmp_path):
+    (tmp_path / 'styles.css').write_text('body { color: #333; }')
+    (tmp_path / 'page1.png').write_bytes(b'\x89PNG fake')
+    services = []
+
+    def make():
+        service = RenderService(cache_path=str(tmp_path / 'render.sqlite'),
+                                stylesheets=[str(tmp_path / 'styles.css')],
+                                asset_dir=str(tmp_path / 'assets'), image_dir=str(tmp_path))
+        services.append(service)
+        return service
+    yield make
+    for service in services:
+        service.close()
+
+def respond(service, method, target, headers=None, body=b''):
+    return asyncio.run(service.respond(method, target, headers or {}, body))
+
+def test_cache_and_etag_paths(make_service):
+    service = make_service()
+    status, headers, html = respond(service, 'POST', '/render?images=page1.png', body=TEI)
+    assert status == HTTPStatus.OK and headers['X-Cache'] == 'miss'
+    etag = headers['ETag']
+
+    status, headers, again = respond(service, 'POST', '/render?images=page1.png', body=TEI)
+    assert headers['X-Cache'] == 'memory' and again == html
+    status, _, body = respond(service, 'POST', '/render?images=page1.png',
+                              {'if-none-match': f'W/{etag}'}, TEI)
+    assert status == HTTPStatus.NOT_MODIFIED and body == b''
+    status, headers, again = respond(service, 'GET', f'/render/{etag.strip(chr(34))}')
+    assert status == HTTPStatus.OK and again == html
+
+    # A fresh service finds the rendering in the disk cache
+    restarted = make_service()
+    status, headers, again = respond(restarted, 'GET', f'/render/{etag.strip(chr(34))}')
+    assert headers['X-Cache'] == 'disk' and again == html
+    assert restarted.metrics_dict()['disk_hits'] == 1
+
+    with pytest.raises(HTTPError) as error:
+        respond(service, 'GET', '/render/' + '0' * 64)
+    assert error.value.status == HTTPStatus.NOT_FOUND
+
+def test_previews_link_assets_the_service_serves(make_service):
+    service = make_service()
+    _, _, html = respond(service, 'POST', '/render?images=page1.png', body=TEI)
+    urls = re.findall(r'(?:href|src)="(/[^"]*)"', html.decode('utf-8'))
+    assert any(url.endswith('.css') for url in urls)
+    assert '/images/page1.png' in urls
+    for url in urls:
+        status, headers, data = respond(service, 'GET', url)
+        assert status == HTTPStatus.OK and data
+
+    for url in ('/images/../render.sqlite', '/images/%2e%2e/etc/passwd', '/assets/missing.js'):
+        with pytest.raises(HTTPError) as error:
+            respond(service, 'GET', url)
+        assert error.value.status == HTTPStatus.NOT_FOUND
+
+def test_malformed_content_length_is_a_bad_request():
+    async def read(raw):
+        reader = asyncio.StreamReader()
+        reader.feed_data(raw)
+        reader.feed_eof()
+        return await read_request(reader)
+
+    for length in (b'abc', b'-5'):
+        with pytest.raises(HTTPError) as error:
+            asyncio.run(read(b'POST /render HTTP/1.1\r\nContent-Length: ' + length + b'\r\n\r\n'))
+        assert error.value.status == HTTPStatus.BAD_REQUEST
+    request = asyncio.run(read(b'POST /render HTTP/1.1\r\nContent-Length: 3\r\n\r\nabc'))
+    assert request[3] == b'abc'
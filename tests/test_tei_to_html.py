@@ -0,0 +1,28 @@
+import os
+import re
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from tei_to_html import TEItoHTMLConverter  # noqa: E402
+
+TEI = ('<TEI xmlns="http://www.tei-c.org/ns/1.0"><text><body>'
+       '<div type="chapter" n="3"><p>Before <pb n="1"/> after</p>'
+       '<list><item>one <pb n="2"/> two</item></list></div>'
+       '</body></text></TEI>')
+
+def test_pages_reopen_containers_without_their_ids(tmp_path):
+    source = tmp_path / 'chapter.xml'
+    source.write_text(TEI, encoding='utf-8')
+    TEItoHTMLConverter().convert_pages(str(source), str(tmp_path), 'chapter')
+
+    pages = [path.read_text(encoding='utf-8')
+             for path in sorted((tmp_path / 'chapter.pages').glob('[0-9][0-9][0-9][0-9].html'))]
+    assert len(pages) == 3
+    ids = [id_ for page in pages for id_ in re.findall(r'\sid="([^"]*)"', page)]
+    assert ids.count('div-3') == 1 and len(ids) == len(set(ids))
+    assert pages[0].startswith('<div class="chapter" id="div-3">')
+    for page in pages[1:]:
+        assert page.startswith('<div class="chapter" data-continued>')
+    assert '<ul data-continued><li data-continued>' in pages[2]
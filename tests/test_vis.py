@@ -0,0 +1,121 @@
+import importlib.util
+import os
+import sys
+
+import pandas as pd
+import pytest
+
+pytest.importorskip('plotly')
+
+VIS_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'vis')
+
+@pytest.fixture(scope='module')
+def vis():
+    sys.path.insert(0, VIS_DIR)
+    try:
+        spec = importlib.util.spec_from_file_location('o1_vis', os.path.join(VIS_DIR, 'o1-vis.py'))
+        module = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(module)
+    finally:
+        sys.path.remove(VIS_DIR)
+    return module
+
+def dates(when, text, not_before=None, not_after=None):
+    return pd.DataFrame({
+        'date_when': when,
+        'date_notBefore': not_before or [None] * len(when),
+        'date_notAfter': not_after or [None] * len(when),
+        'date_text': text,
+    })
+
+def test_mixed_offset_naive_and_free_text_dates(vis):
+    df = vis.parse_dates(dates(
+        ['1799-07-16T10:00:00Z', '1799-07-17', '1800-01-01T00:00:00+02:00', None],
+        [None, None, None, '3 May 1801']))
+
+    assert str(df['parsed_date'].dtype).startswith('datetime64')
+    assert df['parsed_date'].dt.tz is None
+    assert list(df['parsed_date']) == [
+        pd.Timestamp('1799-07-16 10:00'), pd.Timestamp('1799-07-17'),
+        pd.Timestamp('1799-12-31 22:00'), pd.Timestamp('1801-05-03')]
+    assert list(df['date_source']) == ['when', 'when', 'when', 'text']
+
+def test_years_and_months_resolve_to_their_midpoint(vis):
+    df = vis.parse_dates(dates(['1833-10', '1799', '1799-12'], [None, None, None]))
+
+    assert list(df['parsed_date']) == [pd.Timestamp('1833-10-16 12:00'),
+                                       pd.Timestamp('1799-07-02 12:00'),
+                                       pd.Timestamp('1799-12-16 12:00')]
+    assert list(df['date_uncertainty']) == [pd.Timedelta(days=15.5), pd.Timedelta(days=182.5),
+                                            pd.Timedelta(days=15.5)]
+    assert list(df['date_source']) == ['when'] * 3
+    assert df.attrs['date_sources']['unresolved'] == 0
+
+def test_partial_range_bounds_cover_the_period(vis):
+    df = vis.parse_dates(dates([None], [None], ['1799'], ['1800-06']))
+
+    # 1799-01-01 up to the end of June 1800
+    assert df['parsed_date'].iloc[0] == pd.Timestamp('1799-10-01')
+    assert df['date_uncertainty'].iloc[0] == pd.Timedelta(days=273)
+
+def test_dates_without_a_year_fall_back_to_text(vis):
+    df = vis.parse_dates(dates(['--07-16', '--08-01'], ['16 July 1799', None]))
+
+    # '--07-16' must not become year 0
+    assert list(df['parsed_date']) == [pd.Timestamp('1799-07-16')]
+    assert list(df['date_source']) == ['text']
+    assert df.attrs['date_sources']['unresolved'] == 1
+
+def test_ranges_with_offsets(vis):
+    df = vis.parse_dates(dates([None], [None], ['1799-01-01T00:00:00+01:00'], ['1799-01-03']))
+
+    assert df['parsed_date'].iloc[0] == pd.Timestamp('1799-01-01 23:30')
+    assert df['date_uncertainty'].iloc[0] == pd.Timedelta(hours=24, minutes=30)
+
+class LengthGeocoder:
+    """Deterministic coordinates from the name, so no lookups are needed."""
+
+    def geocode_many(self, names):
+        return {name: (float(len(name)), float(sum(map(ord, name)) % 50)) for name in names}
+
+def write_tei(path, paragraphs):
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write('<TEI xmlns="http://www.tei-c.org/ns/1.0"><text><body><div>')
+        f.write(''.join(f'<p>{p}</p>' for p in paragraphs))
+        f.write('</div></body></text></TEI>')
+
+def test_collect_map_rows_matches_whole_document_parse(vis, tmp_path):
+    places = ['Angostura', 'Esmeralda', 'Cumaná', 'Caracas']
+    paragraphs = [
+        f'<placeName>{places[i % 4]}</placeName> <placeName>{places[i % 3]}</placeName> '
+        + (f'<date when="{1799 + i % 4}-07-{10 + i % 9}"/>' if i % 3 else
+           f'<date>{1 + i % 28} May 1801</date>')
+        for i in range(200)
+    ]
+    path = tmp_path / 'observations.xml'
+    write_tei(path, paragraphs)
+
+    whole = vis.get_coordinates(vis.parse_dates(vis.parse_tei_xml(str(path))), LengthGeocoder())
+    streamed = vis.collect_map_rows(str(path), LengthGeocoder(), chunk_size=17)
+
+    assert streamed['weight'].sum() == len(whole)
+    assert len(streamed) < len(whole)
+    for cumulative in (True, False):
+        pd.testing.assert_frame_equal(
+            vis.aggregate_points(whole, cumulative=cumulative),
+            vis.aggregate_points(streamed, cumulative=cumulative), check_dtype=False)
+
+def test_chunks_are_typed_and_split_within_a_paragraph(vis, tmp_path):
+    # One paragraph with 6 places x 5 dates is 30 rows, more than a chunk
+    places = ''.join(f'<placeName>P{i}</placeName> ' for i in range(6))
+    dates = ''.join(f'<date when="180{i}"/> ' for i in range(5))
+    path = tmp_path / 'dense.xml'
+    write_tei(path, [places + dates, 'No place, no date'])
+
+    chunks = list(vis.iter_tei_chunks(str(path), chunk_size=8))
+    assert [len(chunk) for chunk in chunks] == [8, 8, 8, 7]
+    for chunk in chunks:
+        assert list(chunk.columns) == vis.COLUMNS
+        assert all(dtype == 'string' for dtype in chunk.dtypes)
+    last = chunks[-1].iloc[-1]
+    assert pd.isna(last['place_name']) and last['observation'] == 'No place, no date'
@@ -0,0 +1,98 @@
+import json
+import os
+import random
+import sys
+from collections import Counter
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+pytest.importorskip('requests')  # wikidata_reconcile, for clean_query
+
+from wikidata_offline import (OfflineReconciliation, build_index,  # noqa: E402
+                              name_grams, normalize_name)
+
+SYLLABLES = ['an', 'bo', 'ca', 'de', 'el', 'fo', 'gu', 'ha', 'is', 'jo', 'ku', 'la', 'mi',
+             'no', 'or', 'pa', 'qu', 're', 'sa', 'to', 'ur', 've', 'wa', 'xi', 'yo', 'zu']
+# Frequent words give grams whose postings cover much of the index
+COMMON = ['San', 'Santa', 'Rio', 'River', 'Saint', 'de la', 'Mount']
+
+def make_names(count, seed=7):
+    rng = random.Random(seed)
+    names = []
+    for _ in range(count):
+        word = ''.join(rng.choice(SYLLABLES) for _ in range(rng.randint(2, 4))).title()
+        names.append(f'{rng.choice(COMMON)} {word}' if rng.random() < 0.6 else word)
+    return names
+
+@pytest.fixture(scope='module')
+def index(tmp_path_factory):
+    directory = tmp_path_factory.mktemp('offline')
+    names = make_names(6000)
+    with open(directory / 'dump.json', 'w', encoding='utf-8') as f:
+        f.write('[\n')
+        for i, name in enumerate(names):
+            entity = {'id': f'Q{i + 1}', 'labels': {'en': {'language': 'en', 'value': name}},
+                      'descriptions': {}, 'claims': {}}
+            f.write(json.dumps(entity) + ',\n')
+        f.write(']\n')
+    build_index(str(directory / 'dump.json'), str(directory / 'index'), run_size=5000)
+    # No candidate cap: the pruning alone must not lose matches
+    reconciler = OfflineReconciliation(str(directory / 'index'), max_candidates=len(names))
+    yield reconciler, names
+    reconciler.close()
+
+def brute_force(names, query, min_score):
+    """Dice scores against every name: what search must reproduce"""
+    grams = name_grams(normalize_name(query))
+    scores = {}
+    for i, name in enumerate(names):
+        other = name_grams(normalize_name(name))
+        score = 2 * len(grams & other) / (len(grams) + len(other))
+        if score >= min_score:
+            scores[f'Q{i + 1}'] = max(score, scores.get(f'Q{i + 1}', 0.0))
+    return scores
+
+def test_pruned_search_matches_brute_force(index):
+    reconciler, names = index
+    rng = random.Random(3)
+    queries = rng.sample(names, 40) + ['San', 'Rio Sa', 'Santa Bojoxi', 'Mount Kuhala River']
+    for query in queries:
+        expected = brute_force(names, query, reconciler.min_score)
+        found = reconciler.search(query, limit=len(names))
+        assert {c.qid: c.score for c in found} == {qid: round(score, 4)
+                                                  for qid, score in expected.items()}, query
+
+def test_candidate_cap_keeps_the_best_match(index):
+    reconciler, names = index
+    reconciler.max_candidates = 50
+    try:
+        for query in names[:20]:
+            assert reconciler.search(query, limit=1)[0].score == 1.0
+    finally:
+        reconciler.max_candidates = len(names)
+
+def test_frequent_grams_are_not_scanned(index):
+    reconciler, _ = index
+    query = 'Santa Zuxiyo'
+    grams = name_grams(normalize_name(query))
+    postings = sorted(reconciler.terms[gram][1] for gram in grams if gram in reconciler.terms)
+    counted = Counter()
+    original = reconciler.postings
+
+    class Recording:
+        def __getitem__(self, item):
+            if isinstance(item, slice):
+                counted['postings'] += item.stop - item.start
+            return original[item]
+
+        def __len__(self):
+            return len(original)
+    reconciler.postings = Recording()
+    try:
+        reconciler.search(query)
+    finally:
+        reconciler.postings = original
+    assert counted['postings'] < sum(postings) / 2
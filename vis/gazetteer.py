@@ -0,0 +1,326 @@
+import argparse
+import bisect
+import json
+import math
+import mmap
+import os
+import unicodedata
+from array import array
+from dataclasses import dataclass
+from typing import Iterable, List, Optional, Sequence, Tuple
+
+from geocoding import GeocodingBackend, normalize_place_name
+
+INDEX_VERSION = 1
+# Feature classes in the order they win ties on population:
+# populated places, admin areas, water, terrain, spots, vegetation, roads, undersea
+FEATURE_CLASS_ORDER = 'PAHTLSVRU'
+# Records per spatial grid cell are grouped by whole degrees
+CELL_COLUMNS = 360
+
+@dataclass
+class Place:
+    geonameid: int
+    name: str
+    latitude: float
+    longitude: float
+    feature_class: str
+    country: str
+    population: int
+    distance_km: Optional[float] = None
+
+def gazetteer_key(name: str) -> str:
+    """
+    Name-index key: the geocoding key with accents removed.
+    """
+    decomposed = unicodedata.normalize('NFKD', normalize_place_name(name))
+    return ''.join(c for c in decomposed if not unicodedata.combining(c))
+
+def _cell(latitude: float, longitude: float) -> int:
+    row = min(179, max(0, int(math.floor(latitude)) + 90))
+    column = min(359, max(0, int(math.floor(longitude)) + 180))
+    return row * CELL_COLUMNS + column
+
+def haversine_km(lat1: float, lon1: float, lat2: float, lon2: float) -> float:
+    phi1, phi2 = math.radians(lat1), math.radians(lat2)
+    dphi = phi2 - phi1
+    dlambda = math.radians(lon2 - lon1)
+    a = math.sin(dphi / 2) ** 2 + math.cos(phi1) * math.cos(phi2) * math.sin(dlambda / 2) ** 2
+    return 6371.0088 * 2 * math.asin(math.sqrt(a))
+
+def _rank(feature_class: str, population: int) -> Tuple[int, int]:
+    order = FEATURE_CLASS_ORDER.find(feature_class)
+    return -population, order if order >= 0 else len(FEATURE_CLASS_ORDER)
+
+def build_gazetteer(tsv_path: str, index_dir: str, countries: Iterable[str] = None,
+                    feature_classes: str = None) -> dict:
+    """
+    Builds the binary gazetteer index from a GeoNames dump (allCountries.txt,
+    cities15000.txt, ...).
+
+    Parameters:
+    - tsv_path: str, GeoNames tab-separated file.
+    - index_dir: str, directory for the index files.
+    - countries: optional ISO country codes to keep.
+    - feature_classes: optional string of GeoNames feature classes to keep, e.g. 'PHT'.
+
+    Returns:
+    - meta: dict with the number of records, distinct name keys and (key, record) pairs.
+    """
+    os.makedirs(index_dir, exist_ok=True)
+    countries = set(countries) if countries else None
+    geonameids, populations = array('q'), array('q')
+    latitudes, longitudes = array('d'), array('d')
+    classes, country_codes = bytearray(), bytearray()
+    names, name_offsets = bytearray(), array('Q', [0])
+    keyed = []
+
+    with open(tsv_path, 'r', encoding='utf-8') as f:
+        for line in f:
+            fields = line.rstrip('\n').split('\t')
+            if len(fields) < 15:
+                continue
+            feature_class = fields[6] or ' '
+            country = (fields[8] or '  ')[:2].ljust(2)
+            if countries and country not in countries:
+                continue
+            if feature_classes and feature_class not in feature_classes:
+                continue
+            record = len(geonameids)
+            population = int(fields[14] or 0)
+            geonameids.append(int(fields[0]))
+            populations.append(population)
+            latitudes.append(float(fields[4]))
+            longitudes.append(float(fields[5]))
+            classes.extend(feature_class.encode('ascii'))
+            country_codes.extend(country.encode('ascii'))
+            names.extend(fields[1].encode('utf-8'))
+            name_offsets.append(len(names))
+            rank = _rank(feature_class, population)
+            variants = [fields[1], fields[2]] + (fields[3].split(',') if fields[3] else [])
+            for key in {gazetteer_key(variant) for variant in variants if variant}:
+                if key:
+                    keyed.append((key, rank, record))
+
+    keyed.sort()
+    keys, key_offsets, key_records = bytearray(), array('Q', [0]), array('I')
+    previous = None
+    for key, _, record in keyed:
+        if key != previous:
+            if previous is not None:
+                key_offsets.append(len(key_records))
+            keys.extend(key.encode('utf-8') + b'\n')
+            previous = key
+        key_records.append(record)
+    if previous is not None:
+        key_offsets.append(len(key_records))
+    key_starts = array('Q', [0])
+    position = 0
+    for line in bytes(keys).split(b'\n')[:-1]:
+        position += len(line) + 1
+        key_starts.append(position)
+
+    cells = sorted(range(len(geonameids)), key=lambda r: _cell(latitudes[r], longitudes[r]))
+    cell_records = array('I', cells)
+    cell_starts = array('I', [0] * (180 * CELL_COLUMNS + 1))
+    for record in cells:
+        cell_starts[_cell(latitudes[record], longitudes[record]) + 1] += 1
+    for i in range(1, len(cell_starts)):
+        cell_starts[i] += cell_starts[i - 1]
+
+    files = {
+        'geonameids.bin': geonameids, 'populations.bin': populations,
+        'latitudes.bin': latitudes, 'longitudes.bin': longitudes,
+        'classes.bin': classes, 'countries.bin': country_codes,
+        'names.bin': names, 'name_offsets.bin': name_offsets,
+        'keys.bin': keys, 'key_starts.bin': key_starts,
+        'key_offsets.bin': key_offsets, 'key_records.bin': key_records,
+        'cell_starts.bin': cell_starts, 'cell_records.bin': cell_records,
+    }
+    for filename, data in files.items():
+        with open(os.path.join(index_dir, filename), 'wb') as out:
+            out.write(bytes(data) if isinstance(data, bytearray) else data.tobytes())
+    meta = {'version': INDEX_VERSION, 'records': len(geonameids),
+            'keys': len(key_starts) - 1, 'names': len(key_records)}
+    with open(os.path.join(index_dir, 'meta.json'), 'w', encoding='utf-8') as out:
+        json.dump(meta, out, indent=2)
+    return meta
+
+class _KeyList(Sequence):
+    """
+    Sorted index keys, read lazily from the memory-mapped keys file for bisect.
+    """
+
+    def __init__(self, keys, starts):
+        self.keys = keys
+        self.starts = starts
+
+    def __len__(self):
+        return len(self.starts) - 1
+
+    def __getitem__(self, i):
+        return bytes(self.keys[self.starts[i]:self.starts[i + 1] - 1])
+
+class Gazetteer:
+    """
+    Offline place lookup over an index built by build_gazetteer.
+
+    All arrays are memory-mapped, so opening an index takes milliseconds and
+    only the pages touched by a query are read from disk.
+    """
+
+    def __init__(self, index_dir: str):
+        with open(os.path.join(index_dir, 'meta.json'), 'r', encoding='utf-8') as f:
+            self.meta = json.load(f)
+        if self.meta['version'] != INDEX_VERSION:
+            raise ValueError(f"Unsupported gazetteer version {self.meta['version']} in {index_dir}")
+        self._files = []
+        load = lambda name, typecode=None: self._map(os.path.join(index_dir, name), typecode)
+        self.geonameids = load('geonameids.bin', 'q')
+        self.populations = load('populations.bin', 'q')
+        self.latitudes = load('latitudes.bin', 'd')
+        self.longitudes = load('longitudes.bin', 'd')
+        self.classes = load('classes.bin')
+        self.countries = load('countries.bin')
+        self.names = load('names.bin')
+        self.name_offsets = load('name_offsets.bin', 'Q')
+        self.key_offsets = load('key_offsets.bin', 'Q')
+        self.key_records = load('key_records.bin', 'I')
+        self.cell_starts = load('cell_starts.bin', 'I')
+        self.cell_records = load('cell_records.bin', 'I')
+        self.keys = _KeyList(load('keys.bin'), load('key_starts.bin', 'Q'))
+
+    def _map(self, path: str, typecode: str = None) -> memoryview:
+        if os.path.getsize(path) == 0:
+            view = memoryview(b'')
+        else:
+            f = open(path, 'rb')
+            self._files.append(f)
+            view = memoryview(mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ))
+        return view.cast(typecode) if typecode else view
+
+    def place(self, record: int, distance_km: float = None) -> Place:
+        return Place(
+            geonameid=self.geonameids[record],
+            name=bytes(self.names[self.name_offsets[record]:self.name_offsets[record + 1]]).decode('utf-8'),
+            latitude=self.latitudes[record],
+            longitude=self.longitudes[record],
+            feature_class=chr(self.classes[record]),
+            country=bytes(self.countries[2 * record:2 * record + 2]).decode('ascii').strip(),
+            population=self.populations[record],
+            distance_km=distance_km,
+        )
+
+    def lookup(self, name: str, country: str = None, feature_classes: str = None,
+               limit: int = 5) -> List[Place]:
+        """
+        Places whose name or alternate name matches, best ranked first.
+
+        Matches are ranked by population, then by feature class
+        (populated places before administrative areas before rivers, ...).
+        """
+        key = gazetteer_key(name).encode('utf-8')
+        i = bisect.bisect_left(self.keys, key)
+        if i == len(self.keys) or self.keys[i] != key:
+            return []
+        places = []
+        for record in self.key_records[self.key_offsets[i]:self.key_offsets[i + 1]]:
+            if feature_classes and chr(self.classes[record]) not in feature_classes:
+                continue
+            if country and bytes(self.countries[2 * record:2 * record + 2]).decode('ascii') != country:
+                continue
+            places.append(self.place(record))
+            if len(places) == limit:
+                break
+        return places
+
+    def nearest(self, latitude: float, longitude: float, k: int = 1,
+                feature_classes: str = None, max_km: float = 500.0) -> List[Place]:
+        """
+        The k places closest to a point, searching outwards ring by ring
+        through the one-degree grid until no closer place can exist.
+        """
+        row, column = divmod(_cell(latitude, longitude), CELL_COLUMNS)
+        best: List[Tuple[float, int]] = []
+        max_rings = int(max_km / 111.0) + 2
+        for ring in range(max_rings + 1):
+            for r in range(row - ring, row + ring + 1):
+                if not 0 <= r < 180:
+                    continue
+                on_edge = r in (row - ring, row + ring)
+                for c in range(column - ring, column + ring + 1):
+                    if not on_edge and c not in (column - ring, column + ring):
+                        continue
+                    cell = r * CELL_COLUMNS + c % CELL_COLUMNS
+                    for record in self.cell_records[self.cell_starts[cell]:self.cell_starts[cell + 1]]:
+                        if feature_classes and chr(self.classes[record]) not in feature_classes:
+                            continue
+                        distance = haversine_km(latitude, longitude,
+                                                self.latitudes[record], self.longitudes[record])
+                        if distance <= max_km:
+                            best.append((distance, record))
+            best = sorted(best)[:k]
+            # Anything in the next ring is at least `ring` cells away; a degree of
+            # longitude shrinks with latitude, so bound by the poleward edge.
+            bound = ring * 111.0 * math.cos(math.radians(min(89.0, abs(latitude) + ring + 1)))
+            if len(best) == k and best[-1][0] <= bound:
+                break
+        return [self.place(record, round(distance, 3)) for distance, record in best]
+
+    def close(self):
+        for f in self._files:
+            f.close()
+
+class GazetteerBackend(GeocodingBackend):
+    """
+    Geocoding backend answering from a local Gazetteer, for hosts without network.
+    """
+
+    name = 'gazetteer'
+
+    def __init__(self, gazetteer: Gazetteer, country: str = None, feature_classes: str = None):
+        self.gazetteer = gazetteer
+        self.country = country
+        self.feature_classes = feature_classes
+
+    def lookup(self, place_name: str) -> Optional[Tuple[float, float]]:
+        places = self.gazetteer.lookup(place_name, country=self.country,
+                                       feature_classes=self.feature_classes, limit=1)
+        if not places:
+            return None
+        return places[0].latitude, places[0].longitude
+
+def main():
+    parser = argparse.ArgumentParser(description='Offline GeoNames gazetteer')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    build_parser = subparsers.add_parser('build', help='Build an index from a GeoNames TSV dump')
+    build_parser.add_argument('tsv')
+    build_parser.add_argument('index_dir')
+    build_parser.add_argument('--countries', help='Comma-separated country codes to keep')
+    build_parser.add_argument('--feature-classes', help='Feature classes to keep, e.g. PHT')
+    lookup_parser = subparsers.add_parser('lookup', help='Look up place names')
+    lookup_parser.add_argument('index_dir')
+    lookup_parser.add_argument('names', nargs='+')
+    nearest_parser = subparsers.add_parser('nearest', help='Places closest to a coordinate')
+    nearest_parser.add_argument('index_dir')
+    nearest_parser.add_argument('latitude', type=float)
+    nearest_parser.add_argument('longitude', type=float)
+    nearest_parser.add_argument('-k', type=int, default=5)
+    args = parser.parse_args()
+
+    if args.command == 'build':
+        countries = args.countries.split(',') if args.countries else None
+        print(build_gazetteer(args.tsv, args.index_dir, countries, args.feature_classes))
+    elif args.command == 'lookup':
+        gazetteer = Gazetteer(args.index_dir)
+        for name in args.names:
+            for place in gazetteer.lookup(name):
+                print(f"{name}\t{place.name}\t{place.latitude}\t{place.longitude}\t"
+                      f"{place.feature_class}\t{place.country}\t{place.population}")
+    else:
+        gazetteer = Gazetteer(args.index_dir)
+        for place in gazetteer.nearest(args.latitude, args.longitude, k=args.k):
+            print(f"{place.name}\t{place.latitude}\t{place.longitude}\t{place.distance_km} km")
+
+if __name__ == '__main__':
+    main()
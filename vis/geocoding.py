@@ -0,0 +1,160 @@
+import os
+import re
+import sys
+import threading
+import time
+import unicodedata
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Iterable, Optional, Tuple
+
+import requests
+from requests.adapters import HTTPAdapter
+
+# persistent_cache lives at the repository root
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from persistent_cache import MISSING, PersistentCache  # noqa: E402
+
+NOMINATIM_URL = 'https://nominatim.openstreetmap.org/search'
+USER_AGENT = 'TEIParser/1.0 (your_email@example.com)'
+
+Coordinates = Tuple[Optional[float], Optional[float]]
+
+class GeocodingError(Exception):
+    """Transient failure; the lookup is not cached and may be retried later."""
+
+def normalize_place_name(place_name: str) -> str:
+    """
+    Key under which a place name is deduplicated and cached.
+
+    Unicode-normalises, case-folds and collapses whitespace and surrounding
+    punctuation, so "Orinoco", " orinoco " and "Orinoco," share one lookup.
+    """
+    name = unicodedata.normalize('NFC', place_name).casefold()
+    name = ' '.join(name.split())
+    return re.sub(r'^[\W_]+|[\W_]+$', '', name)
+
+class GeocodingBackend:
+    """
+    Interface for geocoding services.
+
+    ``lookup`` returns (lat, lon) for a place name, ``None`` when the service
+    has no match, and raises GeocodingError for failures worth retrying.
+    """
+
+    name = 'backend'
+
+    def lookup(self, place_name: str) -> Optional[Tuple[float, float]]:
+        raise NotImplementedError
+
+class NominatimBackend(GeocodingBackend):
+    """
+    Nominatim (OpenStreetMap) search API.
+
+    Requests go through one pooled session and, following the Nominatim usage
+    policy, start at most once per ``min_interval`` seconds across all threads.
+    Point ``endpoint`` at a local stub server for tests.
+    """
+
+    name = 'nominatim'
+
+    def __init__(self, endpoint: str = NOMINATIM_URL, user_agent: str = USER_AGENT,
+                 min_interval: float = 1.0, pool_size: int = 4, timeout: float = 30.0):
+        self.endpoint = endpoint
+        self.min_interval = min_interval
+        self.timeout = timeout
+        self.session = requests.Session()
+        self.session.headers['User-Agent'] = user_agent
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+        self.requests_made = 0
+        self._lock = threading.Lock()
+        self._next_slot = 0.0
+
+    def _throttle(self):
+        with self._lock:
+            now = time.monotonic()
+            wait = self._next_slot - now
+            self._next_slot = max(now, self._next_slot) + self.min_interval
+            self.requests_made += 1
+        if wait > 0:
+            time.sleep(wait)
+
+    def lookup(self, place_name: str) -> Optional[Tuple[float, float]]:
+        params = {
+            'q': place_name,
+            'format': 'json',
+            'limit': 1
+        }
+        self._throttle()
+        try:
+            response = self.session.get(self.endpoint, params=params, timeout=self.timeout)
+        except requests.exceptions.RequestException as e:
+            raise GeocodingError(str(e)) from e
+        if response.status_code != 200:
+            raise GeocodingError(f'HTTP {response.status_code}')
+        data = response.json()
+        if not data:
+            return None
+        return float(data[0]['lat']), float(data[0]['lon'])
+
+class Geocoder:
+    """
+    Deduplicating, cached front end for a geocoding backend.
+
+    Names are normalised before deduplication; both hits and "no match"
+    answers are cached per backend, so re-running over the same corpus makes
+    no network calls. Uncached names are looked up on up to ``max_workers``
+    threads (the backend does its own throttling).
+    """
+
+    def __init__(self, backend: GeocodingBackend, cache: Optional[PersistentCache] = None,
+                 max_workers: int = 4):
+        self.backend = backend
+        self.cache = cache
+        self.max_workers = max_workers
+
+    def _cache_key(self, key: str) -> str:
+        return f'{self.backend.name}\0{key}'
+
+    def _lookup(self, key: str, place_name: str) -> Coordinates:
+        try:
+            result = self.backend.lookup(place_name)
+        except GeocodingError as e:
+            print(f"Error geocoding {place_name}: {e}")
+            return None, None
+        if self.cache is not None:
+            self.cache.set(self._cache_key(key), list(result) if result else None)
+        return tuple(result) if result else (None, None)
+
+    def geocode_many(self, place_names: Iterable[str]) -> Dict[str, Coordinates]:
+        """
+        Coordinates for each distinct place name.
+
+        Returns a dict mapping every input name to (lat, lon), or (None, None)
+        when the place could not be geocoded.
+        """
+        place_names = list(place_names)
+        by_key: Dict[str, str] = {}
+        for place_name in place_names:
+            by_key.setdefault(normalize_place_name(place_name), place_name)
+
+        found: Dict[str, Coordinates] = {}
+        missing = []
+        for key, place_name in by_key.items():
+            cached = self.cache.get(self._cache_key(key)) if self.cache is not None else MISSING
+            if cached is MISSING:
+                missing.append((key, place_name))
+            else:
+                found[key] = tuple(cached) if cached else (None, None)
+
+        if missing:
+            with ThreadPoolExecutor(max_workers=self.max_workers) as pool:
+                results = pool.map(lambda item: self._lookup(*item), missing)
+                for (key, _), coordinates in zip(missing, results):
+                    found[key] = coordinates
+
+        return {place_name: found[normalize_place_name(place_name)] for place_name in place_names}
+
+    def geocode(self, place_name: str) -> Coordinates:
+        return self.geocode_many([place_name])[place_name]
@@ -1,230 +1,609 @@
+import argparse
+import json
+import os
 import xml.etree.ElementTree as ET
+from datetime import datetime
+from functools import lru_cache
+import numpy as np
 import pandas as pd
-import requests
 from dateutil.parser import parse as parse_date
 import plotly.express as px
+from geocoding import Geocoder, NominatimBackend, PersistentCache
+from gazetteer import Gazetteer, GazetteerBackend
 
 # Define the TEI namespace
 NS = {'tei': 'http://www.tei-c.org/ns/1.0'}
+TEI = '{http://www.tei-c.org/ns/1.0}'
+XML_ID = '{http://www.w3.org/XML/1998/namespace}id'
 
-def parse_tei_xml(file_path):
+COLUMNS = ['place_name', 'place_ref', 'date_text', 'date_when', 'date_notBefore',
+           'date_notAfter', 'observation']
+# Attribute values and text, missing ones as <NA>
+COLUMN_DTYPES = dict.fromkeys(COLUMNS, 'string')
+
+def iter_paragraphs(file_path):
+    """
+    Streams the observation paragraphs of a TEI XML file.
+
+    A paragraph is a <p> reached from <body> through <div> elements only, as in
+    the original recursive walk. Elements are cleared and detached as soon as
+    they have been processed, so memory stays bounded by the largest paragraph.
+
+    Parameters:
+    - file_path: str, path to the TEI XML file.
+
+    Yields:
+    - (xml_id, places, dates, observation_text), where places is a list of
+      (name, ref) and dates a list of (text, when, notBefore, notAfter).
+    """
+    # Per open element: whether it sits on a body/div-only path
+    stack = []
+    open_paragraphs = 0
+    for event, elem in ET.iterparse(file_path, events=('start', 'end')):
+        if event == 'start':
+            parent_on_path = stack[-1][1] if stack else False
+            on_path = elem.tag == TEI + 'body' or (parent_on_path and elem.tag == TEI + 'div')
+            stack.append((elem, on_path, parent_on_path and elem.tag == TEI + 'p'))
+            if elem.tag == TEI + 'p':
+                open_paragraphs += 1
+            continue
+
+        _, _, is_observation = stack.pop()
+        if elem.tag == TEI + 'p':
+            open_paragraphs -= 1
+        if is_observation:
+            places = [
+                (pname.text.strip() if pname.text else '', pname.get('ref'))
+                for pname in elem.iterfind('.//tei:placeName', NS)
+            ]
+            dates = [
+                (date_elem.text.strip() if date_elem.text else '', date_elem.get('when'),
+                 date_elem.get('notBefore'), date_elem.get('notAfter'))
+                for date_elem in elem.iterfind('.//tei:date', NS)
+            ]
+            yield elem.get(XML_ID), places, dates, ''.join(elem.itertext()).strip()
+        # Free everything that is not part of a paragraph still being read
+        if not open_paragraphs:
+            elem.clear()
+            if stack:
+                stack[-1][0].remove(elem)
+
+def iter_tei_chunks(file_path, chunk_size=10000):
+    """
+    Extracts place names, dates, and observations as DataFrame chunks.
+
+    Rows are accumulated column by column and emitted as soon as chunk_size
+    rows are reached, even within a paragraph, so processing can start before
+    the whole file has been read. Each chunk's columns are built as typed
+    arrays (COLUMN_DTYPES) rather than object columns.
+
+    Parameters:
+    - file_path: str, path to the TEI XML file.
+    - chunk_size: int, maximum number of rows per chunk.
+
+    Yields:
+    - df: pandas DataFrame with the columns in COLUMNS.
+    """
+    columns = {name: [] for name in COLUMNS}
+    rows = columns['observation']
+    place_name, place_ref, date_text, date_when, date_not_before, date_not_after, observation = (
+        columns[name].append for name in COLUMNS)
+
+    def add_row(place, date, observation_text):
+        place_name(place[0])
+        place_ref(place[1])
+        date_text(date[0])
+        date_when(date[1])
+        date_not_before(date[2])
+        date_not_after(date[3])
+        observation(observation_text)
+
+    no_place = (None, None)
+    no_date = (None, None, None, None)
+    for _, places, dates, observation_text in iter_paragraphs(file_path):
+        # If there are multiple places and dates, create combinations
+        for place in places or [no_place]:
+            for date in dates or [no_date]:
+                add_row(place, date, observation_text)
+                if len(rows) >= chunk_size:
+                    yield _typed_frame(columns)
+                    for values in columns.values():
+                        values.clear()
+    if rows:
+        yield _typed_frame(columns)
+
+def _typed_frame(columns):
+    return pd.DataFrame({name: pd.array(columns.get(name, []), dtype=dtype)
+                         for name, dtype in COLUMN_DTYPES.items()})
+
+def parse_tei_xml(file_path, chunk_size=10000):
     """
     Parses the TEI XML file and extracts place names, dates, and observations.
 
     Parameters:
     - file_path: str, path to the TEI XML file.
+    - chunk_size: int, rows per intermediate chunk (see iter_tei_chunks).
 
     Returns:
     - df: pandas DataFrame containing the extracted data.
     """
-    # Parse the TEI XML file
-    tree = ET.parse('H0016412.xml')
-    root = tree.getroot()
-    
-    # Find the <body> element
-    body = root.find('.//tei:body', NS)
-    
-    # Initialize a list to store data
-    data = []
-    
-    # Recursive function to process <div> elements
-    def process_div(div_element):
-        # Iterate through child elements
-        for child in div_element:
-            # If the element is a <div>, process it recursively
-            if child.tag == '{http://www.tei-c.org/ns/1.0}div':
-                process_div(child)
-            elif child.tag == '{http://www.tei-c.org/ns/1.0}p':
-                process_paragraph(child)
-    
-    # Function to process a <p> element
-    def process_paragraph(paragraph):
-        # Initialize variables
-        place_names = paragraph.findall('.//tei:placeName', NS)
-        dates = paragraph.findall('.//tei:date', NS)
-        observation_text = ''.join(paragraph.itertext()).strip()
-        
-        # Extract place names and refs
-        places = []
-        for pname in place_names:
-            place_text = pname.text.strip() if pname.text else ''
-            ref = pname.get('ref')
-            places.append({'name': place_text, 'ref': ref})
-        
-        # Extract dates
-        dates_list = []
-        for date_elem in dates:
-            date_text = date_elem.text.strip() if date_elem.text else ''
-            when = date_elem.get('when')
-            not_before = date_elem.get('notBefore')
-            not_after = date_elem.get('notAfter')
-            dates_list.append({'text': date_text, 'when': when, 'notBefore': not_before, 'notAfter': not_after})
-        
-        # If there are multiple places and dates, create combinations
-        if places and dates_list:
-            for place in places:
-                for date in dates_list:
-                    data.append({
-                        'place_name': place['name'],
-                        'place_ref': place['ref'],
-                        'date_text': date['text'],
-                        'date_when': date['when'],
-                        'date_notBefore': date['notBefore'],
-                        'date_notAfter': date['notAfter'],
-                        'observation': observation_text
-                    })
-        elif places:
-            for place in places:
-                data.append({
-                    'place_name': place['name'],
-                    'place_ref': place['ref'],
-                    'date_text': None,
-                    'date_when': None,
-                    'date_notBefore': None,
-                    'date_notAfter': None,
-                    'observation': observation_text
-                })
-        elif dates_list:
-            for date in dates_list:
-                data.append({
-                    'place_name': None,
-                    'place_ref': None,
-                    'date_text': date['text'],
-                    'date_when': date['when'],
-                    'date_notBefore': date['notBefore'],
-                    'date_notAfter': date['notAfter'],
-                    'observation': observation_text
-                })
+    chunks = list(iter_tei_chunks(file_path, chunk_size))
+    if not chunks:
+        return _typed_frame({})
+    return pd.concat(chunks, ignore_index=True)
+
+def parse_tei_tables(file_path):
+    """
+    Extracts observations, place mentions and date mentions as separate tables.
+
+    Unlike parse_tei_xml, no places x dates combinations are formed: each
+    observation text is stored once and mentions refer to it by paragraph_id,
+    the paragraph's position in the document.
+
+    Parameters:
+    - file_path: str, path to the TEI XML file.
+
+    Returns:
+    - tables: dict with the DataFrames
+      'observations' (paragraph_id, xml_id, observation),
+      'places' (paragraph_id, position, place_name, place_ref) and
+      'dates' (paragraph_id, position, date_text, date_when, date_notBefore, date_notAfter).
+    """
+    observations = {'paragraph_id': [], 'xml_id': [], 'observation': []}
+    places = {'paragraph_id': [], 'position': [], 'place_name': [], 'place_ref': []}
+    dates = {'paragraph_id': [], 'position': [], 'date_text': [], 'date_when': [],
+             'date_notBefore': [], 'date_notAfter': []}
+
+    for paragraph_id, (xml_id, paragraph_places, paragraph_dates, observation_text) in enumerate(
+            iter_paragraphs(file_path)):
+        observations['paragraph_id'].append(paragraph_id)
+        observations['xml_id'].append(xml_id)
+        observations['observation'].append(observation_text)
+        for position, (name, ref) in enumerate(paragraph_places):
+            places['paragraph_id'].append(paragraph_id)
+            places['position'].append(position)
+            places['place_name'].append(name)
+            places['place_ref'].append(ref)
+        for position, (text, when, not_before, not_after) in enumerate(paragraph_dates):
+            dates['paragraph_id'].append(paragraph_id)
+            dates['position'].append(position)
+            dates['date_text'].append(text)
+            dates['date_when'].append(when)
+            dates['date_notBefore'].append(not_before)
+            dates['date_notAfter'].append(not_after)
+
+    tables = {
+        'observations': pd.DataFrame(observations),
+        'places': pd.DataFrame(places),
+        'dates': pd.DataFrame(dates),
+    }
+    # Fix the dtypes so that empty tables still have a stable on-disk schema
+    for df in tables.values():
+        for column in df.columns:
+            if column == 'paragraph_id':
+                df[column] = df[column].astype('int64')
+            elif column == 'position':
+                df[column] = df[column].astype('int32')
+            else:
+                df[column] = df[column].astype('string')
+    return tables
+
+def join_tables(tables):
+    """
+    Rebuilds the parse_tei_xml layout (one row per place x date) from the tables.
+
+    Parameters:
+    - tables: dict as returned by parse_tei_tables or read_tables.
+
+    Returns:
+    - df: pandas DataFrame with the columns in COLUMNS plus 'paragraph_id'.
+    """
+    df = tables['observations'][['paragraph_id', 'observation']]
+    df = df.merge(tables['places'].drop(columns='position'), on='paragraph_id', how='left')
+    df = df.merge(tables['dates'].drop(columns='position'), on='paragraph_id', how='left')
+    return df[['paragraph_id'] + COLUMNS]
+
+TABLE_FORMATS = {'parquet': '.parquet', 'feather': '.arrow'}
+
+def write_tables(tables, directory, format='parquet'):
+    """
+    Writes the tables to a directory, one columnar file per table.
+
+    Requires pyarrow. 'parquet' is compressed and suited for archiving;
+    'feather' (Arrow IPC) is uncompressed and memory-maps quickly.
+
+    Parameters:
+    - tables: dict as returned by parse_tei_tables.
+    - directory: str, output directory (created if missing).
+    - format: str, 'parquet' or 'feather'.
+
+    Returns:
+    - paths: list of the written file paths.
+    """
+    if format not in TABLE_FORMATS:
+        raise ValueError(f"Unknown table format '{format}', expected one of {sorted(TABLE_FORMATS)}")
+    os.makedirs(directory, exist_ok=True)
+    paths = []
+    for name, df in tables.items():
+        path = os.path.join(directory, name + TABLE_FORMATS[format])
+        if format == 'parquet':
+            df.to_parquet(path, index=False)
         else:
-            data.append({
-                'place_name': None,
-                'place_ref': None,
-                'date_text': None,
-                'date_when': None,
-                'date_notBefore': None,
-                'date_notAfter': None,
-                'observation': observation_text
-            })
-    
-    # Start processing from the body
-    process_div(body)
-    
-    # Convert data to DataFrame
-    df = pd.DataFrame(data)
-    return df
+            df.to_feather(path)
+        paths.append(path)
+    return paths
+
+def read_tables(directory, format='parquet'):
+    """
+    Reads tables written by write_tables.
+
+    Parameters:
+    - directory: str, directory passed to write_tables.
+    - format: str, 'parquet' or 'feather'.
+
+    Returns:
+    - tables: dict of pandas DataFrames.
+    """
+    reader = pd.read_parquet if format == 'parquet' else pd.read_feather
+    return {
+        name: reader(os.path.join(directory, name + TABLE_FORMATS[format]))
+        for name in ('observations', 'places', 'dates')
+    }
+
+_default_geocoder = None
 
-def geocode_place(place_name):
+def default_geocoder(gazetteer_index=None):
+    """
+    Returns the shared geocoder, caching results in .cache/geocoding.sqlite.
+
+    Parameters:
+    - gazetteer_index: str, optional directory of a gazetteer built with
+      gazetteer.py; when given, places are looked up offline instead of via Nominatim.
+    """
+    global _default_geocoder
+    if _default_geocoder is None:
+        cache = PersistentCache('.cache/geocoding.sqlite', namespace='geocoding',
+                                ttl=None, negative_ttl=30 * 86400)
+        if gazetteer_index:
+            backend = GazetteerBackend(Gazetteer(gazetteer_index))
+        else:
+            backend = NominatimBackend()
+        _default_geocoder = Geocoder(backend, cache=cache)
+    return _default_geocoder
+
+def geocode_place(place_name, geocoder=None):
     """
     Geocodes a place name using Nominatim (OpenStreetMap) and returns latitude and longitude.
 
     Parameters:
     - place_name: str, the name of the place to geocode.
+    - geocoder: Geocoder, optional; defaults to the cached Nominatim geocoder.
 
     Returns:
     - lat: float, latitude of the place.
     - lon: float, longitude of the place.
     """
-    base_url = 'https://nominatim.openstreetmap.org/search'
-    params = {
-        'q': place_name,
-        'format': 'json',
-        'limit': 1
-    }
-    headers = {
-        'User-Agent': 'TEIParser/1.0 (your_email@example.com)'
-    }
-    try:
-        response = requests.get(base_url, params=params, headers=headers)
-        if response.status_code == 200:
-            data = response.json()
-            if data:
-                lat = float(data[0]['lat'])
-                lon = float(data[0]['lon'])
-                return lat, lon
-    except Exception as e:
-        print(f"Error geocoding {place_name}: {e}")
-    return None, None
-
-def get_coordinates(df):
+    return (geocoder or default_geocoder()).geocode(place_name)
+
+def get_coordinates(df, geocoder=None):
     """
     Maps place names in the DataFrame to their geographical coordinates.
 
     Parameters:
     - df: pandas DataFrame containing the 'place_name' column.
+    - geocoder: Geocoder, optional; defaults to the cached Nominatim geocoder.
 
     Returns:
     - df: pandas DataFrame with added 'latitude' and 'longitude' columns.
     """
-    # Get unique place names
+    # Geocode unique place names; spelling variants share one lookup
     place_names = df['place_name'].dropna().unique()
-    
-    # Create a dictionary to store coordinates
-    coordinates = {}
-    
-    for place in place_names:
-        lat, lon = geocode_place(place)
-        if lat is not None and lon is not None:
-            coordinates[place] = {'latitude': lat, 'longitude': lon}
-        else:
-            coordinates[place] = {'latitude': None, 'longitude': None}
+    coordinates = (geocoder or default_geocoder()).geocode_many(place_names)
     
     # Map coordinates back to the DataFrame
-    df['latitude'] = df['place_name'].map(lambda x: coordinates.get(x, {}).get('latitude'))
-    df['longitude'] = df['place_name'].map(lambda x: coordinates.get(x, {}).get('longitude'))
+    df['latitude'] = df['place_name'].map(lambda x: coordinates.get(x, (None, None))[0])
+    df['longitude'] = df['place_name'].map(lambda x: coordinates.get(x, (None, None))[1])
     return df
 
-def parse_dates(df):
+# Missing month/day in free-text dates resolve to the start of the period
+FREE_TEXT_DEFAULT = datetime(datetime.today().year, 1, 1)
+
+@lru_cache(maxsize=65536)
+def parse_free_text_date(text):
+    """
+    Parses a free-text date with dateutil; results are memoized.
+
+    Parameters:
+    - text: str, e.g. '16 July 1799'.
+
+    Returns:
+    - date: pandas Timestamp (timezone-naive), or NaT if unparseable.
+    """
+    try:
+        parsed = pd.Timestamp(parse_date(text, default=FREE_TEXT_DEFAULT))
+    except (ValueError, OverflowError):
+        return pd.NaT
+    if parsed.tzinfo is not None:
+        parsed = parsed.tz_convert(None)
+    return parsed
+
+# A complete ISO 8601 date, optionally with a time and UTC offset
+FULL_ISO_DATE = (r'^\d{4}-\d{2}-\d{2}'
+                 r'(?:T\d{2}:\d{2}(?::\d{2}(?:\.\d+)?)?(?:Z|[+-]\d{2}:?\d{2})?)?$')
+# gYear '1799' and gYearMonth '1799-07'. Other partial forms (gMonthDay
+# '--07-16', ...) have no year and are left to the text fallback.
+PARTIAL_ISO_DATE = r'^(?P<year>\d{4})(?:-(?P<month>\d{2}))?$'
+
+def _to_datetime(values):
+    """
+    Converts ISO attribute values column-wise to the periods they denote.
+
+    Full dates are converted to UTC (values without an offset are taken as
+    UTC) and made timezone-naive, so the result has one dtype however the
+    values mix; a full date is a period of zero length. A year or a month
+    is the whole period. Anything else becomes NaT.
+
+    Returns:
+    - (start, end): pandas Series of naive timestamps, end exclusive.
+    """
+    values = pd.Series(values, dtype='string').str.strip()
+    full = values.where(values.str.match(FULL_ISO_DATE, na=False))
+    parsed = pd.to_datetime(full, errors='coerce', format='ISO8601', utc=True).dt.tz_convert(None)
+
+    partial = values.str.extract(PARTIAL_ISO_DATE)
+    has_month = partial['month'].notna()
+    start = pd.to_datetime(partial['year'] + '-' + partial['month'].fillna('01') + '-01',
+                           errors='coerce', format='%Y-%m-%d')
+    end = (start + pd.DateOffset(months=1)).where(has_month, start + pd.DateOffset(years=1))
+    start = parsed.where(parsed.notna(), start.astype(parsed.dtype))
+    end = parsed.where(parsed.notna(), end.astype(parsed.dtype))
+    return start, end.where(start.notna())
+
+def parse_dates(df, report=True):
     """
     Parses date information from the DataFrame.
 
+    Each row takes the first date that resolves, in order: '@when', the
+    midpoint of '@notBefore'/'@notAfter', and the free-text 'date_text'.
+    A year or month in '@when' stands for its midpoint, with half the
+    period as uncertainty; '@notBefore'/'@notAfter' take its start/end.
+    The ISO attributes are converted column-wise, to naive UTC (see
+    _to_datetime); only rows left over are sent, per distinct string,
+    through the memoized dateutil fallback.
+
     Parameters:
     - df: pandas DataFrame containing date columns.
+    - report: bool, if True the counts per strategy are printed.
 
     Returns:
-    - df: pandas DataFrame with an added 'parsed_date' column.
-    """
-    def parse_date_row(row):
-        # Try 'when' attribute
-        if pd.notnull(row['date_when']):
-            try:
-                return parse_date(row['date_when'])
-            except:
-                pass
-        # Try 'notBefore' and 'notAfter' as a range
-        if pd.notnull(row['date_notBefore']) and pd.notnull(row['date_notAfter']):
-            try:
-                date_start = parse_date(row['date_notBefore'])
-                date_end = parse_date(row['date_notAfter'])
-                # For visualization, take the midpoint
-                date_mid = date_start + (date_end - date_start)/2
-                return date_mid
-            except:
-                pass
-        # Try 'date_text'
-        if pd.notnull(row['date_text']):
-            try:
-                return parse_date(row['date_text'])
-            except:
-                pass
-        return None
-    
-    df['parsed_date'] = df.apply(parse_date_row, axis=1)
+    - df: pandas DataFrame with added 'parsed_date', 'date_uncertainty'
+      (half the width of a range, year or month, zero for exact dates, NaT
+      for free text)
+      and 'date_source' ('when', 'range' or 'text') columns. Rows without a
+      valid date are dropped; df.attrs['date_sources'] holds the number of
+      rows resolved by each strategy.
+    """
+    df = df.copy()
+    when_start, when_end = _to_datetime(df['date_when'])
+    not_before, _ = _to_datetime(df['date_notBefore'])
+    _, not_after = _to_datetime(df['date_notAfter'])
+    half_width = (not_after - not_before) / 2
+    when_half_width = (when_end - when_start) / 2
+
+    parsed = pd.Series((when_start + when_half_width).to_numpy(), index=df.index)
+    uncertainty = pd.Series(when_half_width.to_numpy(), index=df.index)
+    source = pd.Series('when', index=df.index, dtype='object').where(parsed.notna())
+
+    # For visualization, take the midpoint of a range
+    use_range = parsed.isna() & half_width.notna()
+    parsed[use_range] = (not_before + half_width)[use_range]
+    uncertainty[use_range] = half_width[use_range]
+    source[use_range] = 'range'
+
+    use_text = parsed.isna() & df['date_text'].notna()
+    if use_text.any():
+        texts = df.loc[use_text, 'date_text']
+        resolved = {text: parse_free_text_date(text) for text in texts.unique()}
+        from_text = pd.to_datetime(texts.map(resolved))
+        parsed[use_text] = from_text
+        source[use_text] = source[use_text].where(from_text.isna(), 'text')
+
+    df['parsed_date'] = parsed
+    df['date_uncertainty'] = uncertainty
+    df['date_source'] = source
     # Drop rows without a valid date
     df = df.dropna(subset=['parsed_date'])
+    counts = df['date_source'].value_counts()
+    df.attrs['date_sources'] = {name: int(counts.get(name, 0)) for name in ('when', 'range', 'text')}
+    df.attrs['date_sources']['unresolved'] = len(parsed) - len(df)
+    if report:
+        print_date_sources(df.attrs['date_sources'])
     return df
 
-def create_interactive_map(df):
+def print_date_sources(date_sources):
+    print("Dates resolved: "
+          + ", ".join(f"{name} {count}" for name, count in date_sources.items()))
+
+# Years per time bin
+PERIODS = {'year': 1, 'decade': 10, 'century': 100}
+# Grid cells per side of a web map tile; a cell spans 360 / (2**zoom * 4) degrees
+CELLS_PER_TILE = 4
+
+def _with_coordinates(df):
+    df = df.dropna(subset=['latitude', 'longitude']).copy()
+    df['latitude'] = pd.to_numeric(df['latitude'], errors='coerce')
+    df['longitude'] = pd.to_numeric(df['longitude'], errors='coerce')
+    return df.dropna(subset=['latitude', 'longitude'])
+
+def aggregate_points(df, zoom_levels=(2, 4, 6), period='year', cumulative=True):
+    """
+    Aggregates observations into grid cells per zoom level and time bin.
+
+    Parameters:
+    - df: pandas DataFrame with 'latitude', 'longitude', 'parsed_date' and
+      'place_name', and optionally 'weight', the number of observations a
+      row stands for (see collect_map_rows); rows without it count once.
+    - zoom_levels: iterable of int, web map zoom levels to aggregate for.
+    - period: str, time bin: 'year', 'decade' or 'century'.
+    - cumulative: bool, if True each bin also counts all earlier observations.
+
+    Returns:
+    - points: pandas DataFrame with one row per zoom level, bin and non-empty
+      cell: 'zoom', 'period', 'period_label', 'cell', 'latitude' and
+      'longitude' (centroid), 'count', 'place_name' (most frequent place in
+      the cell) and 'places' (number of distinct places).
+    """
+    if period not in PERIODS:
+        raise ValueError(f"Unknown period '{period}', expected one of {sorted(PERIODS)}")
+    df = _with_coordinates(df)
+    step = PERIODS[period]
+    bins = (df['parsed_date'].dt.year // step * step).astype('int64')
+    periods = sorted(bins.unique())
+    weights = df['weight'] if 'weight' in df else pd.Series(1, index=df.index)
+
+    frames = []
+    for zoom in zoom_levels:
+        cell_size = 360 / (2 ** zoom * CELLS_PER_TILE)
+        cells = pd.DataFrame({
+            'cell_x': np.floor(df['longitude'] / cell_size).astype('int64'),
+            'cell_y': np.floor(df['latitude'] / cell_size).astype('int64'),
+            'period': bins,
+            'weight': weights,
+            'latitude': df['latitude'] * weights,
+            'longitude': df['longitude'] * weights,
+            'place_name': df['place_name'],
+        })
+        keys = ['cell_x', 'cell_y']
+        sums = cells.groupby(keys + ['period']).agg(
+            count=('weight', 'sum'), latitude=('latitude', 'sum'), longitude=('longitude', 'sum'))
+        if cumulative:
+            # Cells x periods matrices, summed along time
+            wide = {
+                field: sums[field].unstack('period', fill_value=0)
+                                  .reindex(columns=periods, fill_value=0)
+                for field in ('count', 'latitude', 'longitude')
+            }
+            totals = {field: matrix.to_numpy().cumsum(axis=1) for field, matrix in wide.items()}
+            rows, columns = np.nonzero(totals['count'])
+            cell_index = wide['count'].index
+            sums = pd.DataFrame({
+                'cell_x': cell_index.get_level_values('cell_x')[rows],
+                'cell_y': cell_index.get_level_values('cell_y')[rows],
+                'period': np.asarray(periods)[columns],
+                **{field: total[rows, columns] for field, total in totals.items()},
+            })
+        else:
+            sums = sums.reset_index()
+        sums['latitude'] /= sums['count']
+        sums['longitude'] /= sums['count']
+
+        top_places = (cells.groupby(keys + ['place_name'])['weight'].sum().rename('n')
+                      .reset_index()
+                      .sort_values('n', ascending=False, kind='stable')
+                      .drop_duplicates(keys)[keys + ['place_name']])
+        place_counts = cells.groupby(keys)['place_name'].nunique().rename('places').reset_index()
+        sums = sums.merge(top_places, on=keys, how='left').merge(place_counts, on=keys, how='left')
+        sums['zoom'] = zoom
+        sums['cell'] = sums['cell_x'].astype(str) + ':' + sums['cell_y'].astype(str)
+        frames.append(sums)
+
+    columns = ['zoom', 'period', 'period_label', 'cell', 'latitude', 'longitude', 'count',
+               'place_name', 'places']
+    if not frames:
+        return pd.DataFrame(columns=columns)
+    points = pd.concat(frames, ignore_index=True).sort_values(['zoom', 'period', 'cell'],
+                                                              ignore_index=True)
+    points['count'] = points['count'].astype('int64')
+    points['period_label'] = points['period'].astype(str) + ('s' if step > 1 else '')
+    return points[columns]
+
+def export_map(df, output_path, zoom_levels=(2, 4, 6), period='year', cumulative=True,
+               display_zoom=None):
+    """
+    Writes a pre-aggregated map of the observations to disk, without a display.
+
+    A '.json' output_path gets a bundle with the points of every zoom level
+    and time bin, for custom viewers. Any other path gets a self-contained
+    Plotly HTML page (plotly.js inlined) animated over the time bins, with
+    the cells of display_zoom (default: the first zoom level).
+
+    Parameters:
+    - df: pandas DataFrame with coordinates and parsed dates.
+    - output_path: str, file to write.
+    - zoom_levels, period, cumulative: see aggregate_points.
+    - display_zoom: int, zoom level shown in the HTML page.
+
+    Returns:
+    - points: the aggregated pandas DataFrame.
+    """
+    zoom_levels = list(zoom_levels)
+    display_zoom = zoom_levels[0] if display_zoom is None else display_zoom
+    if display_zoom not in zoom_levels:
+        zoom_levels.append(display_zoom)
+    points = aggregate_points(df, zoom_levels, period, cumulative)
+    labels = list(dict.fromkeys(points['period_label']))
+    os.makedirs(os.path.dirname(os.path.abspath(output_path)), exist_ok=True)
+
+    if output_path.endswith('.json'):
+        bundle = {
+            'period': period,
+            'cumulative': cumulative,
+            'periods': labels,
+            'fields': ['latitude', 'longitude', 'count', 'place_name', 'places'],
+            'zoom_levels': {
+                str(zoom): {
+                    label: [
+                        [round(row.latitude, 5), round(row.longitude, 5), row.count,
+                         row.place_name, row.places]
+                        for row in frame.itertuples(index=False)
+                    ]
+                    for label, frame in by_zoom.groupby('period_label', sort=False)
+                }
+                for zoom, by_zoom in points.groupby('zoom')
+            },
+        }
+        with open(output_path, 'w', encoding='utf-8') as f:
+            json.dump(bundle, f, ensure_ascii=False, separators=(',', ':'), default=int)
+    else:
+        # One trace per frame instead of one per place keeps large maps responsive
+        fig = px.scatter_mapbox(
+            points[points['zoom'] == display_zoom],
+            lat='latitude',
+            lon='longitude',
+            size='count',
+            hover_name='place_name',
+            hover_data={'count': True, 'places': True, 'latitude': False, 'longitude': False},
+            size_max=30,
+            zoom=display_zoom,
+            height=600,
+            animation_frame='period_label',
+            animation_group='cell',
+            category_orders={'period_label': labels}
+        )
+        fig.update_layout(
+            mapbox_style='open-street-map',
+            title='Humboldt\'s Observations Over Time',
+            showlegend=False
+        )
+        fig.write_html(output_path, include_plotlyjs=True, full_html=True, auto_play=False)
+    print(f"Wrote {len(points)} aggregated points to {output_path}")
+    return points
+
+def create_interactive_map(df, output_path=None, **export_options):
     """
     Creates an interactive map visualization of the observations.
 
     Parameters:
     - df: pandas DataFrame containing the data to visualize.
+    - output_path: str, optional; if given, the map is aggregated and written
+      to this file with export_map (keyword options are passed on) instead of
+      being opened with fig.show().
     """
+    if output_path is not None:
+        return export_map(df, output_path, **export_options)
+
     # Ensure that latitude and longitude are numeric
-    df = df.dropna(subset=['latitude', 'longitude'])
-    df['latitude'] = pd.to_numeric(df['latitude'], errors='coerce')
-    df['longitude'] = pd.to_numeric(df['longitude'], errors='coerce')
-    df = df.dropna(subset=['latitude', 'longitude'])
+    df = _with_coordinates(df)
     
     # Sort data by date
     df = df.sort_values(by='parsed_date')
@@ -258,21 +637,73 @@ def create_interactive_map(df):
     
     fig.show()
 
-def main():
-    # File path to the TEI XML file
-    file_path = 'path_to_your_file.xml'  # Replace with your file path
-    
-    # Parse the TEI XML
-    df = parse_tei_xml(file_path)
-    
-    # Parse dates
-    df = parse_dates(df)
-    
-    # Get coordinates
-    df = get_coordinates(df)
-    
+# Columns the maps need; 'observation' only for the interactive display
+MAP_COLUMNS = ['place_name', 'latitude', 'longitude', 'parsed_date']
+
+def collect_map_rows(file_path, geocoder=None, keep_observations=False, chunk_size=10000):
+    """
+    Reads, dates and geocodes a TEI file chunk by chunk, keeping only what the map needs.
+
+    Each chunk from iter_tei_chunks is dated and geocoded on its own and cut
+    down to MAP_COLUMNS. Unless keep_observations is set, rows that agree on
+    all of them are merged into one with a 'weight', so memory grows with
+    the number of distinct places and dates, not with the document.
+
+    Parameters:
+    - file_path: str, path to the TEI XML file.
+    - geocoder: Geocoder, optional; defaults to the cached Nominatim geocoder.
+    - keep_observations: bool, keep one row per observation with its text
+      (for create_interactive_map without an output path).
+    - chunk_size: int, rows per chunk.
+
+    Returns:
+    - df: pandas DataFrame with MAP_COLUMNS plus 'weight' or 'observation';
+      df.attrs['date_sources'] holds the date counts of all chunks.
+    """
+    columns = MAP_COLUMNS + (['observation'] if keep_observations else ['weight'])
+    date_sources = {}
+    rows = None
+    for chunk in iter_tei_chunks(file_path, chunk_size):
+        chunk = parse_dates(chunk, report=False)
+        for name, count in chunk.attrs['date_sources'].items():
+            date_sources[name] = date_sources.get(name, 0) + count
+        if chunk.empty:
+            continue
+        chunk = get_coordinates(chunk, geocoder).assign(weight=1)[columns]
+        rows = chunk if rows is None else pd.concat([rows, chunk], ignore_index=True)
+        if not keep_observations:
+            rows = rows.groupby(MAP_COLUMNS, as_index=False, dropna=False,
+                                sort=False)['weight'].sum()
+    if rows is None:
+        rows = pd.DataFrame({column: pd.Series(dtype='datetime64[ns]' if column == 'parsed_date'
+                                               else 'object') for column in columns})
+    rows.attrs['date_sources'] = date_sources
+    print_date_sources(date_sources)
+    return rows
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Map the places and dates of a TEI document")
+    parser.add_argument('file_path', help="TEI XML file")
+    parser.add_argument('-o', '--output', help="Write the map to this .html or .json file "
+                                               "instead of opening it")
+    parser.add_argument('--period', choices=sorted(PERIODS), default='year')
+    parser.add_argument('--zoom-levels', default='2,4,6', help="Comma-separated, e.g. 2,4,6")
+    parser.add_argument('--non-cumulative', action='store_true',
+                        help="Show only each period's observations")
+    parser.add_argument('--gazetteer-index', help="Geocode offline with a gazetteer index")
+    args = parser.parse_args(argv)
+
+    # Parse, date and geocode the TEI XML chunk by chunk
+    df = collect_map_rows(args.file_path, default_geocoder(args.gazetteer_index),
+                          keep_observations=not args.output)
+
     # Create interactive map
-    create_interactive_map(df)
+    if args.output:
+        create_interactive_map(df, args.output, period=args.period,
+                               zoom_levels=[int(z) for z in args.zoom_levels.split(',')],
+                               cumulative=not args.non_cumulative)
+    else:
+        create_interactive_map(df)
 
 if __name__ == '__main__':
     main()
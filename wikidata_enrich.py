@@ -0,0 +1,197 @@
+import time
+from dataclasses import dataclass, field
+from typing import Dict, Iterable, List, Optional
+
+import requests
+
+from persistent_cache import MISSING, PersistentCache
+from wikidata_reconcile import WIKIDATA_API
+
+# Claims kept per entity, by output field
+CLAIM_PROPERTIES = {
+    "occupations": "P106",
+    "birth_date": "P569",
+    "death_date": "P570",
+    "coordinates": "P625",
+}
+# wbgetentities accepts at most 50 IDs per call
+MAX_BATCH_SIZE = 50
+
+@dataclass
+class EntityDetails:
+    qid: str
+    label: str = ""
+    description: str = ""
+    occupations: List[str] = field(default_factory=list)
+    birth_date: Optional[str] = None
+    death_date: Optional[str] = None
+    coordinates: Optional[List[float]] = None
+
+def claim_value(snak: Dict):
+    """Plain value of a main snak: QID, ISO timestamp, [lat, lon] or string"""
+    datavalue = snak.get("datavalue")
+    if not datavalue:
+        return None
+    value = datavalue["value"]
+    kind = datavalue["type"]
+    if kind == "wikibase-entityid":
+        return value["id"]
+    if kind == "time":
+        return value["time"].lstrip("+")
+    if kind == "globecoordinate":
+        return [value["latitude"], value["longitude"]]
+    if kind == "monolingualtext":
+        return value["text"]
+    return value
+
+class WikidataEnricher:
+    """Fetch labels, descriptions and selected claims for many QIDs at once.
+
+    Entities are requested in batches of up to 50 IDs. Item-valued claims
+    (occupations) are resolved to labels in a second batched pass over the
+    distinct referenced items. Both the entity summaries and the labels are
+    cached, so repeated runs only ask for QIDs they have not seen.
+    """
+
+    def __init__(self, language: str = "en", cache: Optional[PersistentCache] = None,
+                 label_cache: Optional[PersistentCache] = None, request_delay: float = 1.0,
+                 batch_size: int = MAX_BATCH_SIZE, endpoint: str = WIKIDATA_API,
+                 properties: Dict[str, str] = None):
+        self.endpoint = endpoint
+        self.language = language
+        self.session = requests.Session()
+        self.cache = cache
+        self.label_cache = label_cache
+        self.request_delay = request_delay
+        self.batch_size = min(batch_size, MAX_BATCH_SIZE)
+        self.properties = properties or CLAIM_PROPERTIES
+        self.requests_made = 0
+        self._last_request = float('-inf')
+
+    def _throttle(self):
+        wait = self.request_delay - (time.monotonic() - self._last_request)
+        if wait > 0:
+            time.sleep(wait)
+        self._last_request = time.monotonic()
+
+    def _get_entities(self, qids: List[str], props: str) -> Dict[str, Dict]:
+        entities = {}
+        for start in range(0, len(qids), self.batch_size):
+            batch = qids[start:start + self.batch_size]
+            params = {
+                "action": "wbgetentities",
+                "format": "json",
+                "ids": "|".join(batch),
+                "props": props,
+                "languages": self.language,
+                "languagefallback": 1,
+            }
+            try:
+                self._throttle()
+                self.requests_made += 1
+                response = self.session.get(self.endpoint, params=params)
+                response.raise_for_status()
+                entities.update(response.json().get("entities", {}))
+            except requests.exceptions.RequestException as e:
+                print(f"Error fetching {len(batch)} entities: {e}")
+        return entities
+
+    def _cached(self, cache: Optional[PersistentCache], qids: Iterable[str], fetch) -> Dict[str, Dict]:
+        found, missing = {}, []
+        for qid in qids:
+            value = cache.get(f"{qid}\0{self.language}") if cache is not None else MISSING
+            if value is MISSING:
+                missing.append(qid)
+            else:
+                found[qid] = value
+        if missing:
+            fetched = fetch(missing)
+            for qid, value in fetched.items():
+                if cache is not None:
+                    cache.set(f"{qid}\0{self.language}", value)
+            found.update(fetched)
+        return found
+
+    def _summarise(self, entity: Dict) -> Dict:
+        claims = entity.get("claims", {})
+        values = {}
+        for name, prop in self.properties.items():
+            values[name] = [
+                value for value in (
+                    claim_value(claim["mainsnak"]) for claim in claims.get(prop, [])
+                    if claim.get("rank") != "deprecated"
+                )
+                if value is not None
+            ]
+        return {
+            "label": entity.get("labels", {}).get(self.language, {}).get("value", ""),
+            "description": entity.get("descriptions", {}).get(self.language, {}).get("value", ""),
+            "claims": values,
+        }
+
+    def _fetch_summaries(self, qids: List[str]) -> Dict[str, Dict]:
+        entities = self._get_entities(qids, "labels|descriptions|claims")
+        return {qid: self._summarise(entity) for qid, entity in entities.items()
+                if "missing" not in entity}
+
+    def _fetch_labels(self, qids: List[str]) -> Dict[str, str]:
+        entities = self._get_entities(qids, "labels")
+        return {qid: entity.get("labels", {}).get(self.language, {}).get("value", qid)
+                for qid, entity in entities.items()}
+
+    def enrich(self, qids: Iterable[str]) -> Dict[str, EntityDetails]:
+        """Details for every distinct QID, with occupation labels resolved"""
+        distinct = list(dict.fromkeys(qids))
+        summaries = self._cached(self.cache, distinct, self._fetch_summaries)
+
+        referenced = list(dict.fromkeys(
+            value for summary in summaries.values()
+            for value in summary["claims"].get("occupations", [])
+        ))
+        labels = self._cached(self.label_cache, referenced, self._fetch_labels)
+
+        details = {}
+        for qid, summary in summaries.items():
+            claims = summary["claims"]
+            details[qid] = EntityDetails(
+                qid=qid,
+                label=summary["label"],
+                description=summary["description"],
+                occupations=[labels.get(item, item) for item in claims.get("occupations", [])],
+                birth_date=next(iter(claims.get("birth_date", [])), None),
+                death_date=next(iter(claims.get("death_date", [])), None),
+                coordinates=next(iter(claims.get("coordinates", [])), None),
+            )
+        return details
+
+def matched_results(results: Dict) -> Iterable[tuple]:
+    """(section name, result) for every matched item in process_sections output"""
+    for section_name, section in results.items():
+        for result in section["main_items"]:
+            if "wikidata_id" in result:
+                yield section_name, result
+        for subsection_name, items in section["subsections"].items():
+            for result in items:
+                if "wikidata_id" in result:
+                    yield subsection_name, result
+
+def enrich_results(results: Dict, enricher: WikidataEnricher) -> List[Dict]:
+    """Flat list of enriched records, one per matched item, in input order"""
+    matched = list(matched_results(results))
+    details = enricher.enrich(result["wikidata_id"] for _, result in matched)
+    records = []
+    for section_name, result in matched:
+        entity = details.get(result["wikidata_id"], EntityDetails(result["wikidata_id"]))
+        records.append({
+            "input_name": result["input"],
+            "section": section_name,
+            "wikidata_id": entity.qid,
+            "wikidata_label": entity.label or result["wikidata_label"],
+            "wikidata_description": entity.description or result["wikidata_description"],
+            "occupations": entity.occupations,
+            "birth_date": entity.birth_date,
+            "death_date": entity.death_date,
+            "coordinates": entity.coordinates,
+            "wikidata_url": result["wikidata_url"],
+        })
+    return records
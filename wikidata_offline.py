@@ -0,0 +1,323 @@
+import argparse
+import bisect
+import bz2
+import gzip
+import heapq
+import json
+import math
+import mmap
+import os
+import re
+import tempfile
+import unicodedata
+from array import array
+from collections import Counter
+from dataclasses import dataclass
+from typing import IO, Dict, Iterator, List, Optional, Set, Tuple
+
+from wikidata_reconcile import WikidataMatch, clean_query
+
+INDEX_VERSION = 1
+GRAM_SIZE = 3
+MAX_NAME_LENGTH = 200
+MAX_CANDIDATES = 2000
+
+def normalize_name(name: str) -> str:
+    """Case- and accent-insensitive form used for both indexing and queries"""
+    decomposed = unicodedata.normalize('NFKD', name)
+    stripped = ''.join(c for c in decomposed if not unicodedata.combining(c))
+    return ' '.join(re.sub(r'[\W_]+', ' ', stripped.casefold()).split())[:MAX_NAME_LENGTH]
+
+def name_grams(normalized: str) -> Set[str]:
+    padded = f' {normalized} '
+    return {padded[i:i + GRAM_SIZE] for i in range(max(1, len(padded) - GRAM_SIZE + 1))}
+
+def open_dump(path: str) -> IO[str]:
+    if path.endswith('.gz'):
+        return gzip.open(path, 'rt', encoding='utf-8')
+    if path.endswith('.bz2'):
+        return bz2.open(path, 'rt', encoding='utf-8')
+    return open(path, 'r', encoding='utf-8')
+
+def iter_dump(path: str) -> Iterator[Dict]:
+    """Entities from a Wikidata JSON dump: one entity per line inside a JSON array"""
+    with open_dump(path) as f:
+        for line in f:
+            line = line.strip().rstrip(',')
+            if line in ('', '[', ']'):
+                continue
+            yield json.loads(line)
+
+@dataclass
+class OfflineCandidate:
+    qid: str
+    label: str
+    description: str
+    types: List[str]
+    score: float
+
+def _write_run(pairs: List[Tuple[str, int]], directory: str) -> str:
+    pairs.sort()
+    fd, path = tempfile.mkstemp(suffix='.run', dir=directory)
+    with os.fdopen(fd, 'w', encoding='utf-8') as f:
+        f.writelines(f'{gram}\t{name_no}\n' for gram, name_no in pairs)
+    pairs.clear()
+    return path
+
+def _read_run(path: str) -> Iterator[Tuple[str, int]]:
+    with open(path, 'r', encoding='utf-8') as f:
+        for line in f:
+            gram, name_no = line.rstrip('\n').rsplit('\t', 1)
+            yield gram, int(name_no)
+
+def build_index(dump_path: str, index_dir: str, languages: Tuple[str, ...] = ('en',),
+                run_size: int = 2_000_000) -> Dict:
+    """Build an offline reconciliation index from a (filtered) Wikidata dump.
+
+    The dump is read one entity at a time. Every label and alias in
+    ``languages`` becomes a name whose character trigrams are written as
+    (gram, name) pairs to sorted run files of ``run_size`` pairs, which are
+    merged into the postings file at the end. Memory use is therefore bounded
+    by the run size plus a few bytes per entity and name, not by the dump.
+    """
+    os.makedirs(index_dir, exist_ok=True)
+    entity_offsets = array('Q')
+    name_entity = array('I')
+    name_gram_counts = array('H')
+    runs: List[str] = []
+    pairs: List[Tuple[str, int]] = []
+
+    with open(os.path.join(index_dir, 'entities.jsonl'), 'wb') as entities:
+        for entity in iter_dump(dump_path):
+            qid = entity.get('id', '')
+            if not qid.startswith('Q'):
+                continue
+            names = []
+            for lang in languages:
+                label = entity.get('labels', {}).get(lang)
+                if label:
+                    names.append(label['value'])
+                names.extend(alias['value'] for alias in entity.get('aliases', {}).get(lang, []))
+            normalized_names = list(dict.fromkeys(filter(None, map(normalize_name, names))))
+            if not normalized_names:
+                continue
+
+            descriptions = entity.get('descriptions', {})
+            record = {
+                'id': qid,
+                'label': names[0],
+                'description': next((descriptions[lang]['value'] for lang in languages
+                                     if lang in descriptions), ''),
+                'types': [claim['mainsnak']['datavalue']['value']['id']
+                          for claim in entity.get('claims', {}).get('P31', [])
+                          if claim['mainsnak'].get('datavalue')],
+            }
+            entity_no = len(entity_offsets)
+            entity_offsets.append(entities.tell())
+            entities.write(json.dumps(record, ensure_ascii=False).encode('utf-8') + b'\n')
+
+            for normalized in normalized_names:
+                name_no = len(name_entity)
+                grams = name_grams(normalized)
+                name_entity.append(entity_no)
+                name_gram_counts.append(len(grams))
+                pairs.extend((gram, name_no) for gram in grams)
+            if len(pairs) >= run_size:
+                runs.append(_write_run(pairs, index_dir))
+    if pairs:
+        runs.append(_write_run(pairs, index_dir))
+
+    # Runs hold increasing name numbers and heapq.merge is stable, so each
+    # gram's postings come out sorted.
+    terms: Dict[str, List[int]] = {}
+    postings = array('I')
+    offset = 0
+    with open(os.path.join(index_dir, 'postings.bin'), 'wb') as out:
+        current = None
+        for gram, name_no in heapq.merge(*(_read_run(path) for path in runs), key=lambda p: p[0]):
+            if gram != current:
+                if current is not None:
+                    terms[current] = [offset, len(postings)]
+                    offset += len(postings)
+                    postings.tofile(out)
+                    postings = array('I')
+                current = gram
+            postings.append(name_no)
+        if current is not None:
+            terms[current] = [offset, len(postings)]
+            postings.tofile(out)
+    for path in runs:
+        os.remove(path)
+
+    for name, data in (('entity_offsets.bin', entity_offsets), ('name_entity.bin', name_entity),
+                       ('name_grams.bin', name_gram_counts)):
+        with open(os.path.join(index_dir, name), 'wb') as f:
+            data.tofile(f)
+    with open(os.path.join(index_dir, 'terms.json'), 'w', encoding='utf-8') as f:
+        json.dump(terms, f, ensure_ascii=False, separators=(',', ':'))
+    meta = {
+        'version': INDEX_VERSION,
+        'languages': list(languages),
+        'entities': len(entity_offsets),
+        'names': len(name_entity),
+        'grams': len(terms),
+    }
+    with open(os.path.join(index_dir, 'meta.json'), 'w', encoding='utf-8') as f:
+        json.dump(meta, f, indent=2)
+    return meta
+
+class OfflineReconciliation:
+    """Drop-in replacement for WikidataReconciliation backed by a local index.
+
+    Candidates are ranked by the Dice coefficient of character trigrams
+    between the cleaned query and each indexed label or alias. Postings and
+    the per-name arrays are memory-mapped, so opening an index is cheap and
+    only the pages a query touches are read. ``type_filters`` optionally maps
+    an entity type (the markdown section name) to the P31 classes it accepts.
+
+    A name reaching ``min_score`` must share one of the query's rarest grams,
+    so only their postings are counted; frequent grams such as `` sa`` are
+    only looked up for those candidates (see search). At most
+    ``max_candidates`` names, those sharing the most rare grams, are scored.
+    """
+
+    def __init__(self, index_dir: str, type_filters: Dict[str, Set[str]] = None,
+                 min_score: float = 0.5, max_candidates: int = MAX_CANDIDATES):
+        with open(os.path.join(index_dir, 'meta.json'), 'r', encoding='utf-8') as f:
+            self.meta = json.load(f)
+        if self.meta['version'] != INDEX_VERSION:
+            raise ValueError(f"Unsupported index version {self.meta['version']} in {index_dir}")
+        with open(os.path.join(index_dir, 'terms.json'), 'r', encoding='utf-8') as f:
+            self.terms = json.load(f)
+        self.type_filters = type_filters or {}
+        self.min_score = min_score
+        self.max_candidates = max_candidates
+        self._files = []
+        self.entities = self._map(os.path.join(index_dir, 'entities.jsonl'))
+        self.entity_offsets = self._map_array(os.path.join(index_dir, 'entity_offsets.bin'), 'Q')
+        self.name_entity = self._map_array(os.path.join(index_dir, 'name_entity.bin'), 'I')
+        self.name_grams = self._map_array(os.path.join(index_dir, 'name_grams.bin'), 'H')
+        self.postings = self._map_array(os.path.join(index_dir, 'postings.bin'), 'I')
+
+    def _map(self, path: str):
+        if os.path.getsize(path) == 0:
+            return b''
+        f = open(path, 'rb')
+        self._files.append(f)
+        return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+    def _map_array(self, path: str, typecode: str) -> memoryview:
+        return memoryview(self._map(path)).cast(typecode)
+
+    def _record(self, entity_no: int) -> Dict:
+        start = self.entity_offsets[entity_no]
+        end = self.entities.find(b'\n', start)
+        return json.loads(self.entities[start:end])
+
+    def search(self, query: str, limit: int = 5, types: Set[str] = None) -> List[OfflineCandidate]:
+        """Ranked candidates for a query, best first
+
+        With ``q`` query grams, a name of ``n`` grams sharing ``h`` scores
+        2h / (q + n), so reaching min_score ``t`` takes h >= t*q / (2 - t)
+        as n >= h. Such a name shares one of the q - h + 1 rarest grams: their
+        postings give the candidates, and the frequent rest are checked by
+        binary search in their sorted postings, for candidates only.
+        """
+        grams = name_grams(normalize_name(clean_query(query)))
+        query_size = len(grams)
+        t = self.min_score
+        needed = max(1, math.ceil(t * query_size / (2 - t) - 1e-9))
+        min_length = needed
+        max_length = math.floor(query_size * (2 - t) / t + 1e-9) if t > 0 else math.inf
+        terms = sorted((self.terms[gram] for gram in grams if gram in self.terms),
+                       key=lambda term: term[1])
+        rare, frequent = terms[:query_size - needed + 1], terms[query_size - needed + 1:]
+
+        shared = Counter()
+        for offset, count in rare:
+            shared.update(self.postings[offset:offset + count])
+        if len(shared) > self.max_candidates:
+            # Keep the names sharing the most rare grams; hits are small
+            # integers, so a histogram gives the cutoff without sorting.
+            kept, cutoff = 0, 0
+            for hits, names in sorted(Counter(shared.values()).items(), reverse=True):
+                if kept and kept + names > self.max_candidates:
+                    break
+                kept, cutoff = kept + names, hits
+            shared = {name_no: hits for name_no, hits in shared.items() if hits >= cutoff}
+
+        best: Dict[int, float] = {}
+        for name_no, hits in shared.items():
+            name_size = self.name_grams[name_no]
+            if not min_length <= name_size <= max_length:
+                continue
+            name_needed = t * (query_size + name_size) / 2
+            for i, (offset, count) in enumerate(frequent):
+                if hits + len(frequent) - i < name_needed:
+                    break
+                end = offset + count
+                position = bisect.bisect_left(self.postings, name_no, offset, end)
+                if position < end and self.postings[position] == name_no:
+                    hits += 1
+            score = 2 * hits / (query_size + name_size)
+            if score >= self.min_score:
+                entity_no = self.name_entity[name_no]
+                if score > best.get(entity_no, 0.0):
+                    best[entity_no] = score
+
+        candidates = []
+        for entity_no, score in sorted(best.items(), key=lambda item: (-item[1], item[0])):
+            record = self._record(entity_no)
+            if types and not types.intersection(record['types']):
+                continue
+            candidates.append(OfflineCandidate(
+                qid=record['id'], label=record['label'], description=record['description'],
+                types=record['types'], score=round(score, 4)))
+            if len(candidates) == limit:
+                break
+        return candidates
+
+    def search_entity(self, query: str, entity_type: str = None) -> Optional[WikidataMatch]:
+        """Same contract as WikidataReconciliation.search_entity"""
+        candidates = self.search(query, limit=1, types=self.type_filters.get(entity_type))
+        if not candidates:
+            return None
+        best = candidates[0]
+        return WikidataMatch(
+            query=query,
+            qid=best.qid,
+            label=best.label,
+            description=best.description,
+            entity_type=entity_type,
+            score=best.score
+        )
+
+    def close(self):
+        for f in self._files:
+            f.close()
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline Wikidata reconciliation index")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    build_parser = subparsers.add_parser("build", help="Build an index from a JSON dump")
+    build_parser.add_argument("dump", help="Wikidata JSON dump (.json, .json.gz or .json.bz2)")
+    build_parser.add_argument("index_dir")
+    build_parser.add_argument("--languages", default="en", help="Comma-separated, e.g. en,de,es")
+    query_parser = subparsers.add_parser("query", help="Look up names in an index")
+    query_parser.add_argument("index_dir")
+    query_parser.add_argument("queries", nargs="+")
+    query_parser.add_argument("--limit", type=int, default=5)
+    args = parser.parse_args()
+
+    if args.command == "build":
+        meta = build_index(args.dump, args.index_dir, tuple(args.languages.split(",")))
+        print(f"Indexed {meta['entities']} entities, {meta['names']} names, {meta['grams']} grams")
+    else:
+        index = OfflineReconciliation(args.index_dir)
+        for query in args.queries:
+            for candidate in index.search(query, limit=args.limit):
+                print(f"{query}\t{candidate.qid}\t{candidate.score}\t{candidate.label}\t"
+                      f"{candidate.description}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,193 @@
+import requests
+import time
+from dataclasses import dataclass
+from typing import List, Dict, Optional
+import re
+from persistent_cache import MISSING, PersistentCache
+
+WIKIDATA_API = "https://www.wikidata.org/w/api.php"
+
+@dataclass
+class Section:
+    name: str
+    items: List[str]
+    subsections: List['Section']
+
+def parse_markdown_file(file_path: str) -> List[Section]:
+    """Parse the markdown file and return a structured representation"""
+    with open(file_path, 'r', encoding='utf-8') as f:
+        content = f.read()
+    
+    lines = content.split('\n')
+    sections = []
+    current_section = None
+    current_subsection = None
+    
+    for line in lines:
+        if line.strip() == '':
+            continue
+            
+        # Main section (##)
+        if line.startswith('## '):
+            if current_section:
+                sections.append(current_section)
+            current_section = Section(
+                name=line.strip('# ').strip(),
+                items=[],
+                subsections=[]
+            )
+            current_subsection = None
+            
+        # Subsection (###)
+        elif line.startswith('### '):
+            if current_section:
+                if current_subsection:
+                    current_section.subsections.append(current_subsection)
+                current_subsection = Section(
+                    name=line.strip('# ').strip(),
+                    items=[],
+                    subsections=[]
+                )
+                
+        # List item
+        elif line.strip().startswith('* '):
+            item = line.strip('* ').strip()
+            if current_subsection:
+                current_subsection.items.append(item)
+            elif current_section:
+                current_section.items.append(item)
+    
+    # Add last section
+    if current_section:
+        if current_subsection:
+            current_section.subsections.append(current_subsection)
+        sections.append(current_section)
+    
+    return sections
+
+def clean_query(query: str) -> str:
+    """Remove parenthetical descriptions such as "(Explorer)" from an item"""
+    return re.sub(r'\s*\([^)]*\)', '', query).strip()
+
+@dataclass
+class WikidataMatch:
+    query: str
+    qid: str
+    label: str
+    description: str
+    entity_type: str
+    score: float
+
+def make_match(query: str, hit: Optional[Dict], entity_type: str = None) -> Optional[WikidataMatch]:
+    """Build a WikidataMatch from a wbsearchentities hit"""
+    if hit is None:
+        return None
+    return WikidataMatch(
+        query=query,
+        qid=hit["id"],
+        label=hit.get("label", ""),
+        description=hit.get("description", ""),
+        entity_type=entity_type,
+        score=hit.get("score", 0.0)
+    )
+
+class WikidataReconciliation:
+    def __init__(self, language: str = "en", cache: Optional[PersistentCache] = None,
+                 request_delay: float = 1.0, limit: int = 5, endpoint: str = WIKIDATA_API):
+        self.endpoint = endpoint
+        self.language = language
+        self.session = requests.Session()
+        self.cache = cache
+        self.request_delay = request_delay  # Be nice to the Wikidata API
+        self.limit = limit
+        self._last_request = float('-inf')
+
+    def _throttle(self):
+        wait = self.request_delay - (time.monotonic() - self._last_request)
+        if wait > 0:
+            time.sleep(wait)
+        self._last_request = time.monotonic()
+        
+    def cache_key(self, search: str) -> str:
+        return f"{search}\0{self.language}\0{self.limit}"
+
+    def search_entity(self, query: str, entity_type: str = None) -> Optional[WikidataMatch]:
+        """Search for an entity in Wikidata"""
+        search = clean_query(query)
+        cache_key = self.cache_key(search)
+        
+        best_match = self.cache.get(cache_key) if self.cache is not None else MISSING
+        if best_match is MISSING:
+            params = {
+                "action": "wbsearchentities",
+                "format": "json",
+                "language": self.language,
+                "search": search,
+                "limit": self.limit
+            }
+            
+            try:
+                self._throttle()
+                response = self.session.get(self.endpoint, params=params)
+                response.raise_for_status()
+                data = response.json()
+            except requests.exceptions.RequestException as e:
+                print(f"Error searching for '{query}': {e}")
+                return None
+            
+            # Get the best match; misses are cached too
+            best_match = data["search"][0] if data.get("search") else None
+            if self.cache is not None:
+                self.cache.set(cache_key, best_match)
+        
+        return make_match(query, best_match, entity_type)
+
+def match_to_result(item: str, match: Optional[WikidataMatch]) -> Dict:
+    """JSON record for one reconciled item"""
+    if match:
+        return {
+            "input": item,
+            "wikidata_id": match.qid,
+            "wikidata_label": match.label,
+            "wikidata_description": match.description,
+            "confidence_score": match.score,
+            "wikidata_url": f"https://www.wikidata.org/wiki/{match.qid}"
+        }
+    return {
+        "input": item,
+        "matched": False
+    }
+
+def process_sections(sections: List[Section], reconciler: WikidataReconciliation) -> Dict:
+    """Process all sections and reconcile entities with Wikidata"""
+    results = {}
+    
+    for section in sections:
+        print(f"\nProcessing section: {section.name}")
+        section_results = []
+        
+        # Process main section items
+        for item in section.items:
+            print(f"Processing: {item}")
+            match = reconciler.search_entity(item, section.name)
+            section_results.append(match_to_result(item, match))
+        
+        # Process subsections
+        subsection_results = {}
+        for subsection in section.subsections:
+            print(f"Processing subsection: {subsection.name}")
+            subsection_items = []
+            
+            for item in subsection.items:
+                print(f"Processing: {item}")
+                match = reconciler.search_entity(item, subsection.name)
+                subsection_items.append(match_to_result(item, match))
+            
+            subsection_results[subsection.name] = subsection_items
+        
+        results[section.name] = {
+            "main_items": section_results,
+            "subsections": subsection_results
+        }
+    
+    return results